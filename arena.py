@@ -0,0 +1,363 @@
+import argparse
+import hashlib
+import math
+import random
+import sys
+import time
+from collections import deque
+
+from engine import BASE_INTERVAL, CELL_SIZE, DIRECTIONS, FOOD_POINTS, random_food_type
+from grid import OccupancyGrid
+from profiler import AI, COLLISION, EAT, SNAKE
+from stats import percentile
+
+# Arena mode: many snakes on one shared board, for stress and load tests.
+# Every snake is driven by a simple AI or by a script of recorded turns, and
+# they share the food and the walls. A tick moves every snake at once and then
+# resolves all collisions in one pass over the heads:
+#
+#   1. every snake picks its direction (script or AI)
+#   2. every tail leaves its cell, then every head enters its next cell, all
+#      counted in the shared OccupancyGrid
+#   3. a head dies when its cell is a wall, off the board, or holds any other
+#      cube: that covers head-to-body and head-to-head (both heads die) alike,
+#      and since the whole board has moved first, the result does not depend on
+#      the order of the snakes
+#   4. the dead are taken off the board, the living eat, eaten food respawns
+#      and dead snakes respawn RESPAWN_TICKS later, so the load stays constant
+#
+# Bodies are deques of cell indices, so a move is two deque operations and two
+# counter updates whatever the length. The board grows with the number of
+# snakes (CELLS_PER_SNAKE). Spawns and the AI draw from separate random
+# streams, so a game replayed from the recorded turns of all snakes (with no
+# AI at all) comes out identical.
+#
+#   python arena.py --snakes 50 100 250 500 1000    tick time against snake count
+
+CELLS_PER_SNAKE = 48  # Board area per snake
+MIN_COLS, MIN_ROWS = 52, 26  # Never smaller than the standard board
+FOOD_PER_SNAKE = 0.5
+WALLS_PER_SNAKE = 0.1  # Wall segments of 3-8 cells
+START_LENGTH = 3
+RESPAWN_TICKS = 20
+TURN_CHANCE = 0.05  # Chance per tick that an AI snake picks a new food to go for
+OPPOSITE = tuple(DIRECTIONS.index((-dx, -dy)) for dx, dy in DIRECTIONS)
+
+
+# x, y, width, height of a board of cols x rows cells centered on the origin, in px
+def board_rect(cols, rows):
+    return -(cols // 2) * CELL_SIZE, -(rows // 2) * CELL_SIZE, cols * CELL_SIZE, rows * CELL_SIZE
+
+
+class ArenaSnake:
+    def __init__(self, number):
+        self.number = number
+        self.body = deque()  # Cell indices, head first
+        self.direction = 0  # Index into DIRECTIONS
+        self.growing = 0  # Moves left that keep the tail
+        self.alive = False
+        self.respawn_tick = 0
+        self.score = 0
+        self.deaths = 0
+        self.target = -1  # Food cell the AI heads for
+        self.script = None  # Deque of the (tick, direction) turns still to come instead of the AI, in tick order
+        self.inputs = []  # (tick, direction) of every turn taken, for replays
+
+
+class ArenaState:
+    def __init__(self, seed=None, snakes=500, scripts=None):
+        self.count = snakes
+        self.scripts = scripts  # Snake number -> recorded turns, to replay a game instead of running the AI
+        self.seed_source = random.Random(seed)
+        self.profiler = None  # Set to a profiler.Profiler to time the phases of every step
+        self.profiled = (AI, SNAKE, COLLISION, EAT)  # Phases step() laps
+        cells = max(MIN_COLS * MIN_ROWS, snakes * CELLS_PER_SNAKE)
+        cols = max(MIN_COLS, round(math.sqrt(cells * 2)))
+        rows = max(MIN_ROWS, math.ceil(cells / cols))
+        self.rect = board_rect(cols, rows)
+        self.reset(seed)
+
+    def reset(self, seed=None):
+        if seed is None:
+            seed = self.seed_source.getrandbits(63)
+        self.seed = seed
+        self.spawn_rng = random.Random(f"{seed}/spawn")
+        self.ai_rng = random.Random(f"{seed}/ai")
+        self.grid = OccupancyGrid(self.rect, CELL_SIZE)
+        grid = self.grid
+        self.cols = grid.cols
+        self.rows = grid.rows
+        self.steps = [-grid.cols if dy < 0 else grid.cols if dy > 0 else dx for dx, dy in DIRECTIONS]
+        self.owner = [-1] * (grid.cols * grid.rows)  # Number of the snake whose cube is on each cell, for drawing
+        self.tick_count = 0
+        self.interval = BASE_INTERVAL
+        self.over = False
+        self.events = []  # What changed in the last step, in the order it happened, for network clients
+        self.changed = None  # Set to a list by a renderer to collect the cells whose contents change; it clears it
+        self.deaths = 0
+        self.head_on = 0  # Deaths in head-to-head collisions
+
+        # Static wall segments, then food, on cells picked from the free-cell index
+        self.walls = []
+        for _ in range(max(1, round(self.count * WALLS_PER_SNAKE))):
+            self.create_wall()
+        self.food = {}  # Cell -> food type
+        for _ in range(max(1, round(self.count * FOOD_PER_SNAKE))):
+            self.create_food()
+
+        self.snakes = [ArenaSnake(number) for number in range(self.count)]
+        for snake in self.snakes:
+            if self.scripts is not None:
+                snake.script = deque(self.scripts.get(snake.number, ()))
+            self.spawn(snake)
+
+    @property
+    def score(self):
+        return sum(snake.score for snake in self.snakes)
+
+    @property
+    def alive(self):
+        return sum(snake.alive for snake in self.snakes)
+
+    def create_wall(self):
+        position = self.grid.random_free_cell(self.spawn_rng)
+        if position is None:
+            return
+        x, y = position
+        length = self.spawn_rng.randint(3, 8) * CELL_SIZE
+        width, height = (length, CELL_SIZE) if self.spawn_rng.random() < 0.5 else (CELL_SIZE, length)
+        left, top, board_width, board_height = self.rect
+        width = min(width, left + board_width - x)
+        height = min(height, top + board_height - y)
+        self.grid.add_rect(x, y, width, height)
+        self.walls.append((x, y, width, height))
+
+    def create_food(self):
+        position = self.grid.random_free_cell(self.spawn_rng)
+        if position is None:
+            return
+        index = self.grid.index_of(*position)
+        self.food[index] = random_food_type(self.spawn_rng)
+        self.grid.take_cell(index)  # Keeps food from spawning on food; snakes still move onto it
+        if self.changed is not None:
+            self.changed.append(index)
+        self.events.append(("food", index, self.food[index]))
+
+    # Put a snake back on the board: START_LENGTH cells in a straight line on free cells, heading away from them
+    def spawn(self, snake):
+        grid = self.grid
+        for _ in range(20):
+            position = grid.random_free_cell(self.spawn_rng)
+            if position is None:
+                break
+            direction = self.spawn_rng.randrange(len(DIRECTIONS))
+            head = grid.index_of(*position)
+            cells = [self.offset(head, direction, -i) for i in range(START_LENGTH)]
+            ahead = self.offset(head, direction, 1)
+            if all(cell >= 0 and grid.free_slot[cell] >= 0 for cell in cells) and ahead >= 0 and grid.free_slot[ahead] >= 0:
+                snake.body = deque(cells)
+                snake.direction = direction
+                snake.growing = 0
+                snake.alive = True
+                snake.target = -1
+                for cell in cells:
+                    self.add_cube(cell, snake.number)
+                self.events.append(("spawn", snake.number, direction, tuple(cells)))
+                return
+        snake.respawn_tick = self.tick_count + RESPAWN_TICKS  # Board too crowded, try again later
+
+    # Cell `count` steps from `index` in a direction, -1 off the board
+    def offset(self, index, direction, count):
+        dx, dy = DIRECTIONS[direction]
+        row, col = divmod(index, self.cols)
+        col += dx * count
+        row += dy * count
+        if 0 <= col < self.cols and 0 <= row < self.rows:
+            return row * self.cols + col
+        return -1
+
+    def add_cube(self, index, number):
+        grid = self.grid
+        grid.snake[index] += 1
+        if grid.snake[index] == 1:
+            grid.take_cell(index)
+            # Only an empty cell changes hands: a head entering a taken cell dies this tick, and what
+            # stays once the dead are removed is the cube that was there first
+            self.owner[index] = number
+        if self.changed is not None:
+            self.changed.append(index)
+
+    def remove_cube(self, index):
+        grid = self.grid
+        grid.snake[index] -= 1
+        if not grid.snake[index]:
+            self.owner[index] = -1
+            if not grid.blocked[index] and index not in self.food:
+                grid.release_cell(index)
+        if self.changed is not None:
+            self.changed.append(index)
+
+    # Head cell after one move in `direction`, -1 off the board
+    def next_cell(self, head, direction):
+        col = head % self.cols
+        if (direction == 2 and col == 0) or (direction == 3 and col == self.cols - 1):
+            return -1
+        cell = head + self.steps[direction]
+        return cell if 0 <= cell < len(self.owner) else -1
+
+    def cell_safe(self, cell):
+        return cell >= 0 and not self.grid.blocked[cell] and not self.grid.snake[cell]
+
+    # Head for a food cell picked at random now and then, along any direction that is not fatal right away.
+    # Cells another snake already moves into this tick are avoided while there is any other way.
+    def ai_direction(self, snake, claimed):
+        head = snake.body[0]
+        if snake.target not in self.food or self.ai_rng.random() < TURN_CHANCE:
+            snake.target = self.ai_rng.choice(list(self.food)) if self.food else -1
+        reverse = OPPOSITE[snake.direction]
+        safe = [direction for direction in range(len(DIRECTIONS))
+                if direction != reverse and self.cell_safe(self.next_cell(head, direction))]
+        if not safe:
+            return snake.direction
+        unclaimed = [direction for direction in safe if self.next_cell(head, direction) not in claimed]
+        safe = unclaimed or safe
+        if snake.target < 0:
+            return snake.direction if snake.direction in safe else safe[0]
+        row, col = divmod(head, self.cols)
+        target_row, target_col = divmod(snake.target, self.cols)
+        return min(safe, key=lambda d: abs(row + DIRECTIONS[d][1] - target_row) + abs(col + DIRECTIONS[d][0] - target_col))
+
+    def scripted_direction(self, snake):
+        # Turns are dropped once taken, so a script fed for a whole session stays short
+        script = snake.script
+        while script and script[0][0] <= self.tick_count:
+            snake.direction = script.popleft()[1]
+        return snake.direction
+
+    def step(self):
+        self.events = []
+        self.tick_count += 1
+        profiler = self.profiler
+        living = [snake for snake in self.snakes if snake.alive]
+
+        # 1. Directions
+        claimed = set()  # Cells the snakes handled so far move into
+        for snake in living:
+            direction = self.scripted_direction(snake) if snake.script is not None else self.ai_direction(snake, claimed)
+            if direction != snake.direction or not snake.inputs:
+                snake.inputs.append((self.tick_count, direction))
+            snake.direction = direction
+            claimed.add(self.next_cell(snake.body[0], direction))
+        if profiler is not None:
+            profiler.lap(AI)
+
+        # 2. Move the whole board: all tails out first, then all heads in
+        events = self.events
+        grew = []
+        for snake in living:
+            grew.append(snake.growing > 0)
+            if snake.growing:
+                snake.growing -= 1
+            else:
+                self.remove_cube(snake.body.pop())
+        heads = []
+        arrivals = {}  # Cell -> heads that entered it, to tell head-on collisions apart
+        for snake, kept_tail in zip(living, grew):
+            cell = self.next_cell(snake.body[0], snake.direction)
+            if cell >= 0:
+                snake.body.appendleft(cell)
+                self.add_cube(cell, snake.number)
+                arrivals[cell] = arrivals.get(cell, 0) + 1
+                events.append(("move", snake.number, snake.direction, kept_tail))
+            heads.append(cell)
+        if profiler is not None:
+            profiler.lap(SNAKE)
+
+        # 3. One pass over the heads decides every death before any of them is applied
+        snake_counts = self.grid.snake
+        blocked = self.grid.blocked
+        dead = []
+        for snake, cell in zip(living, heads):
+            if cell < 0 or blocked[cell] or snake_counts[cell] > 1:
+                dead.append(snake)
+                if cell >= 0 and arrivals[cell] > 1:
+                    self.head_on += 1
+        for snake in dead:
+            events.append(("die", snake.number))
+            snake.alive = False
+            snake.deaths += 1
+            snake.respawn_tick = self.tick_count + RESPAWN_TICKS
+            for cell in snake.body:
+                self.remove_cube(cell)
+            snake.body.clear()
+        self.deaths += len(dead)
+        if profiler is not None:
+            profiler.lap(COLLISION)
+
+        # 4. Eat, then refill the food and the board
+        eaten = 0
+        for snake in living:
+            if snake.alive:
+                food = self.food.pop(snake.body[0], None)
+                if food is not None:
+                    snake.score += FOOD_POINTS[food]
+                    snake.growing += 1
+                    eaten += 1
+                    events.append(("eat", snake.number, snake.body[0]))
+        for _ in range(eaten):
+            self.create_food()
+        for snake in self.snakes:
+            if not snake.alive and snake.respawn_tick <= self.tick_count:
+                self.spawn(snake)
+        if profiler is not None:
+            profiler.lap(EAT)
+        return self.events
+
+    # Recorded turns of every snake, to replay this game with ArenaState(seed, snakes, scripts)
+    def recorded_inputs(self):
+        return {snake.number: list(snake.inputs) for snake in self.snakes}
+
+    def state_hash(self):
+        h = hashlib.blake2b(digest_size=8)
+        for snake in self.snakes:
+            h.update(repr((snake.alive, snake.score, snake.deaths, list(snake.body))).encode())
+        h.update(repr(sorted(self.food.items())).encode())
+        return h.hexdigest()
+
+
+def measure(snakes, ticks, seed):
+    state = ArenaState(seed, snakes)
+    times = []
+    for _ in range(ticks):
+        start = time.perf_counter()
+        state.step()
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return state, percentile(times, 50), percentile(times, 99), times[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Arena mode: tick time against the number of snakes on one board")
+    parser.add_argument("--snakes", type=int, nargs="+", default=[50, 100, 250, 500, 1000])
+    parser.add_argument("--ticks", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--budget", type=float, default=70, help="tick budget in ms, 70 is the fastest game speed")
+    parser.add_argument("--verify", action="store_true", help="also replay each run from its recorded turns and compare")
+    args = parser.parse_args()
+
+    print(f"{'snakes':>7}{'board':>10}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}{'us/snake':>10}{'budget %':>10}"
+          f"{'alive':>7}{'deaths':>8}{'head-on':>9}")
+    for count in args.snakes:
+        state, p50, p99, worst = measure(count, args.ticks, args.seed)
+        print(f"{count:>7}{f'{state.cols}x{state.rows}':>10}{p50:>9.2f}{p99:>9.2f}{worst:>9.2f}"
+              f"{p50 * 1000 / count:>10.1f}{100 * p99 / args.budget:>10.1f}{state.alive:>7}{state.deaths:>8}{state.head_on:>9}")
+        if args.verify:
+            replay = ArenaState(args.seed, count, state.recorded_inputs())
+            for _ in range(args.ticks):
+                replay.step()
+            print(f"{'':>7}replay {'OK' if replay.state_hash() == state.state_hash() else 'MISMATCH'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+from PySide6.QtCore import QRectF
+from PySide6.QtGui import QColor, QImage
+from PySide6.QtWidgets import QGraphicsItem
+
+# Rendering side of the arena. The whole board (walls, food and every snake)
+# is one ArenaItem, so the scene holds a single item whatever the number of
+# snakes. A board of hundreds of snakes is scaled down to a few device pixels
+# per cell, too small for outlined cubes, so the item keeps the board as an
+# image of one pixel per cell. After each tick only the pixels of the cells
+# the state reported in `state.changed` are rewritten, and paint() draws the
+# image scaled up to the board in one call.
+
+SNAKE_COLORS = 24  # Snakes are told apart by color, repeating every SNAKE_COLORS snakes
+
+
+class ArenaItem(QGraphicsItem):
+    def __init__(self, state, palette, player=-1):
+        super().__init__()
+        self.player = player  # Snake drawn in the "player" color, the one a network client plays
+        self.colors = {role: QColor(color).rgb() for role, color in palette.items()}  # role -> pixel value
+        self.snake_colors = [QColor.fromHsv(i * 360 // SNAKE_COLORS, 200, 230).rgb() for i in range(SNAKE_COLORS)]
+        self.set_state(state)
+
+    # Draw another (or a reset) state, whole
+    def set_state(self, state):
+        self.state = state
+        state.changed = []
+        left, top, width, height = state.rect
+        self.prepareGeometryChange()
+        self.bounds = QRectF(left, top, width, height)
+        self.image = QImage(state.cols, state.rows, QImage.Format_RGB32)
+        for index in range(state.cols * state.rows):
+            self.draw_cell(index)
+        self.update()
+
+    def boundingRect(self):
+        return self.bounds
+
+    def draw_cell(self, index):
+        state = self.state
+        grid = state.grid
+        if grid.snake[index]:
+            owner = state.owner[index]
+            color = self.colors["player"] if owner == self.player else self.snake_colors[owner % SNAKE_COLORS]
+        elif grid.blocked[index]:
+            color = self.colors["wall"]
+        elif index in state.food:
+            color = self.colors[state.food[index]]
+        else:
+            color = self.colors["background"]
+        row, col = divmod(index, state.cols)
+        self.image.setPixel(col, row, color)
+
+    # Redraw the cells that changed since the last sync
+    def sync(self):
+        changed = self.state.changed
+        if not changed:
+            return
+        for index in set(changed):
+            self.draw_cell(index)
+        changed.clear()
+        self.update()
+
+    def paint(self, painter, option, widget=None):
+        painter.drawImage(self.bounds, self.image)
@@ -0,0 +1,274 @@
+import argparse
+import heapq
+import random
+import sys
+import time
+from collections import deque
+
+from engine import CELL_SIZE, DIRECTIONS, MIN_INTERVAL, GameState
+from stats import percentile
+
+# Pathfinding autopilot, for demos and unattended soak tests. Plans on the
+# engine's OccupancyGrid with A* from the head to the food's cell. The search
+# is time-aware: a body cube blocks its cell only until the tail has moved past
+# it, so paths may run through cells the body is leaving. A path to the food is
+# only taken if the snake could still reach its tail once there. Otherwise the
+# autopilot follows its tail, and with no path to the tail either it heads into
+# the largest open area.
+#
+# The path is kept between ticks and only checked each tick: it is dropped when
+# the snake left it (a turn was refused, a shield was lost), when the food
+# is eaten or respawns, or when an obstacle moves onto it. Food that moves one
+# cell (level 3+) is followed by trimming or extending the path instead of a
+# new search.
+#
+#   python autopilot.py --games 200    soak test, with planning cost per tick
+
+
+class Autopilot:
+    def __init__(self):
+        self.state = None
+        self.game = None  # (seed, tick) the path was made for, to notice a new game
+        self.path = []  # Cell indices still to visit, next one last
+        self.target = -1  # Cell of the food the path leads to, -1 when following the tail
+        self.length = 0  # Length of the snake the path was made for
+        self.links = []  # Neighbors of every cell of the board, built once per board size
+        self.plans = 0  # Searches run, one per replan
+        self.ticks = 0  # Ticks steered
+        self.last_cost = 0  # Time spent in the last call, in s
+        self.max_cost = 0
+
+    def __call__(self, state, rng):
+        start = time.perf_counter()
+        direction = self.steer(state, rng)
+        self.last_cost = time.perf_counter() - start
+        self.max_cost = max(self.max_cost, self.last_cost)
+        self.ticks += 1
+        return direction
+
+    def steer(self, state, rng):
+        grid = state.grid
+        if len(self.links) != grid.cols * grid.rows:
+            self.links = [tuple(self.neighbors(grid, index)) for index in range(grid.cols * grid.rows)]
+        if state is not self.state or self.game != (state.seed, state.tick_count):
+            self.state = state
+            self.path = []
+        self.game = (state.seed, state.tick_count + 1)
+        head = grid.index_of(*state.head)
+        if head < 0:
+            self.path = []  # Off the board while invincible: just find a way back in
+        food = self.food_cell(state)
+
+        if self.path and not self.still_valid(state, head, food):
+            self.path = []
+        if not self.path:
+            self.plan(state, head, food)
+        if not self.path:
+            return self.open_area_direction(state, rng)
+        return self.direction_to(state, self.path.pop())
+
+    def food_cell(self, state):
+        if state.food is None:
+            return -1
+        grid = state.grid
+        # Moving food is not aligned to the grid: aim for the cell under its center
+        return grid.index_of(state.food.x + CELL_SIZE // 2, state.food.y + CELL_SIZE // 2)
+
+    # Whether the kept path can still be followed from where the head is now
+    def still_valid(self, state, head, food):
+        grid = state.grid
+        path = self.path
+        if head < 0 or len(state.body) != self.length or not self.adjacent(grid, head, path[-1]):
+            return False
+        if self.target >= 0 and food != self.target:
+            if food < 0 or not self.retarget(grid, food):
+                return False
+        elif self.target < 0 and food >= 0 and len(path) % 8 == 0:
+            return False  # Following the tail: look for a way to the food again now and then
+        blocked = grid.blocked
+        for index in path:
+            if blocked[index]:
+                return False
+        return True
+
+    # Follow food that moved one cell: cut the path short if it crossed it, or go one cell further
+    def retarget(self, grid, food):
+        path = self.path
+        if food in path:
+            del path[:path.index(food)]
+            self.target = food
+            return True
+        if self.adjacent(grid, path[0], food) and not grid.snake[food]:
+            path.insert(0, food)
+            self.target = food
+            return True
+        return False
+
+    def adjacent(self, grid, a, b):
+        ar, ac = divmod(a, grid.cols)
+        br, bc = divmod(b, grid.cols)
+        return abs(ar - br) + abs(ac - bc) == 1
+
+    def neighbors(self, grid, index):
+        row, col = divmod(index, grid.cols)
+        if col > 0:
+            yield index - 1
+        if col < grid.cols - 1:
+            yield index + 1
+        if row > 0:
+            yield index - grid.cols
+        if row < grid.rows - 1:
+            yield index + grid.cols
+
+    # Move at which each cell of the body is free to enter: the tail cube leaves on the next move
+    def free_after(self, grid, body):
+        free = {}
+        length = len(body)
+        for i, (x, y) in enumerate(body):
+            index = grid.index_of(x, y)
+            if index >= 0:
+                free[index] = max(free.get(index, 0), length - i)
+        return free
+
+    # A* from start to goal over the cells that are free by the time the snake gets there, never
+    # stepping from start onto `forbidden` (the neck). Returns the path with the first step last, or None.
+    def search(self, grid, start, goal, free, forbidden=-1):
+        cols = grid.cols
+        blocked = grid.blocked
+        links = self.links
+        goal_row, goal_col = divmod(goal, cols)
+        came_from = [-1] * len(links)
+        came_from[start] = start
+        heap = [(0, 0, start)]
+        pop = heapq.heappop
+        push = heapq.heappush
+        while heap:
+            _, moves, index = pop(heap)
+            if index == goal:
+                path = []
+                while index != start:
+                    path.append(index)
+                    index = came_from[index]
+                return path
+            moves += 1
+            for neighbor in links[index]:
+                if came_from[neighbor] >= 0 or blocked[neighbor] or free.get(neighbor, 0) > moves:
+                    continue
+                if index == start and neighbor == forbidden:
+                    continue
+                came_from[neighbor] = index
+                row, col = divmod(neighbor, cols)
+                push(heap, (moves + abs(row - goal_row) + abs(col - goal_col), moves, neighbor))
+        return None
+
+    # Body of the snake after following `path` (next step last) and eating at its end
+    def body_after(self, grid, body, path):
+        cells = [grid.position_of(index) for index in path]
+        return (cells + list(body))[:len(body) + 1]
+
+    def plan(self, state, head, food):
+        self.plans += 1
+        self.path = []
+        self.target = -1
+        if head < 0:
+            return
+        grid = state.grid
+        body = state.body
+        self.length = len(body)
+        free = self.free_after(grid, body)
+        neck = grid.index_of(*body[1]) if len(body) > 1 else -1
+
+        if food >= 0:
+            path = self.search(grid, head, food, free, neck)
+            if path and self.tail_reachable(grid, self.body_after(grid, body, path)):
+                self.path = path
+                self.target = food
+                return
+
+        # Survival: chase the tail, which keeps freeing the cells in front of the head
+        tail = grid.index_of(*body[-1])
+        if tail >= 0 and tail != head:
+            path = self.search(grid, head, tail, free, neck)
+            if path:
+                self.path = path
+
+    def tail_reachable(self, grid, body):
+        head = grid.index_of(*body[0])
+        tail = grid.index_of(*body[-1])
+        if head < 0 or tail < 0:
+            return False
+        neck = grid.index_of(*body[1]) if len(body) > 1 else -1
+        return self.search(grid, head, tail, self.free_after(grid, body), neck) is not None
+
+    def direction_to(self, state, index):
+        x, y = state.grid.position_of(index)
+        hx, hy = state.head
+        return (x - hx) // CELL_SIZE, (y - hy) // CELL_SIZE
+
+    # Last resort: the safe move with the most room behind it
+    def open_area_direction(self, state, rng):
+        hx, hy = state.head
+        best = None
+        best_room = -1
+        for d in DIRECTIONS:
+            if d == (-state.direction[0], -state.direction[1]):
+                continue
+            x, y = hx + d[0] * CELL_SIZE, hy + d[1] * CELL_SIZE
+            if state.cell_blocked(x, y):
+                continue
+            room = self.room(state, state.grid.index_of(x, y), 2 * len(state.body))
+            if room > best_room or (room == best_room and rng.random() < 0.5):
+                best, best_room = d, room
+        return best
+
+    # Free cells reachable from a cell, by flood fill; counting stops at `enough`
+    def room(self, state, start, enough):
+        grid = state.grid
+        links = self.links
+        seen = {start}
+        queue = deque([start])
+        while queue and len(seen) < enough:
+            index = queue.popleft()
+            for neighbor in links[index]:
+                if neighbor not in seen and not grid.blocked[neighbor] and not grid.snake[neighbor]:
+                    seen.add(neighbor)
+                    queue.append(neighbor)
+        return len(seen)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak test: the autopilot plays headless games and reports its planning cost")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--max-ticks", type=int, default=20000, help="ticks after which a game is cut short")
+    args = parser.parse_args()
+
+    pilot = Autopilot()
+    rng = random.Random(args.seed)
+    state = GameState(args.seed)
+    costs = []
+    scores = []
+    start = time.perf_counter()
+    for _ in range(args.games):
+        while not state.over and state.tick_count < args.max_ticks:
+            direction = pilot(state, rng)
+            costs.append(pilot.last_cost * 1e6)
+            if direction is not None:
+                state.change_direction(direction)
+            state.step()
+        scores.append(state.score)
+        state.reset()
+    elapsed = time.perf_counter() - start
+
+    costs.sort()
+    scores.sort()
+    print(f"{args.games} games, {len(costs):,} ticks in {elapsed:.1f} s, {pilot.plans:,} plans "
+          f"({pilot.plans / len(costs):.1%} of ticks)")
+    print(f"Score: p50 {percentile(scores, 50):.0f}, p95 {percentile(scores, 95):.0f}, best {scores[-1]}")
+    print(f"Planning per tick: p50 {percentile(costs, 50):.0f} us, p99 {percentile(costs, 99):.0f} us, "
+          f"max {costs[-1] / 1000:.2f} ms ({costs[-1] / 10 / MIN_INTERVAL:.1f}% of the {MIN_INTERVAL} ms tick)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
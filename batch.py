@@ -0,0 +1,351 @@
+import argparse
+import time
+
+import numpy as np
+
+from engine import (
+    CELL_SIZE,
+    DIRECTIONS,
+    FOOD_POINTS,
+    LEVEL_FILE,
+    SCENE_RECT,
+    SPAWN_RECT,
+    load_levels,
+)
+from grid import OccupancyGrid
+from levels import LevelError
+
+# Batched game engine: N independent games stored as struct-of-arrays NumPy
+# buffers and advanced in lockstep, one vectorized step() for all of them.
+# Rules follow GameState.check_collision and GameState.level_up: walls, the
+# shield/invincibility logic, food types with their speed effects, shield food,
+# and the levels of a level file with their walls, speed curve, food odds and
+# obstacles. Obstacles are
+# static blocks here; the food and obstacle motion of levels 3+ is only
+# simulated by GameState. The board is the same cell grid as OccupancyGrid, and
+# cells off the board are stored as -1, so a snake that leaves the board while
+# invincible is not checked against its own off-board cubes.
+
+FOOD_TYPES = ("normal", "golden", "speed_boost", "slow_down")
+FOOD_TYPE_POINTS = np.array([FOOD_POINTS[t] for t in FOOD_TYPES], dtype=np.int32)
+NORMAL, GOLDEN, SPEED_BOOST, SLOW_DOWN = range(4)
+
+DX = np.array([d[0] for d in DIRECTIONS], dtype=np.int32)
+DY = np.array([d[1] for d in DIRECTIONS], dtype=np.int32)
+OPPOSITE = np.array([DIRECTIONS.index((-dx, -dy)) for dx, dy in DIRECTIONS], dtype=np.int8)
+RIGHT = DIRECTIONS.index((1, 0))
+
+
+def ticks_for(ms, interval):
+    return np.maximum(1, np.rint(ms / interval)).astype(np.int64)
+
+
+class BatchGame:
+    def __init__(self, n, seed=None, levels=None):
+        self.n = n
+        self.rng = np.random.default_rng(seed)
+        self.levels = levels or load_levels()
+
+        # Board geometry and wall masks come from the single-game grid, so both engines agree on every cell
+        template = OccupancyGrid(SCENE_RECT, CELL_SIZE, SPAWN_RECT)
+        self.cols = template.cols
+        self.rows = template.rows
+        self.cells = template.cols * template.rows
+        self.col_min = template.col_min
+        self.row_min = template.row_min
+        self.spawn_cells = np.flatnonzero(np.frombuffer(bytes(template.spawnable), dtype=np.uint8)).astype(np.int32)
+        spawn_cols = self.spawn_cells % self.cols
+        spawn_rows = self.spawn_cells // self.cols
+        self.anchor_cells = self.spawn_cells[(spawn_cols < self.cols - 1) & (spawn_rows < self.rows - 1)]
+
+        # Per level of the file: the walls it adds as a mask, its interval and its food odds as thresholds
+        # and type codes (padded with thresholds no draw reaches), from the compiled levels
+        compiled = self.levels.levels[1:]
+        self.start_walls = np.frombuffer(compiled[0].mask, dtype=np.uint8)
+        self.level_walls = {level.number: np.bincount(np.frombuffer(level.cells, dtype=np.uint32),
+                                                      minlength=self.cells).astype(np.uint8)
+                            for level in compiled[1:] if level.cells}
+        self.level_moving = {level.number: level.moving for level in compiled if level.moving}
+        self.level_intervals = np.array([0] + [level.interval for level in compiled], dtype=np.int64)
+        kinds = max(len(level.food) for level in compiled)
+        self.food_thresholds = np.full((len(compiled) + 1, kinds), np.inf)
+        self.food_codes = np.zeros((len(compiled) + 1, kinds), dtype=np.int8)
+        for level in compiled:
+            for k, (threshold, kind) in enumerate(level.food):
+                self.food_thresholds[level.number, k] = threshold
+                self.food_codes[level.number, k] = FOOD_TYPES.index(kind)
+
+        # Body ring buffers hold cell indices, head at head_ptr, -1 for cubes off the board
+        self.capacity = 1 << int(self.cells + 64).bit_length()
+        self.body = np.full((n, self.capacity), -1, dtype=np.int32)
+        self.head_ptr = np.zeros(n, dtype=np.int64)
+        self.length = np.zeros(n, dtype=np.int64)
+        self.head_x = np.zeros(n, dtype=np.int32)  # Head column and row, may be off the board
+        self.head_y = np.zeros(n, dtype=np.int32)
+        self.direction = np.zeros(n, dtype=np.int8)
+        self.occupancy = np.zeros((n, self.cells), dtype=np.uint8)  # Snake cubes per cell
+        self.blocked = np.zeros((n, self.cells), dtype=np.uint8)  # Obstacles per cell
+        self.occupancy_flat = self.occupancy.reshape(-1)
+        self.blocked_flat = self.blocked.reshape(-1)
+
+        self.food = np.zeros(n, dtype=np.int32)  # Food cell, -1 when the board is full
+        self.food_type = np.zeros(n, dtype=np.int8)
+        self.shield_food = np.zeros(n, dtype=np.int32)  # Shield food cell, -1 when there is none
+        self.score = np.zeros(n, dtype=np.int32)
+        self.food_count = np.zeros(n, dtype=np.int32)
+        self.level = np.zeros(n, dtype=np.int32)
+        self.shields = np.zeros(n, dtype=np.int32)
+        self.invincible = np.zeros(n, dtype=bool)
+        self.invincible_until = np.zeros(n, dtype=np.int64)
+        self.interval = np.zeros(n, dtype=np.int64)
+        self.speed_boost_active = np.zeros(n, dtype=bool)
+        self.speed_reset_tick = np.zeros(n, dtype=np.int64)  # -1 when no reset is pending
+        self.next_shield_tick = np.zeros(n, dtype=np.int64)
+        self.ticks = np.zeros(n, dtype=np.int64)
+
+        # Stats of the last finished game in each slot
+        self.games_finished = 0
+        self.final_score = np.zeros(n, dtype=np.int32)
+        self.final_level = np.zeros(n, dtype=np.int32)
+        self.final_ticks = np.zeros(n, dtype=np.int64)
+
+        self.all_games = np.arange(n)
+        self.reset_games(self.all_games)
+
+    # Interval of each level, from the level file and past its last level from its speed curve
+    def level_interval(self, level):
+        levels = self.levels
+        last = len(self.level_intervals) - 1
+        curve = np.maximum(levels.min_interval, levels.base_interval - (level - 1) * levels.interval_step)
+        return np.where(level <= last, self.level_intervals[np.minimum(level, last)], curve)
+
+    def reset_games(self, idx):
+        self.body[idx] = -1
+        self.occupancy[idx] = 0
+        self.blocked[idx] = self.start_walls
+        self.head_ptr[idx] = 0
+        self.length[idx] = 0
+        self.direction[idx] = RIGHT  # Start moving right
+        self.score[idx] = 0
+        self.food_count[idx] = 0
+        self.level[idx] = 1
+        self.shields[idx] = 0
+        self.invincible[idx] = False
+        self.interval[idx] = self.level_interval(self.level[idx])
+        self.speed_boost_active[idx] = False
+        self.speed_reset_tick[idx] = -1
+        self.next_shield_tick[idx] = ticks_for(10000, self.interval[idx])
+        self.ticks[idx] = 0
+        self.shield_food[idx] = -1
+
+        # Snake is initially 2 cubes large: (0, 0) with the head one cell to the right
+        self.head_x[idx] = -1 - self.col_min
+        self.head_y[idx] = -self.row_min
+        self.push_head(idx)
+        self.push_head(idx)
+        self.create_food(idx)
+        for _ in range(self.level_moving.get(1, 0)):
+            self.create_obstacle(idx)
+
+    def push_head(self, idx):
+        d = self.direction[idx]
+        hx = self.head_x[idx] + DX[d]
+        hy = self.head_y[idx] + DY[d]
+        inside = (hx >= 0) & (hx < self.cols) & (hy >= 0) & (hy < self.rows)
+        cell = np.where(inside, hy * self.cols + hx, -1)
+        ptr = (self.head_ptr[idx] + 1) & (self.capacity - 1)
+        self.body[idx, ptr] = cell
+        self.head_ptr[idx] = ptr
+        self.length[idx] += 1
+        self.head_x[idx] = hx
+        self.head_y[idx] = hy
+        self.occupancy_flat[idx[inside] * self.cells + cell[inside]] += 1
+        return cell
+
+    def pop_tail(self):
+        tail = self.body[self.all_games, (self.head_ptr - self.length + 1) & (self.capacity - 1)]
+        inside = tail >= 0
+        self.occupancy_flat[self.all_games[inside] * self.cells + tail[inside]] -= 1
+        self.length -= 1
+
+    def cell_free(self, idx, cell):
+        flat = idx * self.cells + cell
+        return (self.occupancy_flat[flat] == 0) & (self.blocked_flat[flat] == 0)
+
+    # Uniformly random free spawn cell per game, -1 where the spawn area is full
+    def random_free_cells(self, idx):
+        result = np.full(len(idx), -1, dtype=np.int32)
+        pending = np.arange(len(idx))
+        for attempt in range(8):
+            candidates = self.spawn_cells[self.rng.integers(0, len(self.spawn_cells), len(pending))]
+            ok = self.cell_free(idx[pending], candidates)
+            result[pending[ok]] = candidates[ok]
+            pending = pending[~ok]
+            if not len(pending):
+                return result
+        # Crowded boards: choose among the free cells directly
+        for p in pending:
+            free = self.spawn_cells[self.cell_free(idx[p], self.spawn_cells)]
+            if len(free):
+                result[p] = free[self.rng.integers(len(free))]
+        return result
+
+    def create_food(self, idx):
+        self.food[idx] = self.random_free_cells(idx)
+        # Food type by the odds of each game's level: the first threshold above the draw picks it
+        level = np.minimum(self.level[idx], len(self.food_codes) - 1)
+        draw = self.rng.random(len(idx))
+        self.food_type[idx] = self.food_codes[level, (self.food_thresholds[level] <= draw[:, None]).sum(axis=1)]
+
+    def create_obstacle(self, idx):
+        # 2x2 cell obstacles clear of the snake, food and other obstacles, with up to 10 attempts each
+        pending = idx
+        for attempt in range(10):
+            if not len(pending):
+                return
+            anchor = self.anchor_cells[self.rng.integers(0, len(self.anchor_cells), len(pending))]
+            block = (anchor, anchor + 1, anchor + self.cols, anchor + self.cols + 1)
+            ok = np.ones(len(pending), dtype=bool)
+            for cell in block:
+                ok &= self.cell_free(pending, cell) & (cell != self.food[pending])
+            placed = pending[ok]
+            for cell in block:
+                self.blocked_flat[placed * self.cells + cell[ok]] += 1
+            pending = pending[~ok]
+
+    def run_timers(self):
+        due = (self.speed_reset_tick >= 0) & (self.ticks >= self.speed_reset_tick)
+        reset = due & self.speed_boost_active
+        self.interval[reset] = self.level_interval(self.level[reset])
+        self.speed_boost_active[due] = False
+        self.speed_reset_tick[due] = -1
+
+        self.invincible &= self.ticks < self.invincible_until
+
+        due = self.ticks >= self.next_shield_tick
+        if due.any():
+            self.next_shield_tick[due] = self.ticks[due] + ticks_for(10000, self.interval[due])
+            spawn = np.flatnonzero(due & (self.shields == 0) & (self.shield_food < 0))
+            self.shield_food[spawn] = self.random_free_cells(spawn)
+
+    def lose_shield(self, mask, duration):
+        self.shields[mask] -= 1
+        self.invincible[mask] = True
+        self.invincible_until[mask] = self.ticks[mask] + ticks_for(duration, self.interval[mask])
+
+    # Advance every game by one tick. actions holds a DIRECTIONS index per game, or -1 to keep going.
+    # Returns a mask of the games that ended this tick; they are already reset when step returns.
+    def step(self, actions=None):
+        if actions is not None:
+            actions = np.asarray(actions)
+            turn = (actions >= 0) & (actions != OPPOSITE[self.direction])  # Prevent snake from going in the opposite direction
+            self.direction = np.where(turn, actions, self.direction).astype(np.int8)
+        self.ticks += 1
+        self.run_timers()
+
+        self.pop_tail()
+        head = self.push_head(self.all_games)
+        head_flat = self.all_games * self.cells + head
+        vulnerable = ~self.invincible
+
+        # Check collision with boundaries
+        off_board = head < 0
+        self.lose_shield(off_board & vulnerable & (self.shields > 0), 2000)
+        dead = off_board & vulnerable & (self.shields == 0)
+        active = ~off_board
+
+        # Check self-collision: the head shares its cell with another cube
+        hit_self = active & (self.occupancy_flat[np.where(active, head_flat, 0)] > 1)
+        dead |= hit_self
+        active &= ~hit_self
+
+        # Obstacles under the head, looked up before eating like the engine's hits: a level-up adds its walls after
+        hit_obstacle = active & (self.blocked_flat[np.where(active, head_flat, 0)] > 0)
+
+        # Check collision with the food
+        eaten = np.flatnonzero(active & (head == self.food))
+        if len(eaten):
+            self.eat(eaten)
+
+        # Check collision with obstacles
+        self.lose_shield(hit_obstacle & vulnerable & (self.shields > 0), 3000)
+        dead |= hit_obstacle & vulnerable & (self.shields == 0)
+        active &= ~hit_obstacle
+
+        # Check collision with shield food
+        shield = active & (head == self.shield_food)
+        self.shields[shield] += 1
+        self.shield_food[shield] = -1
+
+        # Finished games start over right away
+        done = np.flatnonzero(dead)
+        if len(done):
+            self.games_finished += len(done)
+            self.final_score[done] = self.score[done]
+            self.final_level[done] = self.level[done]
+            self.final_ticks[done] = self.ticks[done]
+            self.reset_games(done)
+        return dead
+
+    def eat(self, idx):
+        # Apply food effects based on type
+        food_type = self.food_type[idx]
+        self.score[idx] += FOOD_TYPE_POINTS[food_type]
+        self.food_count[idx] += 1
+
+        boost = food_type == SPEED_BOOST
+        slow = food_type == SLOW_DOWN
+        self.interval[idx[boost]] = np.maximum(30, self.interval[idx[boost]] - 50)
+        self.interval[idx[slow]] = np.minimum(200, self.interval[idx[slow]] + 50)
+        timed = idx[boost | slow]
+        self.speed_boost_active[timed] = True
+        timed = timed[self.speed_reset_tick[timed] < 0]
+        self.speed_reset_tick[timed] = self.ticks[timed] + ticks_for(5000, self.interval[timed])
+
+        self.create_food(idx)
+        self.push_head(idx)  # Grow
+
+        # Check if level up is needed (consistent: every N apples)
+        levels = self.levels
+        up = idx[self.food_count[idx] >= self.level[idx] * levels.food_per_level]
+        if len(up):
+            self.level[up] += 1
+            self.interval[up] = self.level_interval(self.level[up])
+            # Add obstacles more gradually - only every few levels
+            if levels.moving_every_levels:
+                self.create_obstacle(up[self.level[up] % levels.moving_every_levels == 0])
+            for level, mask in self.level_walls.items():
+                self.blocked[up[self.level[up] == level]] += mask
+            for level, count in self.level_moving.items():
+                for _ in range(count):
+                    self.create_obstacle(up[self.level[up] == level])
+
+        # Add obstacle every few food items consumed
+        if levels.moving_every_food:
+            self.create_obstacle(idx[self.food_count[idx] % levels.moving_every_food == 0])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Step many QtSnake games in lockstep")
+    parser.add_argument("--games", type=int, default=4096, help="number of games stepped together")
+    parser.add_argument("--steps", type=int, default=1000, help="number of batched steps")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--levels", default=LEVEL_FILE, help="level file to play (JSON or TOML)")
+    args = parser.parse_args()
+
+    try:
+        levels = load_levels(args.levels)
+    except LevelError as e:
+        raise SystemExit(e)
+    batch = BatchGame(args.games, args.seed, levels)
+    rng = np.random.default_rng(args.seed)
+    start = time.perf_counter()
+    for _ in range(args.steps):
+        # Random play: turn now and then, otherwise keep going
+        actions = np.where(rng.random(args.games) < 0.1, rng.integers(0, 4, args.games), -1)
+        batch.step(actions)
+    elapsed = time.perf_counter() - start
+
+    game_ticks = args.games * args.steps
+    print(f"Simulated {game_ticks:,} game-ticks in {elapsed:.2f} s ({game_ticks / elapsed:,.0f} game-ticks/s)")
+    print(f"Games finished: {batch.games_finished:,}, best level {batch.level.max()}, best score {batch.score.max()}")
@@ -0,0 +1,382 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from time import perf_counter_ns
+
+from engine import CELL_SIZE, GameState, Item
+from stats import percentile
+
+# Benchmark suite for the per-tick costs of the game. Each scenario lays out a
+# snake of a given length along a closed loop through the top rows of the
+# board, with static walls and moving obstacles in the rows below, and steers
+# the snake around the loop for a number of ticks. Every tick is timed as a
+# whole and per phase (timers, moving items, snake move, collision checks);
+# food spawning is timed on its own. When an obstacle or a level wall ends a
+# game, a fresh one is built outside the timed sections.
+#
+# Scenarios run on the headless engine and, when PySide6 can be loaded, again
+# on the offscreen Qt platform, where the window's event handling, scene sync
+# and painting are timed as well. Each scenario runs a few times and every
+# phase keeps the percentiles of its fastest run, which takes out most of the
+# noise of a busy machine. Results are written as JSON and compared
+# against a stored baseline, scaled by a calibration workload timed along
+# with every scenario; phases that got slower than the tolerance are reported as
+# regressions and make the run fail.
+#
+# The board has 52 x 26 = 1352 cells, so snakes much longer than 1000 cubes
+# do not fit next to any obstacles; such scenarios are reported as skipped.
+
+BASE = {"length": 100, "walls": 10, "movers": 5}
+SWEEPS = {
+    "length": (10, 100, 500, 1000),
+    "walls": (0, 20, 50, 100),
+    "movers": (0, 10, 50, 100),
+}
+BENCH_LEVEL = 4  # Food moves from level 3 on, moving obstacles from level 4 on
+PERCENTILES = (50, 90, 99)
+METRIC = "p50"  # Percentile compared against the baseline
+MIN_DELTA_US = 0.5  # Slowdowns smaller than this are noise, whatever the ratio
+
+
+class ScenarioError(Exception):
+    pass
+
+
+# Closed loop through the first `rows` rows of the board: serpentine rows from the
+# second column on, back up the first column. Needs an even number of rows.
+def loop_cells(grid, rows):
+    cells = []
+    for row in range(rows):
+        cols = range(1, grid.cols) if row % 2 == 0 else range(grid.cols - 1, 0, -1)
+        cells.extend((col, row) for col in cols)
+    cells.extend((0, row) for row in range(rows - 1, -1, -1))
+    return [((grid.col_min + col) * CELL_SIZE, (grid.row_min + row) * CELL_SIZE) for col, row in cells]
+
+
+def build_state(length, walls, movers, seed):
+    state = GameState(seed)
+    grid = state.grid
+    rows = -(-(length + grid.cols) // grid.cols)  # Leave about one row of the loop free ahead of the head
+    rows += rows % 2
+    slots = [(col, row)
+             for row in range(rows + 2, grid.rows - 1, 2)  # One free row pair between the loop and the obstacles
+             for col in range(0, grid.cols - 1, 2)]
+    if rows > grid.rows or walls + movers > len(slots):
+        raise ScenarioError(f"{length} cubes, {walls} walls and {movers} movers do not fit on the board")
+
+    for x, y in state.body:
+        grid.remove_snake(x, y)
+    cells = loop_cells(grid, rows)
+    state.body.clear()
+    state.body.extendleft(cells[:length])
+    state.heads_pushed += length  # Renderers pick the new body up like cubes added at the head
+    for x, y in state.body:
+        grid.add_snake(x, y)
+    (x, y), (prev_x, prev_y) = state.body[0], state.body[1]
+    state.direction = state.logged_direction = ((x - prev_x) // CELL_SIZE, (y - prev_y) // CELL_SIZE)
+    state.level = BENCH_LEVEL
+    state.interval = state.level_interval()
+
+    for i, (col, row) in enumerate(slots[:walls + movers]):
+        x = (grid.col_min + col) * CELL_SIZE
+        y = (grid.row_min + row) * CELL_SIZE
+        if i < walls:
+            state.add_obstacle(Item("wall", x, y, 2 * CELL_SIZE, 2 * CELL_SIZE))
+        else:
+            state.add_obstacle(Item("moving", x, y, 2 * CELL_SIZE, 2 * CELL_SIZE, speed=1))
+    if state.food is not None and grid.rect_blocked(state.food.x, state.food.y, state.food.width, state.food.height):
+        state.create_food()
+    return state, {cell: i for i, cell in enumerate(cells)}, cells
+
+
+# Turn the snake towards the next cell of the loop
+def steer(state, loop_index, cells):
+    index = loop_index.get(state.body[0])
+    if index is None:
+        return False
+    x, y = state.body[0]
+    next_x, next_y = cells[(index + 1) % len(cells)]
+    state.change_direction(((next_x - x) // CELL_SIZE, (next_y - y) // CELL_SIZE))
+    return True
+
+
+def timed(func, name, pending):
+    def wrapper(*args):
+        start = perf_counter_ns()
+        result = func(*args)
+        pending[name] = pending.get(name, 0) + perf_counter_ns() - start
+        return result
+    return wrapper
+
+
+# Wrap the phases of GameState.step, so each tick adds up the time spent in each of them
+def instrument(state, pending):
+    state.movers.run_due = timed(state.movers.run_due, "timers", pending)
+    state.movers.move = timed(state.movers.move, "move_items", pending)
+    state.move_snake = timed(state.move_snake, "move_snake", pending)
+    state.check_collision = timed(state.check_collision, "check_collision", pending)
+
+
+class Scenario:
+    def __init__(self, length, walls, movers, seed):
+        self.length = length
+        self.walls = walls
+        self.movers = movers
+        self.seed = seed
+        self.games = 0
+        self.samples = {}
+        build_state(length, walls, movers, seed)  # Fails early if the scenario does not fit
+
+    # Fresh game for the scenario, with a seed of its own
+    def new_game(self):
+        self.games += 1
+        self.state, self.loop_index, self.cells = build_state(self.length, self.walls, self.movers, self.seed + self.games)
+        return self.state
+
+    def add(self, name, value):
+        self.samples.setdefault(name, []).append(value)
+
+    # Play `ticks` ticks, calling measure(state) for each one; starts a new game whenever one ends
+    def play(self, ticks, measure, setup=None):
+        state = None
+        for _ in range(ticks):
+            if state is None or state.over or not steer(state, self.loop_index, self.cells):
+                state = self.new_game()
+                if setup:
+                    setup(state)
+                steer(state, self.loop_index, self.cells)
+            measure(state)
+
+    def run_headless(self, ticks):
+        def measure_tick(state):
+            start = perf_counter_ns()
+            state.step()
+            self.add("tick", perf_counter_ns() - start)
+        self.play(ticks, measure_tick)
+
+        pending = {}
+        def measure_phases(state):
+            pending.clear()
+            state.step()
+            for name, value in pending.items():
+                self.add(name, value)
+        self.play(ticks, measure_phases, lambda state: instrument(state, pending))
+
+        # Food spawning, repeated on a fixed board
+        state = self.new_game()
+        for _ in range(ticks):
+            start = perf_counter_ns()
+            state.create_food()
+            self.add("create_food", perf_counter_ns() - start)
+
+    def run_qt(self, window, ticks):
+        def setup(state):
+            window.state = state
+            window.effects.clear()
+            window.clear_scene()
+            window.render_elements()
+
+        from PySide6.QtWidgets import QApplication
+        def measure(state):
+            start = perf_counter_ns()
+            events = state.step()
+            engine_done = perf_counter_ns()
+            if state.over:
+                return  # Game over would open the modal dialog: rebuilt on the next tick instead
+            window.effects.run_due(state.tick_count)
+            window.handle_events(events)
+            events_done = perf_counter_ns()
+            window.render_elements()
+            window.interpolate(0.5)
+            render_done = perf_counter_ns()
+            QApplication.processEvents()  # Repaints what the scene marked dirty, as the event loop would
+            paint_done = perf_counter_ns()
+            self.add("engine", engine_done - start)
+            self.add("events", events_done - engine_done)
+            self.add("render", render_done - events_done)
+            self.add("paint", paint_done - render_done)
+            self.add("frame", paint_done - start)
+        self.play(ticks, measure, setup)
+
+    # Percentiles of the samples taken so far, in microseconds
+    def phase_stats(self):
+        phases = {}
+        for name, values in self.samples.items():
+            values = sorted(v / 1000 for v in values)
+            stats = {f"p{p}": round(percentile(values, p), 3) for p in PERCENTILES}
+            stats["mean"] = round(sum(values) / len(values), 3)
+            stats["count"] = len(values)
+            phases[name] = stats
+        return phases
+
+
+def scenario_params(lengths=None, walls=None, movers=None):
+    sweeps = dict(SWEEPS)
+    for key, values in (("length", lengths), ("walls", walls), ("movers", movers)):
+        if values:
+            sweeps[key] = tuple(values)
+    params = []
+    for key, values in sweeps.items():
+        for value in values:
+            p = dict(BASE, **{key: value})
+            if p not in params:
+                params.append(p)
+    return params
+
+
+def scenario_name(backend, p):
+    return f"{backend}/length={p['length']},walls={p['walls']},movers={p['movers']}"
+
+
+# MainWindow on the offscreen platform, or None with the reason it could not be created
+def create_window():
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    try:
+        from PySide6.QtWidgets import QApplication
+        app = QApplication.instance() or QApplication(sys.argv[:1])
+        import main
+        window = main.MainWindow(sound=False)
+    except Exception as e:
+        return None, None, f"{type(e).__name__}: {e}"
+    window.start_game()
+    window.timer.stop()
+    return app, window, None
+
+
+def run(params, ticks, repeats, seed, backends):
+    results = {}
+    window = None
+    if "qt" in backends:
+        app, window, error = create_window()
+        if window is None:
+            print(f"Skipping the Qt backend: {error}")
+    for backend in backends:
+        if backend == "qt" and window is None:
+            continue
+        for p in params:
+            name = scenario_name(backend, p)
+            try:
+                scenario = Scenario(p["length"], p["walls"], p["movers"], seed)
+            except ScenarioError as e:
+                print(f"{name}: skipped, {e}")
+                continue
+            start = time.perf_counter()
+            best = {}
+            for _ in range(repeats):
+                scenario.samples = {}
+                if backend == "qt":
+                    scenario.run_qt(window, ticks)
+                else:
+                    scenario.run_headless(ticks)
+                for phase, stats in scenario.phase_stats().items():
+                    if phase not in best or stats[METRIC] < best[phase][METRIC]:
+                        best[phase] = stats
+            results[name] = dict(p, games=scenario.games, calibration_us=round(calibrate(), 1), phases=best)
+            print_scenario(name, results[name], time.perf_counter() - start)
+    return results
+
+
+def print_scenario(name, result, elapsed):
+    print(f"{name} ({elapsed:.1f} s, {result['games']} games)")
+    for phase, stats in result["phases"].items():
+        values = "".join(f"{stats[f'p{p}']:>10.2f}" for p in PERCENTILES)
+        print(f"  {phase:<16}{values}  us (p{'/p'.join(map(str, PERCENTILES))})")
+
+
+# Time of a fixed pure-Python workload that does not depend on the game code, in microseconds.
+# It is taken right after each scenario, and the scenario's baseline timings are scaled by the
+# ratio of the two calibrations, so a baseline stored on another machine (or while this one
+# was busy or clocked down) can still be compared against.
+def calibrate(rounds=20):
+    best = None
+    for _ in range(rounds):
+        start = perf_counter_ns()
+        counts = {}
+        cells = []
+        for i in range(20000):
+            counts[i & 255] = counts.get(i & 255, 0) + i
+            cells.append((i % 52, i % 26))
+        cells.sort()
+        elapsed = perf_counter_ns() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / 1000
+
+
+# Phases that got slower than the baseline by more than `tolerance`, as printable lines
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, base in baseline["scenarios"].items():
+        current = results.get(name)
+        if current is None:
+            continue
+        scale = current["calibration_us"] / base["calibration_us"]
+        for phase, base_stats in base["phases"].items():
+            stats = current["phases"].get(phase)
+            if stats is None:
+                continue
+            old, new = base_stats[METRIC] * scale, stats[METRIC]
+            if new > old * (1 + tolerance) and new - old > MIN_DELTA_US:
+                regressions.append(f"{name} {phase}: {METRIC} {old:.2f} -> {new:.2f} us ({new / old - 1:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark QtSnake tick, spawn and collision costs against board load")
+    parser.add_argument("--ticks", type=int, default=2000, help="timed ticks per scenario and pass")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per scenario, each phase keeps its fastest run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backend", nargs="+", choices=("headless", "qt"), default=["headless", "qt"])
+    parser.add_argument("--lengths", type=int, nargs="+", help=f"snake lengths to sweep (default {SWEEPS['length']})")
+    parser.add_argument("--walls", type=int, nargs="+", help=f"wall counts to sweep (default {SWEEPS['walls']})")
+    parser.add_argument("--movers", type=int, nargs="+", help=f"moving obstacle counts to sweep (default {SWEEPS['movers']})")
+    parser.add_argument("--out", default="bench_results.json", help="where to write the results")
+    parser.add_argument("--baseline", default="bench_baseline.json", help="results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.3, help=f"allowed {METRIC} slowdown before failing, 0.3 = 30%%")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    args = parser.parse_args()
+
+    params = scenario_params(args.lengths, args.walls, args.movers)
+    scenarios = run(params, args.ticks, args.repeat, args.seed, args.backend)
+    results = {
+        "meta": {
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "ticks": args.ticks,
+            "repeat": args.repeat,
+            "seed": args.seed,
+            "metric": METRIC,
+        },
+        "scenarios": scenarios,
+    }
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.out}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save-baseline to store one")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(scenarios, baseline, args.tolerance)
+    if regressions:
+        print(f"\nREGRESSIONS against {args.baseline} ({METRIC}, tolerance {args.tolerance:.0%}):")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print(f"No regressions against {args.baseline} ({METRIC}, tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,525 @@
+import os
+import random
+import time
+from collections import deque
+
+from grid import OccupancyGrid, SpatialHash
+from movers import Movers
+from profiler import COLLISION, MOVERS, SNAKE, TIMERS
+from scheduler import KEEP, Scheduler
+
+# Pure-Python game engine. Holds every game rule (snake, food, shields,
+# obstacles, levels and power-ups) without touching Qt, so the game can be
+# simulated headless and rendered by MainWindow on top.
+
+CELL_SIZE = 15  # Snake cubes and food are 15x15 px
+SCENE_RECT = (-400, -200, 800, 400)  # x, y, width, height of the playfield
+SPAWN_RECT = (-320, -160, 640, 320)  # Items spawn with their top-left corner in the middle 80% of the playfield
+
+# Levels come from level files (see levels.py); these are the defaults for what a file leaves out
+LEVELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "levels")
+LEVEL_FILE = os.path.join(LEVELS_DIR, "classic.json")
+BASE_INTERVAL = 150  # Base game speed (ms per tick)
+MIN_INTERVAL = 70  # Fastest speed reachable through levelling up
+POINTS_TO_NEXT_LEVEL = 5  # Food needed per level
+INPUT_QUEUE_SIZE = 3  # Turns that can be buffered ahead of the snake
+FOOD_MOVES_FROM = 3  # Level from which the food moves
+OBSTACLES_MOVE_FROM = 4  # Level from which moving obstacles move
+BUCKET_SIZE = 4 * CELL_SIZE  # Side of a spatial hash bucket
+
+FOOD_POINTS = {
+    "normal": 1,
+    "golden": 3,
+    "speed_boost": 1,
+    "slow_down": 1,
+    "shield": 0,  # shield does not give score
+}
+
+FOOD_WEIGHTS = {"golden": 10, "speed_boost": 10, "slow_down": 10, "normal": 70}  # Relative odds, in draw order
+
+OBSTACLE_KINDS = ("wall", "moving")
+
+UP = (0, -1)
+DOWN = (0, 1)
+LEFT = (-1, 0)
+RIGHT = (1, 0)
+DIRECTIONS = (UP, DOWN, LEFT, RIGHT)
+
+
+def rects_overlap(ax, ay, aw, ah, bx, by, bw, bh):
+    return ax < bx + bw and bx < ax + aw and ay < by + bh and by < ay + ah
+
+
+# (threshold, kind) pairs from relative odds: a draw in [0, 1) picks the first kind it falls below
+def food_table(weights):
+    total = sum(weights.values())
+    table = []
+    cumulative = 0
+    for kind, weight in weights.items():
+        cumulative += weight
+        table.append((cumulative / total, kind))  # Whole weights give exact thresholds, like 30 / 100 == 0.3
+    return tuple(table)
+
+
+FOOD_TABLE = food_table(FOOD_WEIGHTS)
+
+
+def random_food_type(rng, table=FOOD_TABLE):
+    rand_val = rng.random()
+    for threshold, kind in table:
+        if rand_val < threshold:
+            return kind
+    return table[-1][1]
+
+
+# Compiled level set of a level file, loaded once per process. Raises levels.LevelError
+def load_levels(path=LEVEL_FILE):
+    path = os.path.abspath(path)
+    if path not in level_sets:
+        from levels import load_level_set  # levels imports this module
+        level_sets[path] = load_level_set(path)
+    return level_sets[path]
+
+
+level_sets = {}
+
+
+# Class representing anything that lives on the board besides the snake:
+# food (kind is the food type) and obstacles (kind is "wall" or "moving")
+class Item:
+    def __init__(self, kind, x, y, width=CELL_SIZE, height=CELL_SIZE, speed=0):
+        self.kind = kind
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.speed = speed
+        self.vx = 0  # horizontal velocity
+        self.vy = 0  # vertical velocity
+        self.prev_x = x  # Position before the last move, for render interpolation
+        self.prev_y = y
+
+    @property
+    def points(self):
+        return FOOD_POINTS.get(self.kind, 0)
+
+    def overlaps(self, x, y, width, height):
+        return rects_overlap(self.x, self.y, self.width, self.height, x, y, width, height)
+
+
+# Class holding the whole state of one game
+class GameState:
+    def __init__(self, seed=None, levels=None):
+        self.levels = levels or load_levels()  # LevelSet the game follows
+        self.seed_source = random.Random(seed)  # Seeds of the games after the first one
+        self.profiler = None  # Set to a profiler.Profiler to time the phases of every step
+        self.profiled = (TIMERS, MOVERS, SNAKE, COLLISION)  # Phases step() laps
+        self.reset(seed)
+
+    def reset(self, seed=None):
+        # Every game gets a concrete seed, so it can be reproduced from the seed and its inputs alone
+        if seed is None:
+            seed = self.seed_source.getrandbits(63)
+        self.seed = seed
+        # One random stream per subsystem, so a change in how one of them draws does not shift the others
+        self.food_rng = random.Random(f"{seed}/food")
+        self.shield_rng = random.Random(f"{seed}/shield")
+        self.obstacle_rng = random.Random(f"{seed}/obstacle")
+        self.motion_rng = random.Random(f"{seed}/motion")
+
+        self.tick_count = 0
+        self.score = 0
+        self.food_count = 0  # Counter for food consumed
+        self.play_time = 0  # Game time played, in ms: the sum of the intervals of the ticks so far
+        self.level = 1
+        self.interval = self.level_interval()
+        self.direction = RIGHT  # Start moving right
+        self.input_queue = deque()  # Buffered turns, one is applied per tick
+        self.input_log = []  # (tick, direction) for every tick the snake changed direction, for replays
+        self.logged_direction = self.direction
+        self.body = deque([(CELL_SIZE, 0), (0, 0)])  # Head first, snake is initially 2 cubes large
+        self.heads_pushed = len(self.body)  # Cubes ever added at the head, lets renderers catch up incrementally
+        self.obstacles = []  # Walls and moving obstacles, in creation order
+        self.moving_obstacles = []
+        self.create_board()
+        self.food = None
+        self.shield_food = None
+        self.shields = 0  # Number of shields/lives
+        self.invincible = False
+        self.speed_boost_active = False
+        self.scheduler = Scheduler()  # Timed effects, counted in ticks of this game
+        self.scheduler.schedule("shield_spawn", self.ticks_for(10000), self.spawn_shield_timer)
+        self.over = False
+        self.events = []
+        self.create_food()
+        for _ in range(self.levels.get(1).moving):
+            self.create_obstacle()
+
+    # Convert a wall-clock duration into game ticks at the current speed
+    def ticks_for(self, ms):
+        return max(1, round(ms / self.interval))
+
+    @property
+    def head(self):
+        return self.body[0]
+
+    @property
+    def shielded(self):
+        return self.shields > 0 or self.invincible
+
+    def level_interval(self):
+        return self.levels.interval(self.level)
+
+    def change_direction(self, direction):
+        dx, dy = direction
+        if (dx, dy) != (-self.direction[0], -self.direction[1]):  # Prevent snake from going in the opposite direction
+            self.direction = (dx, dy)
+
+    # Buffer a turn for the coming ticks, so quick key presses are neither lost nor applied all in one tick
+    def queue_direction(self, direction):
+        last = self.input_queue[-1] if self.input_queue else self.direction
+        if direction == last or direction == (-last[0], -last[1]):
+            return
+        if len(self.input_queue) < INPUT_QUEUE_SIZE:
+            self.input_queue.append(direction)
+
+    def step(self):
+        self.events = []
+        if self.over:
+            return self.events
+        self.tick_count += 1
+        self.play_time += self.interval
+        if self.input_queue:
+            self.change_direction(self.input_queue.popleft())
+        if self.direction != self.logged_direction:
+            self.input_log.append((self.tick_count, self.direction))
+            self.logged_direction = self.direction
+        self.movers.run_due(self)  # The timers, and the movers' turns in order with them
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.lap(TIMERS)
+
+        # Foods and obstacles can move for added challenge (food moves appears in level 3, obstacle moves appears in level 4)
+        self.movers.move(self)
+        if profiler is not None:
+            profiler.lap(MOVERS)
+
+        self.move_snake()
+        if profiler is not None:
+            profiler.lap(SNAKE)
+        self.check_collision()
+        if profiler is not None:
+            profiler.lap(COLLISION)
+        return self.events
+
+    # Grid, item index and movers of a new game, with the walls of level 1 and the snake on the grid
+    def create_board(self):
+        self.grid = OccupancyGrid(SCENE_RECT, CELL_SIZE, SPAWN_RECT)
+        self.items = SpatialHash(BUCKET_SIZE)  # Food, shields and obstacles, for collision queries
+        self.movers = Movers(self.grid, self.items, SCENE_RECT)  # The food and moving obstacles, moved together
+        self.create_level_walls(self.levels.get(1))  # Before anything else is on the grid
+        for x, y in self.body:
+            self.grid.add_snake(x, y)
+
+    def spawn_shield_timer(self):
+        # Spawn a shield every 10 seconds
+        self.scheduler.schedule("shield_spawn", self.ticks_for(10000), self.spawn_shield_timer)
+        self.spawn_shield_food()
+
+    def move_snake(self):
+        # The tail moves out of its cell before the head moves into the next one
+        self.grid.remove_snake(*self.body.pop())
+        self.grow()
+
+    def grow(self):
+        # The new cube becomes the head one cell further along, like a move that keeps the tail
+        x, y = self.body[0]
+        head = (x + self.direction[0] * CELL_SIZE, y + self.direction[1] * CELL_SIZE)
+        self.body.appendleft(head)
+        self.heads_pushed += 1
+        self.grid.add_snake(*head)
+
+    def in_bounds(self, x, y):
+        left, top, width, height = SCENE_RECT
+        return left <= x and top <= y and x + CELL_SIZE <= left + width and y + CELL_SIZE <= top + height
+
+    # True if moving the head onto this cell would cost a shield or end the game
+    def cell_blocked(self, x, y):
+        grid = self.grid
+        index = grid.index_of(x, y)  # Cells off the board have no index
+        if index < 0 or grid.blocked[index]:
+            return True
+        # The tail leaves its cell on the next move, so only the rest of the body is in the way
+        return grid.snake[index] > ((x, y) == self.body[-1])
+
+    def snake_overlaps(self, x, y, width, height):
+        return self.grid.rect_hits_snake(x, y, width, height)
+
+    def obstacle_overlaps(self, x, y, width, height):
+        return self.grid.rect_blocked(x, y, width, height)
+
+    def random_food_type(self):
+        return random_food_type(self.food_rng, self.levels.food_table(self.level))
+
+    def create_food(self):
+        # Place the food on a cell that is clear of obstacles and the snake
+        old = self.food
+        if old is not None:
+            self.items.remove(old)
+            self.food = None
+        food_type = self.random_food_type()
+        position = self.grid.random_free_cell(self.food_rng)
+        if position is None:
+            if old is not None:
+                self.movers.remove(old)
+            print("Warning: No free cell left for food")
+            return
+        self.food = Item(food_type, *position, speed=2)
+        self.items.insert(self.food)
+        if old is not None:
+            self.movers.replace(old, self.food)  # The new food moves in the old one's place
+        else:
+            self.movers.add(self.food, FOOD_MOVES_FROM, blocks=False, first=True)
+
+    def spawn_shield_food(self):
+        # Only spawn if player has no shield and there is no existing shield food
+        if self.shields > 0 or self.shield_food is not None:
+            return
+
+        position = self.grid.random_free_cell(self.shield_rng)
+        if position is not None:
+            self.shield_food = Item("shield", *position)
+            self.items.insert(self.shield_food)
+
+    def create_obstacle(self):
+        # Obstacles cover 2x2 cells: pick free cells until the whole block is clear of the snake, food and other obstacles
+        max_attempts = 10
+        for attempt in range(max_attempts):
+            position = self.grid.random_free_cell(self.obstacle_rng)
+            if position is None:
+                print("Warning: No free cell left for obstacle")
+                return
+            x, y = position
+            if self.grid.rect_free(x, y, 30, 30) and not (self.food and self.food.overlaps(x, y, 30, 30)):
+                self.add_obstacle(Item("moving", x, y, 30, 30, speed=1))
+                return
+
+        # If we couldn't find a valid position after max_attempts, don't create obstacle
+        print(f"Warning: Could not find valid position for obstacle after {max_attempts} attempts")
+
+    def create_level_obstacles(self):
+        # Walls and moving obstacles the level file adds at this level
+        level = self.levels.get(self.level)
+        if level is None:
+            return
+        self.create_level_walls(level)
+        for _ in range(level.moving):
+            self.create_obstacle()
+
+    def create_level_walls(self, level):
+        # The grid takes the cells precompiled for the walls, at the start of a game as one whole mask
+        for x, y, width, height in level.walls:
+            wall = Item("wall", x, y, width, height)
+            self.obstacles.append(wall)
+            self.items.insert(wall)
+        if level.number == 1:
+            self.grid.load_walls(level.mask, level.free_cells, level.free_slot)
+        else:
+            self.grid.add_cells(level.cells)
+
+    def add_obstacle(self, obstacle):
+        self.obstacles.append(obstacle)
+        self.items.insert(obstacle)
+        self.grid.add_rect(obstacle.x, obstacle.y, obstacle.width, obstacle.height)
+        if obstacle.kind == "moving":
+            self.moving_obstacles.append(obstacle)
+            self.movers.add(obstacle, OBSTACLES_MOVE_FROM, blocks=True)
+
+    def level_up(self):
+        self.level += 1
+
+        # Increase game speed more gradually (slower progression)
+        self.interval = self.level_interval()
+
+        # Add obstacles more gradually - only every few levels
+        every = self.levels.moving_every_levels
+        if every and self.level % every == 0:
+            self.create_obstacle()
+
+        # Add the walls and obstacles the level file has for this level
+        self.create_level_obstacles()
+        self.events.append(("level_up", self.level))
+
+    def reset_speed(self):
+        # Reset speed to level-appropriate speed
+        if not self.speed_boost_active:
+            return
+        self.interval = self.level_interval()
+        self.speed_boost_active = False
+        self.events.append(("speed_reset",))
+
+    # When the player loses the shield, there needs to be some i-frame to avoid auto game over
+    def start_invincibility(self, duration):
+        self.invincible = True
+        self.scheduler.schedule("invincibility", self.ticks_for(duration), self.end_invincibility)
+
+    def end_invincibility(self):
+        self.invincible = False
+
+    def lose_shield(self, duration):
+        self.shields -= 1
+        self.start_invincibility(duration)
+        self.events.append(("shield_lost", self.shields))
+
+    def game_over(self):
+        self.over = True
+        self.events.append(("game_over",))
+
+    def check_collision(self):
+        hx, hy = self.body[0]
+
+        # Check collision with boundaries
+        if not self.in_bounds(hx, hy):
+            if self.shields > 0 and not self.invincible:
+                self.lose_shield(2000)  # 2 seconds i-frame
+            elif not self.invincible:
+                self.game_over()
+            return
+
+        # Check self-collision: the head shares its cell with another cube
+        if self.grid.snake_at(hx, hy) > 1:
+            self.game_over()
+            return
+
+        # Everything the head touches, looked up in the buckets around it
+        hits = self.items.query(hx, hy, CELL_SIZE, CELL_SIZE)
+        if not hits:
+            return
+
+        # Check collision with the food
+        if self.food in hits:
+            self.eat(self.food)
+
+        # Check collision with obstacles
+        for obstacle in hits:
+            if obstacle.kind in OBSTACLE_KINDS:
+                if self.shields > 0 and not self.invincible:
+                    self.lose_shield(3000)
+                elif not self.invincible:
+                    self.game_over()
+                return
+
+        # Check collision with shield food
+        if self.shield_food in hits:
+            self.items.remove(self.shield_food)
+            self.shields += 1
+            self.shield_food = None
+            self.events.append(("shield_gained", self.shields))
+
+    def eat(self, food):
+        # Apply food effects based on type
+        self.score += food.points
+        self.food_count += 1
+        self.events.append(("eat", food.kind))
+
+        if food.kind == "speed_boost":
+            # Temporarily increase speed
+            self.interval = max(30, self.interval - 50)
+            self.speed_boost_active = True
+        elif food.kind == "slow_down":
+            # Temporarily decrease speed
+            self.interval = min(200, self.interval + 50)
+            self.speed_boost_active = True
+        if food.kind in ("speed_boost", "slow_down"):
+            # Reset speed 5 seconds after the first of overlapping power-ups
+            self.scheduler.schedule("speed_reset", self.ticks_for(5000), self.reset_speed, KEEP)
+
+        self.create_food()
+        self.grow()
+
+        # Check if level up is needed (consistent: every N apples)
+        if self.food_count >= self.level * self.levels.food_per_level:
+            self.level_up()
+
+        # Add obstacle every few food items consumed
+        every = self.levels.moving_every_food
+        if every and self.food_count % every == 0:
+            self.create_obstacle()
+
+
+# Default input for headless runs: turn at random now and then, and steer away from cells that end the game
+def random_policy(state, rng):
+    direction = state.direction
+    if rng.random() < 0.1:
+        direction = rng.choice(DIRECTIONS)
+    hx, hy = state.head
+    if not state.cell_blocked(hx + direction[0] * CELL_SIZE, hy + direction[1] * CELL_SIZE):
+        return direction
+    safe = [d for d in DIRECTIONS
+            if d != (-state.direction[0], -state.direction[1])
+            and not state.cell_blocked(hx + d[0] * CELL_SIZE, hy + d[1] * CELL_SIZE)]
+    return rng.choice(safe) if safe else None
+
+
+# Head for the food along the shortest straight-line route, never onto a cell that ends the game
+def greedy_policy(state, rng):
+    hx, hy = state.head
+    safe = [d for d in DIRECTIONS
+            if d != (-state.direction[0], -state.direction[1])
+            and not state.cell_blocked(hx + d[0] * CELL_SIZE, hy + d[1] * CELL_SIZE)]
+    if not safe:
+        return None
+    if state.food is None:
+        return rng.choice(safe)
+    fx, fy = state.food.x, state.food.y
+    return min(safe, key=lambda d: abs(hx + d[0] * CELL_SIZE - fx) + abs(hy + d[1] * CELL_SIZE - fy))
+
+
+# Pathfinding with a kept path, see autopilot.py; one autopilot per process, it notices when a new game starts
+def autopilot_policy(state, rng):
+    global shared_autopilot
+    if shared_autopilot is None:
+        from autopilot import Autopilot  # autopilot imports this module
+        shared_autopilot = Autopilot()
+    return shared_autopilot(state, rng)
+
+
+shared_autopilot = None
+
+# Policies by name, for command line tools; each takes (state, rng) and returns a direction or None to keep going
+POLICIES = {
+    "random": random_policy,
+    "greedy": greedy_policy,
+    "autopilot": autopilot_policy,
+}
+
+
+def run_headless(ticks, seed=None, policy=random_policy, levels=None):
+    # Step the engine as fast as possible, starting a new game whenever one ends
+    state = GameState(seed, levels)
+    policy_rng = random.Random(seed)
+    games = []
+
+    start = time.perf_counter()
+    for _ in range(ticks):
+        direction = policy(state, policy_rng)
+        if direction is not None:
+            state.change_direction(direction)
+        state.step()
+        if state.over:
+            games.append((state.score, state.level, state.food_count, len(state.body), state.tick_count))
+            state.reset()
+    elapsed = time.perf_counter() - start
+
+    print(f"Simulated {ticks:,} ticks in {elapsed:.2f} s ({ticks / elapsed:,.0f} ticks/s)")
+    if games:
+        scores = [g[0] for g in games]
+        print(f"Games finished: {len(games):,}")
+        print(f"Score: mean {sum(scores) / len(games):.2f}, best {max(scores)}")
+        print(f"Level: best {max(g[1] for g in games)}")
+        score, level, food_count, length, game_ticks = games[-1]
+        print(f"Last game: score {score}, level {level}, food eaten {food_count}, length {length}, ticks {game_ticks}")
+    else:
+        print("No game finished")
+    print(f"Current game: score {state.score}, level {state.level}, length {len(state.body)}, ticks {state.tick_count}")
+    return 0
@@ -0,0 +1,146 @@
+import argparse
+import random
+import time
+
+import numpy as np
+
+from engine import DIRECTIONS, GameState
+
+# Gym-style environment around GameState: reset(seed) / step(action), with the
+# action being an index into DIRECTIONS (up, down, left, right), the same four
+# directions GameState.change_direction accepts. Observations are one
+# preallocated uint8 array of shape (channels, rows, cols) over the board's
+# cells that is updated in place: only the cells that changed since the last
+# step are rewritten, and step() always returns the same array, so copy it if
+# you need to keep an observation around.
+
+CHANNELS = (
+    "body",
+    "head",
+    "normal",
+    "golden",
+    "speed_boost",
+    "slow_down",
+    "shield_food",
+    "wall",
+    "moving",
+    "shielded",  # Whole plane is 1 while the snake has a shield or is invincible
+)
+CHANNEL = {name: index for index, name in enumerate(CHANNELS)}
+N_ACTIONS = len(DIRECTIONS)
+
+
+class SnakeEnv:
+    def __init__(self, max_ticks=None):
+        self.max_ticks = max_ticks
+        self.state = GameState()
+        grid = self.state.grid
+        self.observation = np.zeros((len(CHANNELS), grid.rows, grid.cols), dtype=np.uint8)
+        self.drawn = {}  # Item -> (channel, cell span) it is drawn at
+        self.reset()
+
+    def reset(self, seed=None):
+        self.state.reset(seed)
+        self.observation.fill(0)
+        self.drawn = {}
+        self.obstacles_drawn = 0
+        self.head_drawn = None
+        self.shielded_drawn = False
+        self.score = 0
+        self.sync()
+        return self.observation, {}
+
+    def step(self, action):
+        state = self.state
+        state.change_direction(DIRECTIONS[action])
+        state.step()
+        self.sync()
+        reward = state.score - self.score
+        self.score = state.score
+        truncated = self.max_ticks is not None and state.tick_count >= self.max_ticks
+        info = {"level": state.level, "shields": state.shields, "events": state.events}
+        return self.observation, reward, state.over, truncated, info
+
+    def cell_span(self, item):
+        # Cells of the board the item overlaps, as slices into the observation planes
+        grid = self.state.grid
+        col0, col1, row0, row1 = grid.cell_span(item.x, item.y, item.width, item.height)
+        col0 = max(col0 - grid.col_min, 0)
+        row0 = max(row0 - grid.row_min, 0)
+        col1 = min(col1 - grid.col_min, grid.cols - 1)
+        row1 = min(row1 - grid.row_min, grid.rows - 1)
+        return row0, row1 + 1, col0, col1 + 1
+
+    def draw(self, item, channel):
+        span = self.cell_span(item)
+        drawn = self.drawn.get(item)
+        if drawn == (channel, span):
+            return
+        if drawn is not None:
+            self.erase(item)
+        row0, row1, col0, col1 = span
+        self.observation[channel, row0:row1, col0:col1] += 1
+        self.drawn[item] = (channel, span)
+
+    def erase(self, item):
+        channel, (row0, row1, col0, col1) = self.drawn.pop(item)
+        self.observation[channel, row0:row1, col0:col1] -= 1
+
+    def sync(self):
+        state = self.state
+        grid = state.grid
+        obs = self.observation
+
+        # The engine's occupancy grid already has the body in the same cell layout
+        np.copyto(obs[CHANNEL["body"]], np.frombuffer(grid.snake, dtype=np.uint8).reshape(grid.rows, grid.cols))
+
+        head = grid.index_of(*state.head)
+        if head != self.head_drawn:
+            if self.head_drawn is not None:
+                obs[CHANNEL["head"]].flat[self.head_drawn] = 0
+            if head >= 0:
+                obs[CHANNEL["head"]].flat[head] = 1
+            self.head_drawn = head if head >= 0 else None
+
+        # Food and shield food are replaced when eaten, moving obstacles move: redraw only what changed
+        current = [(state.food, CHANNEL[state.food.kind])] if state.food else []
+        if state.shield_food:
+            current.append((state.shield_food, CHANNEL["shield_food"]))
+        for obstacle in state.obstacles[self.obstacles_drawn:]:
+            if obstacle.kind == "wall":
+                row0, row1, col0, col1 = self.cell_span(obstacle)
+                obs[CHANNEL["wall"], row0:row1, col0:col1] += 1
+        self.obstacles_drawn = len(state.obstacles)
+        current.extend((obstacle, CHANNEL["moving"]) for obstacle in state.moving_obstacles)
+
+        live = set()
+        for item, channel in current:
+            self.draw(item, channel)
+            live.add(item)
+        if len(live) != len(self.drawn):
+            for item in [item for item in self.drawn if item not in live]:
+                self.erase(item)
+
+        if state.shielded != self.shielded_drawn:
+            obs[CHANNEL["shielded"]].fill(state.shielded)
+            self.shielded_drawn = state.shielded
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the per-step overhead of the QtSnake environment")
+    parser.add_argument("--steps", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    env = SnakeEnv()
+    rng = random.Random(args.seed)
+    env.reset(args.seed)
+    episodes = 0
+    start = time.perf_counter()
+    for _ in range(args.steps):
+        observation, reward, terminated, truncated, info = env.step(rng.randrange(N_ACTIONS))
+        if terminated or truncated:
+            episodes += 1
+            env.reset()
+    elapsed = time.perf_counter() - start
+    print(f"{args.steps:,} steps in {elapsed:.2f} s ({elapsed / args.steps * 1e6:.1f} us/step), {episodes:,} episodes")
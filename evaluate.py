@@ -0,0 +1,181 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from engine import LEVEL_FILE, POLICIES, GameState, load_levels
+from levels import LevelError
+from stats import percentile
+
+# Evaluation harness for control policies. Seeded games are split into shards
+# and played headless with the full GameState rules on a process pool; results
+# stream back shard by shard and are aggregated into percentiles of score,
+# level reached and survival ticks. Shards that raise or take their worker down
+# are retried and reported as failed after MAX_RETRIES. Games follow the
+# levels of a level file, compiled once and handed to every worker as it starts.
+
+MAX_RETRIES = 2
+PERCENTILES = (5, 25, 50, 75, 95)
+
+worker_levels = None  # LevelSet the games of this worker follow, set by init_worker
+
+
+# Worker initializer: keep the level set sent along when the pool started the worker
+def init_worker(levels):
+    global worker_levels
+    worker_levels = levels
+
+
+# Play one seeded game to the end (or to max_ticks) and return its stats
+def play_game(policy_name, seed, max_ticks, levels=None):
+    policy = POLICIES[policy_name]
+    state = GameState(seed, levels)
+    rng = random.Random(seed)
+    while not state.over and state.tick_count < max_ticks:
+        direction = policy(state, rng)
+        if direction is not None:
+            state.change_direction(direction)
+        state.step()
+    return {
+        "policy": policy_name,
+        "seed": seed,
+        "score": state.score,
+        "level": state.level,
+        "ticks": state.tick_count,
+        "food": state.food_count,
+        "finished": state.over,
+    }
+
+
+# Worker entry point: one shard of seeds
+def play_shard(policy_name, seeds, max_ticks):
+    return [play_game(policy_name, seed, max_ticks, worker_levels) for seed in seeds]
+
+
+def summarize(results):
+    summary = {"games": len(results)}
+    for key in ("score", "level", "ticks"):
+        values = sorted(r[key] for r in results)
+        summary[key] = {f"p{p}": percentile(values, p) for p in PERCENTILES}
+        summary[key]["mean"] = sum(values) / len(values) if values else 0.0
+    return summary
+
+
+# Run shards on one pool, yielding each shard's results as it completes. Shards that fail
+# are added to `retry` with a flag telling whether the whole pool went down with them.
+def run_pool(shards, workers, max_ticks, levels, retry):
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(levels,))
+    futures = {executor.submit(play_shard, policy, seeds, max_ticks): (policy, seeds) for policy, seeds in shards}
+    try:
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                shard = futures.pop(future)
+                try:
+                    yield future.result()
+                except BrokenProcessPool:
+                    # A worker died: there is no telling which of the shards in flight took it down
+                    retry.append((shard, True))
+                    retry.extend((other, True) for other in futures.values())
+                    futures.clear()
+                    break
+                except Exception as e:
+                    print(f"Shard {shard[0]} seeds {shard[1][0]}..{shard[1][-1]} failed: {e}", file=sys.stderr)
+                    retry.append((shard, False))
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Run every shard, yielding results as they arrive. After a worker crash the shards that were in flight are
+# rerun one at a time, so that only the shard that crashes is charged; shards that keep failing end up in `failed`.
+def run_shards(shards, workers, max_ticks, levels, failed):
+    attempts = dict.fromkeys(shards, 0)
+    pending = list(shards)
+    isolate = False
+    while pending:
+        retry = []
+        if isolate:
+            for shard in pending:
+                yield from run_pool([shard], 1, max_ticks, levels, retry)
+        else:
+            yield from run_pool(pending, workers, max_ticks, levels, retry)
+
+        pending = []
+        for shard, crashed in retry:
+            if isolate or not crashed:
+                attempts[shard] += 1
+            if attempts[shard] > MAX_RETRIES:
+                failed.append(shard)
+            else:
+                pending.append(shard)
+        isolate = isolate or any(crashed for shard, crashed in retry)
+
+
+def print_summary(policy, summary):
+    print(f"\n{policy}: {summary['games']:,} games")
+    header = "".join(f"{name:>9}" for name in [f"p{p}" for p in PERCENTILES] + ["mean"])
+    print(f"{'':>8}{header}")
+    for key in ("score", "level", "ticks"):
+        row = "".join(f"{summary[key][name]:>9.1f}" for name in [f"p{p}" for p in PERCENTILES] + ["mean"])
+        print(f"{key:>8}{row}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate QtSnake policies over many seeded headless games")
+    parser.add_argument("--policy", nargs="+", choices=sorted(POLICIES), default=["greedy"], help="policies to compare")
+    parser.add_argument("--games", type=int, default=1000, help="games per policy")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game; game i uses seed + i")
+    parser.add_argument("--max-ticks", type=int, default=20000, help="stop games that run longer than this")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--shard-size", type=int, default=50, help="games per task sent to a worker")
+    parser.add_argument("--out", help="append one JSON line per game to this file as results arrive")
+    parser.add_argument("--levels", default=LEVEL_FILE, help="level file to play (JSON or TOML)")
+    args = parser.parse_args()
+
+    try:
+        levels = load_levels(args.levels)
+    except LevelError as e:
+        raise SystemExit(e)
+
+    seeds = list(range(args.seed, args.seed + args.games))
+    shards = [(policy, tuple(seeds[i:i + args.shard_size]))
+              for policy in args.policy
+              for i in range(0, len(seeds), args.shard_size)]
+    results = {policy: [] for policy in args.policy}
+    failed = []
+    out = open(args.out, "a") if args.out else None
+
+    start = time.perf_counter()
+    total = len(args.policy) * args.games
+    completed = 0
+    for shard_results in run_shards(shards, args.workers, args.max_ticks, levels, failed):
+        for result in shard_results:
+            results[result["policy"]].append(result)
+            if out:
+                out.write(json.dumps(result) + "\n")
+        completed += len(shard_results)
+        elapsed = time.perf_counter() - start
+        print(f"\r{completed:,}/{total:,} games, {elapsed:.1f} s", end="", file=sys.stderr, flush=True)
+    print(file=sys.stderr)
+    if out:
+        out.close()
+
+    elapsed = time.perf_counter() - start
+    ticks = sum(r["ticks"] for policy_results in results.values() for r in policy_results)
+    print(f"Played {completed:,} games ({ticks:,} ticks) in {elapsed:.2f} s on {args.workers} workers ({ticks / elapsed:,.0f} ticks/s)")
+    for policy in args.policy:
+        print_summary(policy, summarize(results[policy]))
+    if failed:
+        print(f"\n{len(failed)} shard(s) failed after {MAX_RETRIES} retries:")
+        for policy, shard_seeds in failed:
+            print(f"  {policy}: seeds {shard_seeds[0]}..{shard_seeds[-1]}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,255 @@
+import math
+
+# Integer grid model of the playfield. The board is split into cells the size of
+# a snake cube; the snake always sits exactly on cells, so any rectangle overlaps
+# a snake cube exactly when it overlaps that cube's cell. Occupancy is counted per
+# cell in flat bytearrays, updated incrementally as the snake and obstacles move,
+# which makes collision and spawn checks a handful of lookups whatever the length
+# of the snake. Empty cells inside the spawn area are also kept in a swap-remove
+# array, so a free spawn cell can be picked uniformly in O(1) however crowded
+# the board is.
+
+
+class OccupancyGrid:
+    # spawn_rect limits where free cells are indexed: a cell is spawnable when its top-left corner lies inside it
+    def __init__(self, rect, cell_size, spawn_rect=None):
+        left, top, width, height = rect
+        self.cell_size = cell_size
+        # Only cells that lie fully inside the playfield are stored
+        self.col_min = math.ceil(left / cell_size)
+        self.row_min = math.ceil(top / cell_size)
+        self.cols = math.floor((left + width) / cell_size) - self.col_min
+        self.rows = math.floor((top + height) / cell_size) - self.row_min
+        self.snake = bytearray(self.cols * self.rows)  # Snake cubes per cell
+        self.blocked = bytearray(self.cols * self.rows)  # Obstacles overlapping each cell
+        self.outside = {}  # Snake cubes outside the board (while invincible), keyed by (col, row)
+
+        sx, sy, sw, sh = spawn_rect or rect
+        self.spawnable = bytearray(self.cols * self.rows)
+        for index in range(self.cols * self.rows):
+            x, y = self.position_of(index)
+            self.spawnable[index] = sx <= x < sx + sw and sy <= y < sy + sh
+        self.reset_free_cells()
+
+    def clear(self):
+        self.snake = bytearray(self.cols * self.rows)
+        self.blocked = bytearray(self.cols * self.rows)
+        self.outside = {}
+        self.reset_free_cells()
+
+    def reset_free_cells(self):
+        self.free_cells = [index for index in range(self.cols * self.rows) if self.spawnable[index]]
+        self.free_slot = [-1] * (self.cols * self.rows)  # Position of each cell in free_cells, -1 when taken
+        for slot, index in enumerate(self.free_cells):
+            self.free_slot[index] = slot
+
+    def take_cell(self, index):
+        slot = self.free_slot[index]
+        if slot < 0:
+            return
+        last = self.free_cells.pop()
+        if last != index:
+            self.free_cells[slot] = last
+            self.free_slot[last] = slot
+        self.free_slot[index] = -1
+
+    def release_cell(self, index):
+        if self.spawnable[index] and self.free_slot[index] < 0:
+            self.free_slot[index] = len(self.free_cells)
+            self.free_cells.append(index)
+
+    # Top-left corner of a free spawn cell, picked uniformly, or None when the spawn area is full
+    def random_free_cell(self, rng):
+        if not self.free_cells:
+            return None
+        return self.position_of(self.free_cells[rng.randrange(len(self.free_cells))])
+
+    def position_of(self, index):
+        row, col = divmod(index, self.cols)
+        return (col + self.col_min) * self.cell_size, (row + self.row_min) * self.cell_size
+
+    def cell_index(self, col, row):
+        col -= self.col_min
+        row -= self.row_min
+        if 0 <= col < self.cols and 0 <= row < self.rows:
+            return row * self.cols + col
+        return -1
+
+    def cell_of(self, x, y):
+        return int(x // self.cell_size), int(y // self.cell_size)
+
+    # Index of the cell at a grid-aligned position such as a snake cube, -1 when off the board
+    def index_of(self, x, y):
+        col = x // self.cell_size - self.col_min
+        row = y // self.cell_size - self.row_min
+        if 0 <= col < self.cols and 0 <= row < self.rows:
+            return row * self.cols + col
+        return -1
+
+    # Range of cells a rectangle overlaps (edges that only touch a cell do not count)
+    def cell_span(self, x, y, width, height):
+        size = self.cell_size
+        return (math.floor(x / size), math.ceil((x + width) / size) - 1,
+                math.floor(y / size), math.ceil((y + height) / size) - 1)
+
+    def add_snake(self, x, y):
+        index = self.index_of(x, y)
+        if index >= 0:
+            self.snake[index] += 1
+            if self.snake[index] == 1:
+                self.take_cell(index)
+        else:
+            cell = self.cell_of(x, y)
+            self.outside[cell] = self.outside.get(cell, 0) + 1
+
+    def remove_snake(self, x, y):
+        index = self.index_of(x, y)
+        if index >= 0:
+            self.snake[index] -= 1
+            if not self.snake[index] and not self.blocked[index]:
+                self.release_cell(index)
+        else:
+            cell = self.cell_of(x, y)
+            count = self.outside[cell] - 1
+            if count:
+                self.outside[cell] = count
+            else:
+                del self.outside[cell]
+
+    def snake_at(self, x, y):
+        index = self.index_of(x, y)
+        if index >= 0:
+            return self.snake[index]
+        return self.outside.get(self.cell_of(x, y), 0)
+
+    def blocked_at(self, x, y):
+        index = self.index_of(x, y)
+        return index >= 0 and self.blocked[index] > 0
+
+    # Indices of the board cells a rectangle overlaps, row by row
+    def rect_cells(self, x, y, width, height):
+        return self.span_cells(*self.cell_span(x, y, width, height))
+
+    # Indices of the board cells in a cell span, as cell_span gives it
+    def span_cells(self, col0, col1, row0, row1):
+        col_min = self.col_min
+        row_min = self.row_min
+        cols = self.cols
+        col0 = max(col0, col_min) - col_min
+        col1 = min(col1, col_min + cols - 1) - col_min + 1
+        if col0 >= col1:
+            return []
+        cells = []
+        for row in range(max(row0, row_min) - row_min, min(row1, row_min + self.rows - 1) - row_min + 1):
+            start = row * cols
+            cells.extend(range(start + col0, start + col1))
+        return cells
+
+    def add_rect(self, x, y, width, height, amount=1):
+        self.add_cells(self.rect_cells(x, y, width, height), amount)
+
+    # Block cells given by index, once per time an index is listed, as add_rect does for a rectangle's cells
+    def add_cells(self, cells, amount=1):
+        blocked = self.blocked
+        for index in cells:
+            blocked[index] += amount
+            if blocked[index] == amount:
+                self.take_cell(index)  # First obstacle on this cell
+            elif not blocked[index] and not self.snake[index]:
+                self.release_cell(index)
+
+    # Start from precompiled walls (see levels.py) instead of adding them one by one: the blocked count of
+    # every cell, and the free cells with their slots. Only for a grid with no snake or obstacles yet
+    def load_walls(self, mask, free_cells, free_slot):
+        self.blocked = bytearray(mask)
+        self.free_cells = list(free_cells)
+        self.free_slot = list(free_slot)
+
+    def remove_rect(self, x, y, width, height):
+        self.add_rect(x, y, width, height, -1)
+
+    def rect_hits_snake(self, x, y, width, height):
+        col0, col1, row0, row1 = self.cell_span(x, y, width, height)
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                index = self.cell_index(col, row)
+                if index >= 0:
+                    if self.snake[index]:
+                        return True
+                elif self.outside.get((col, row)):
+                    return True
+        return False
+
+    def rect_free(self, x, y, width, height):
+        return not self.rect_blocked(x, y, width, height) and not self.rect_hits_snake(x, y, width, height)
+
+    # Cell-level test: may report a rectangle that shares a cell with an obstacle without touching it,
+    # but is exact for anything aligned to the grid, like the snake's head
+    def rect_blocked(self, x, y, width, height):
+        col0, col1, row0, row1 = self.cell_span(x, y, width, height)
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                index = self.cell_index(col, row)
+                if index >= 0 and self.blocked[index]:
+                    return True
+        return False
+
+
+# Uniform-grid spatial hash over the items on the board (food, shields, walls and
+# moving obstacles). Items are filed under every bucket their rectangle overlaps
+# and refiled only when a move takes them across a bucket edge, so a query only
+# looks at the few items near the queried rectangle. Snake cubes need no entry
+# here: the occupancy grid above already files them by cell.
+class SpatialHash:
+    def __init__(self, bucket_size):
+        self.bucket_size = bucket_size
+        self.buckets = {}  # (bx, by) -> set of items
+        self.spans = {}  # item -> bucket span it is filed under
+
+    def __len__(self):
+        return len(self.spans)
+
+    def __contains__(self, item):
+        return item in self.spans
+
+    def bucket_span(self, x, y, width, height):
+        size = self.bucket_size
+        return (math.floor(x / size), math.ceil((x + width) / size) - 1,
+                math.floor(y / size), math.ceil((y + height) / size) - 1)
+
+    def insert(self, item):
+        span = self.bucket_span(item.x, item.y, item.width, item.height)
+        self.spans[item] = span
+        bx0, bx1, by0, by1 = span
+        for by in range(by0, by1 + 1):
+            for bx in range(bx0, bx1 + 1):
+                bucket = self.buckets.get((bx, by))
+                if bucket is None:
+                    self.buckets[bx, by] = bucket = set()
+                bucket.add(item)
+
+    def remove(self, item):
+        bx0, bx1, by0, by1 = self.spans.pop(item)
+        for by in range(by0, by1 + 1):
+            for bx in range(bx0, bx1 + 1):
+                bucket = self.buckets[bx, by]
+                bucket.discard(item)
+                if not bucket:
+                    del self.buckets[bx, by]
+
+    # Call after changing an item's position
+    def update(self, item):
+        if self.spans[item] != self.bucket_span(item.x, item.y, item.width, item.height):
+            self.remove(item)
+            self.insert(item)
+
+    # Items whose rectangle overlaps the given one
+    def query(self, x, y, width, height):
+        bx0, bx1, by0, by1 = self.bucket_span(x, y, width, height)
+        found = []
+        for by in range(by0, by1 + 1):
+            for bx in range(bx0, bx1 + 1):
+                for item in self.buckets.get((bx, by), ()):
+                    if item not in found and item.overlaps(x, y, width, height):
+                        found.append(item)
+        return found
@@ -0,0 +1,164 @@
+import atexit
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+# Leaderboard and score history. Every finished run is stored in a SQLite
+# database in WAL mode, so a crash mid-write leaves the last committed runs
+# intact. The GUI thread never touches the database, nor waits for it: a
+# background thread opens it and loads an in-memory cache of the top runs
+# (overall and per level reached), setting `loaded` when the cache is there.
+# record() only queues the run; the thread adds it to the cache, answers with
+# its Standing through the given callback, and writes whatever is queued in
+# one transaction. The menu reads from the cache once `loaded` is set.
+
+TOP_N = 10  # Runs kept in the cache per board
+BATCH_WAIT = 0.25  # Seconds the writer waits for more runs before committing a batch
+LEGACY_FILE = "snake_highscore.json"  # Single high score of older versions, imported into an empty database
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    score INTEGER NOT NULL,
+    level INTEGER,
+    food INTEGER,
+    duration_ms INTEGER,
+    ticks INTEGER,
+    seed INTEGER,
+    finished_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_by_score ON runs (score DESC);
+CREATE INDEX IF NOT EXISTS runs_by_level ON runs (level, score DESC);
+"""
+COLUMNS = "score, level, food, duration_ms, ticks, seed, finished_at"
+
+Run = namedtuple("Run", COLUMNS.split(", "))
+Standing = namedtuple("Standing", "run new_high_score high_score level_best")  # Where a recorded run ended up
+
+
+def connect(path):
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL, only the last commits can be lost on power failure
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class Leaderboard:
+    def __init__(self, path, top_n=TOP_N):
+        self.path = path
+        self.top_n = top_n
+        self.boards = {}  # None (all runs) or level reached -> best runs, highest score first
+        self.queue = queue.Queue()
+        self.loaded = threading.Event()  # Set once the boards are loaded, or the database failed to open
+        self.writer = threading.Thread(target=self.write_runs, name="leaderboard-writer", daemon=True)
+        self.writer.start()
+        atexit.register(self.close)  # The writer is a daemon thread, so flush the queue before the interpreter goes
+
+    # Bring over the high score of snake_highscore.json the first time the database is used
+    def import_legacy(self, connection):
+        if connection.execute("SELECT 1 FROM runs LIMIT 1").fetchone() or not os.path.exists(LEGACY_FILE):
+            return
+        try:
+            with open(LEGACY_FILE) as f:
+                score = json.load(f).get("high_score", 0)
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"Error importing {LEGACY_FILE}: {e}")
+            return
+        if score > 0:
+            with connection:
+                connection.execute("INSERT INTO runs (score, finished_at) VALUES (?, ?)", (score, os.path.getmtime(LEGACY_FILE)))
+
+    def load(self, connection):
+        boards = {}
+        rows = connection.execute(f"SELECT {COLUMNS} FROM runs ORDER BY score DESC, id LIMIT ?", (self.top_n,))
+        boards[None] = [Run(*row) for row in rows]
+        rows = connection.execute(f"""
+            SELECT {COLUMNS} FROM (
+                SELECT *, ROW_NUMBER() OVER (PARTITION BY level ORDER BY score DESC, id) AS rank
+                FROM runs WHERE level IS NOT NULL)
+            WHERE rank <= ? ORDER BY level, score DESC""", (self.top_n,))
+        for row in rows:
+            run = Run(*row)
+            boards.setdefault(run.level, []).append(run)
+        self.boards = boards  # Swapped in whole, so readers see either no board or all of them
+
+    # Best runs, overall or among the runs that ended on a given level
+    def top(self, n=None, level=None):
+        return self.boards.get(level, [])[:n or self.top_n]
+
+    @property
+    def high_score(self):
+        board = self.boards.get(None)
+        return board[0].score if board else 0
+
+    # Queue a finished run. The writer thread ranks it once the boards are loaded and
+    # calls done(standing) from that thread, so the GUI never waits on the database
+    def record(self, score, level, food, duration_ms, ticks, seed, done=None):
+        run = Run(score, level, food, duration_ms, ticks, seed, time.time())
+        self.queue.put((run, done))
+        return run
+
+    # Add a run to the boards (writer thread); each board is replaced whole, so readers never see one half sorted
+    def add(self, run):
+        high_score = self.high_score
+        for key in (None, run.level):
+            board = self.boards.get(key, []) + [run]
+            board.sort(key=lambda r: r.score, reverse=True)  # Stable, so older runs stay ahead on ties
+            self.boards[key] = board[:self.top_n]
+        return Standing(run, run.score > high_score, self.high_score, self.top(1, level=run.level)[0])
+
+    # Writer thread: loads the boards, then for each run that arrives ranks it, answers, gathers any
+    # runs that follow within BATCH_WAIT and commits them together. Without a database the runs are
+    # still ranked, just not saved.
+    def write_runs(self):
+        connection = None
+        try:
+            connection = connect(self.path)
+            self.import_legacy(connection)
+            self.load(connection)
+        except sqlite3.Error as e:
+            print(f"Error loading leaderboard: {e}")
+            if connection is not None:
+                connection.close()
+            connection = None
+        self.loaded.set()
+        running = True
+        while running:
+            batch = []
+            item = self.queue.get()
+            while item is not None:
+                run, done = item
+                standing = self.add(run)
+                if done is not None:
+                    try:
+                        done(standing)
+                    except Exception as e:
+                        print(f"Error reporting a leaderboard run: {e}")
+                batch.append(run)
+                try:
+                    item = self.queue.get(timeout=BATCH_WAIT)
+                except queue.Empty:
+                    break
+            if item is None:
+                running = False
+            if not batch or connection is None:
+                continue
+            try:
+                with connection:
+                    connection.executemany(f"INSERT INTO runs ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+            except sqlite3.Error as e:
+                print(f"Error saving {len(batch)} run(s) to the leaderboard: {e}")
+        if connection is not None:
+            connection.close()
+
+    # Write out the queued runs and stop the writer, for a clean exit
+    def close(self):
+        if self.writer is not None:
+            self.queue.put(None)
+            self.writer.join()
+            self.writer = None
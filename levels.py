@@ -0,0 +1,288 @@
+import hashlib
+import json
+import os
+import struct
+import sys
+from array import array
+
+from engine import (
+    BASE_INTERVAL,
+    CELL_SIZE,
+    FOOD_WEIGHTS,
+    MIN_INTERVAL,
+    POINTS_TO_NEXT_LEVEL,
+    SCENE_RECT,
+    SPAWN_RECT,
+    food_table,
+)
+from grid import OccupancyGrid
+
+# Level files. A level set describes how a game gets harder: the walls that
+# appear at each level, extra moving obstacles, the speed curve and the odds
+# of each food type. Files are JSON, or TOML with the same keys:
+#
+#   {
+#     "name": "Classic",
+#     "food_per_level": 5,                             food to eat per level
+#     "speed": {"base": 150, "step": 10, "min": 70},   ms per tick: base - (level - 1) * step, at least min
+#     "food": {"golden": 10, "normal": 90},            relative odds of the food types, in draw order
+#     "moving": {"every_levels": 2, "every_food": 5},  a moving obstacle every Nth level and every Nth food
+#     "levels": {
+#       "5": {"walls": [[-300, -100, 150, 20]]},       x, y, width, height
+#       "8": {"interval": 90, "moving": 2, "food": {"golden": 30, "normal": 70}}
+#     }
+#   }
+#
+# Everything is optional. A level's walls appear when it is reached (those of
+# level 1 at the start), "moving" adds that many moving obstacles then,
+# "interval" replaces the speed curve for that level only, and "food" sets the
+# odds from that level on.
+#
+# Loading compiles every level once against the board's cell grid: the cells
+# its walls cover, in the order OccupancyGrid.add_rect would block them, and
+# the occupancy mask and free spawn cells with all the walls up to it. A new
+# game then copies the mask of level 1 instead of filing walls cell by cell,
+# and a level-up blocks a ready list of cells. The compiled arrays are cached
+# in CACHE_DIR, so large levels are only compiled again when they change. A
+# cache file holds plain data:
+#
+#   magic b"QSLC", header length (u32, little-endian), a JSON header with the
+#   layout version, the sha256 of the level file, the board geometry, the
+#   byte order and the number of board cells and of the cells and free cells
+#   of each level, then per level the raw bytes of cells ("I"), mask, free
+#   cells ("I") and free slots ("i")
+#
+# A file whose header does not match the level file and board is compiled
+# again, as is one whose arrays do not fit the header.
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "level_cache")
+CACHE_MAGIC = b"QSLC"
+CACHE_VERSION = 1  # Layout of the cache files
+CACHE_GEOMETRY = json.loads(json.dumps((SCENE_RECT, CELL_SIZE, SPAWN_RECT)))  # As read back from a header
+
+
+class LevelError(Exception):
+    pass
+
+
+class Level:
+    def __init__(self, number, walls, moving, interval, food):
+        self.number = number
+        self.walls = walls  # (x, y, width, height) of the walls added on reaching this level
+        self.moving = moving  # Moving obstacles added on reaching this level
+        self.interval = interval  # ms per tick at this level
+        self.food = food  # Food table (see engine.food_table) at this level
+        self.cells = array("I")  # Cells the new walls cover, once per wall covering them
+        self.mask = b""  # Walls covering each cell, with every wall up to this level
+        self.free_cells = array("I")  # Spawn cells no wall covers, in index order, and the slot of every cell
+        self.free_slot = array("i")  # in free_cells (-1 when not free), as OccupancyGrid keeps them
+
+
+class LevelSet:
+    def __init__(self, path, digest, data):
+        self.path = path
+        self.digest = digest  # sha256 of the file, identifies the rules a replay was played with
+        self.name = data.get("name", os.path.splitext(os.path.basename(path))[0])
+        self.food_per_level = positive(data.get("food_per_level", POINTS_TO_NEXT_LEVEL), "food_per_level")
+        speed = data.get("speed", {})
+        self.base_interval = positive(speed.get("base", BASE_INTERVAL), "speed.base")
+        self.interval_step = count(speed.get("step", 10), "speed.step")
+        self.min_interval = positive(speed.get("min", MIN_INTERVAL), "speed.min")
+        moving = data.get("moving", {})
+        self.moving_every_levels = count(moving.get("every_levels", 0), "moving.every_levels")  # 0: never
+        self.moving_every_food = count(moving.get("every_food", 0), "moving.every_food")
+
+        numbered = {}
+        for key, level in data.get("levels", {}).items():
+            try:
+                number = int(key)
+            except ValueError:
+                raise LevelError(f"Level {key!r} is not a number")
+            if number < 1:
+                raise LevelError(f"Level {number} is not a positive number")
+            numbered[number] = level
+        # Levels 1 to the last one of the file; later levels only speed up, with the odds of the last one
+        self.levels = [None]
+        food = parse_food(data.get("food", FOOD_WEIGHTS), "food")
+        for number in range(1, max(numbered, default=1) + 1):
+            level = numbered.get(number, {})
+            name = f"levels.{number}"
+            if "food" in level:
+                food = parse_food(level["food"], f"{name}.food")
+            interval = level.get("interval")
+            interval = self.curve_interval(number) if interval is None else positive(interval, f"{name}.interval")
+            walls = [parse_wall(wall, f"{name}.walls") for wall in level.get("walls", ())]
+            moving = count(level.get("moving", 0), f"{name}.moving")
+            self.levels.append(Level(number, walls, moving, interval, food))
+
+    def curve_interval(self, number):
+        return max(self.min_interval, self.base_interval - (number - 1) * self.interval_step)
+
+    # Compiled level, or None past the last level of the file, which brings no walls or obstacles
+    def get(self, number):
+        return self.levels[number] if number < len(self.levels) else None
+
+    def interval(self, number):
+        level = self.get(number)
+        return level.interval if level is not None else self.curve_interval(number)
+
+    def food_table(self, number):
+        return self.levels[min(number, len(self.levels) - 1)].food
+
+    def compile(self):
+        grid = OccupancyGrid(SCENE_RECT, CELL_SIZE, SPAWN_RECT)
+        spawnable = grid.spawnable
+        for level in self.levels[1:]:
+            level.cells = array("I")
+            level.free_cells = array("I")
+            for wall in level.walls:
+                level.cells.extend(grid.rect_cells(*wall))
+            for index in level.cells:
+                if grid.blocked[index] == 255:
+                    raise LevelError(f"More than 255 walls cover one cell at level {level.number}")
+                grid.blocked[index] += 1
+            level.mask = bytes(grid.blocked)
+            level.free_slot = array("i", [-1]) * len(spawnable)
+            for index in range(len(spawnable)):
+                if spawnable[index] and not grid.blocked[index]:
+                    level.free_slot[index] = len(level.free_cells)
+                    level.free_cells.append(index)
+
+
+def positive(value, name):
+    if not isinstance(value, int) or value <= 0:
+        raise LevelError(f"{name} must be a whole number above 0")
+    return value
+
+
+def count(value, name):
+    if not isinstance(value, int) or value < 0:
+        raise LevelError(f"{name} must be a whole number, at least 0")
+    return value
+
+
+def parse_wall(wall, name):
+    if len(wall) != 4 or not all(isinstance(v, (int, float)) for v in wall) or wall[2] <= 0 or wall[3] <= 0:
+        raise LevelError(f"{name}: a wall is [x, y, width, height], got {wall!r}")
+    return tuple(wall)
+
+
+def parse_food(weights, name):
+    for kind, weight in weights.items():
+        if kind not in FOOD_WEIGHTS:  # Food types that spawn as food; shields spawn on their own
+            raise LevelError(f"{name}: unknown food type {kind!r}")
+        if not isinstance(weight, (int, float)) or weight < 0:
+            raise LevelError(f"{name}: the odds of {kind} must be a number, at least 0")
+    if not sum(weights.values()):
+        raise LevelError(f"{name}: no food type can come up")
+    return food_table(weights)
+
+
+def parse(path, source):
+    try:
+        if path.endswith(".toml"):
+            try:
+                import tomllib  # Python 3.11+, only loaded for TOML level files
+            except ImportError:
+                raise LevelError("TOML level files need Python 3.11 or later, use JSON instead")
+            return tomllib.loads(source.decode())
+        return json.loads(source)
+    except (ValueError, UnicodeDecodeError) as e:  # Both decode errors are ValueErrors
+        raise LevelError(f"{path}: {e}")
+
+
+# Compiled arrays of a level set from a cache file; False if the file was written for another level file or board.
+# Raises ValueError when the file is damaged
+def read_cache(path, level_set):
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:4] != CACHE_MAGIC:
+        raise ValueError("not a level cache file")
+    (length,) = struct.unpack_from("<I", data, 4)
+    header = json.loads(data[8:8 + length])
+    if (header.get("version") != CACHE_VERSION or header.get("source") != level_set.digest
+            or header.get("geometry") != CACHE_GEOMETRY or header.get("byteorder") != sys.byteorder):
+        return False
+    size = header["cells"]
+    counts = header["levels"]
+    if len(counts) != len(level_set.levels) - 1:
+        raise ValueError("wrong number of levels")
+    offset = 8 + length
+
+    def take(typecode, count):
+        nonlocal offset
+        values = array(typecode)
+        end = offset + values.itemsize * count
+        if count < 0 or end > len(data):
+            raise ValueError("file is truncated")
+        values.frombytes(data[offset:end])
+        offset = end
+        return values
+
+    for level, (cells, free_cells) in zip(level_set.levels[1:], counts):
+        level.cells = take("I", cells)
+        level.mask = take("B", size).tobytes()
+        level.free_cells = take("I", free_cells)
+        level.free_slot = take("i", size)
+        if max(level.cells, default=0) >= size or max(level.free_cells, default=0) >= size:
+            raise ValueError("cell index out of range")
+    if offset != len(data):
+        raise ValueError("unexpected data after the levels")
+    return True
+
+
+def write_cache(path, level_set):
+    levels = level_set.levels[1:]
+    header = json.dumps({
+        "version": CACHE_VERSION,
+        "source": level_set.digest,
+        "geometry": CACHE_GEOMETRY,
+        "byteorder": sys.byteorder,
+        "cells": len(levels[0].mask),
+        "levels": [[len(level.cells), len(level.free_cells)] for level in levels],
+    }).encode()
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(CACHE_MAGIC + struct.pack("<I", len(header)) + header)
+        for level in levels:
+            f.write(level.cells.tobytes())
+            f.write(level.mask)
+            f.write(level.free_cells.tobytes())
+            f.write(level.free_slot.tobytes())
+    os.replace(temp_path, path)
+
+
+# Compiled level set of a file, with the arrays from the cache when it was compiled before. Raises LevelError
+def load_level_set(path):
+    try:
+        with open(path, "rb") as f:
+            source = f.read()
+    except OSError as e:
+        raise LevelError(f"Cannot read {path}: {e}")
+    data = parse(path, source)
+    try:
+        level_set = LevelSet(path, hashlib.sha256(source).hexdigest(), data)
+    except LevelError as e:
+        raise LevelError(f"{path}: {e}")
+    except (AttributeError, TypeError) as e:  # Sections of the wrong type, like a list for "speed"
+        raise LevelError(f"{path}: malformed level file ({e})")
+
+    key = hashlib.sha256(json.dumps(CACHE_GEOMETRY).encode() + source).hexdigest()
+    cache_path = os.path.join(CACHE_DIR, key + ".bin")
+    try:
+        if read_cache(cache_path, level_set):
+            return level_set
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, KeyError, TypeError, struct.error) as e:  # A damaged cache file is compiled again
+        print(f"Ignoring level cache {cache_path}: {e}")
+    try:
+        level_set.compile()
+    except LevelError as e:
+        raise LevelError(f"{path}: {e}")
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        write_cache(cache_path, level_set)
+    except OSError as e:
+        print(f"Cannot cache compiled levels: {e}")
+    return level_set
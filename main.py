@@ -1,7 +1,11 @@
-import json
+import startup  # First, so its clock starts before the imports below
+
+import argparse
+import math
 import os
 import random
 import sys
+from collections import deque
 
 # Set QT_PLUGIN_PATH for multimedia backends
 try:
@@ -12,22 +16,40 @@ except ImportError:
     pass
 
 
-from PySide6.QtGui import QBrush, QColor
+from PySide6.QtGui import QColor, QPen
 from PySide6.QtWidgets import (
     QApplication,
+    QGraphicsItem,
     QGraphicsScene,
     QGraphicsView,
     QMainWindow,
     QMessageBox,
     QGraphicsRectItem,
 )
-from PySide6.QtUiTools import QUiLoader
 from PySide6 import QtCore, QtWidgets
-from PySide6.QtMultimedia import QSoundEffect
-from PySide6.QtCore import QUrl
+from PySide6.QtCore import QRect, QRectF
+
+from autopilot import Autopilot
+from engine import CELL_SIZE, LEVEL_FILE, POLICIES, SCENE_RECT, GameState, load_levels, run_headless
+from levels import LevelError
+from leaderboard import Leaderboard
+from palette import PALETTE, brush
+from profiler import EVENTS, RENDER, Profiler
+from replay import Replay
+from scheduler import Scheduler
+from sound import SoundManager
+from uicache import FoundWidgets, load_window
+
+startup.mark("imports")
+
 
 
 
+MAX_STEPS_PER_FRAME = 5  # Catch-up limit for the fixed-timestep loop
+ATTRACT_DELAY = 30000  # ms of inactivity in the menu before the autopilot plays a demo game
+PROFILE_OVERLAY_FRAMES = 15  # Frames between refreshes of the profiler overlay
+LEADERBOARD_POLL = 50  # ms between checks for the leaderboard to finish loading
+
 
 # Function to get the resource path for loading UI files
 def get_resource_path(path):
@@ -38,73 +60,6 @@ def get_resource_path(path):
     return os.path.join(base_path, path)
 
 
-def move_items_while_respecting_border(item, scene, snake_cubes, obstacles, move_obstacles=True):
-    # Foods and obstacles can move for added challenge (food moves appears in level 3, obstacle moves appears in level 4)
-
-    if isinstance(item, Obstacle) and not move_obstacles:
-        return
-
-    # Initialize velocity if not set
-    if getattr(item, 'vx', 0) == 0 and getattr(item, 'vy', 0) == 0:
-        speed = getattr(item, 'speed', 2)
-        if random.random() < 0.5:
-            item.vx = random.choice([-1, 1]) * speed
-            item.vy = 0
-        else:
-            item.vx = 0
-            item.vy = random.choice([-1, 1]) * speed
-
-        # Start timer to change direction every 2 seconds, for randomness in movement
-        if not getattr(item, '_direction_timer_set', False):
-            item._direction_timer_set = True
-            def change_direction():
-                 if not item.scene():
-                    return  # Stop if item is no longer in the scene to prevent runtime errors
-                    if hasattr(item, 'vx') and hasattr(item, 'vy'):
-                        if random.random() < 0.5:
-                            item.vx = random.choice([-1, 1]) * speed
-                            item.vy = 0
-                        else:
-                            item.vx = 0
-                            item.vy = random.choice([-1, 1]) * speed
-                    QtCore.QTimer.singleShot(2000, change_direction)  
-                 QtCore.QTimer.singleShot(2000, change_direction)
-
-    # Set new position
-    new_x = item.x() + item.vx
-    new_y = item.y() + item.vy
-
-    rect = item.sceneBoundingRect()
-    scene_rect = scene.sceneRect()
-
-    # Respect screen bounds left/right
-    if new_x < scene_rect.left():
-        new_x = scene_rect.left()
-        item.vx = -item.vx
-    elif new_x + rect.width() > scene_rect.right():
-        new_x = scene_rect.right() - rect.width()
-        item.vx = -item.vx
-
-    # Respect screen bounds top/bottom
-    if new_y < scene_rect.top():
-        new_y = scene_rect.top()
-        item.vy = -item.vy
-    elif new_y + rect.height() > scene_rect.bottom():
-        new_y = scene_rect.bottom() - rect.height()
-        item.vy = -item.vy
-
-    for cube in snake_cubes:
-        if item.collidesWithItem(cube):
-            item.vx = -item.vx
-            item.vy = -item.vy
-            new_x = max(scene_rect.left(), min(new_x, scene_rect.right() - rect.width()))
-            new_y = max(scene_rect.top(), min(new_y, scene_rect.bottom() - rect.height()))
-            break
-
-    # Move to new position
-    item.setX(new_x)
-    item.setY(new_y)
-
 # Class representing Food item for the snake to consume
 class Food(QGraphicsRectItem):
     def __init__(self, food_type="normal"):
@@ -112,218 +67,325 @@ class Food(QGraphicsRectItem):
         self.height = 15
         super().__init__(0, 0, self.width, self.height)
         self.food_type = food_type
-        self.vx = 0  # horizontal velocity
-        self.vy = 0  # vertical velocity
-
-        if food_type == "golden":
-            self.setBrush(QBrush(QColor("gold")))
-            self.points = 3
-        elif food_type == "speed_boost":
-            self.setBrush(QBrush(QColor("cyan")))
-            self.points = 1
-        elif food_type == "slow_down":
-            self.setBrush(QBrush(QColor("blue")))
-            self.points = 1
-        elif food_type == "shield":
-            self.setBrush(QBrush(QColor("purple")))
-            self.points = 0  # shield does not give score
-        else:
-            self.setBrush(QBrush(QColor("orange")))
-            self.points = 1
-
-    # Call to move food
-    def move_food(self, scene, snake_cubes, obstacles):
-        move_items_while_respecting_border(self, scene, snake_cubes, self, obstacles)
-
-# Class representing individual SnakeCube (each segment of the snake)
-class SnakeCube(QGraphicsRectItem):
-    def __init__(self):
-        self.width = 15
-        self.height = 15
-        super().__init__(0, 0, self.width, self.height)  # x, y are set later
-        self.setBrush(QBrush(QColor("green")))
+        self.source = None  # Engine item this graphic follows
+        self.setBrush(brush(food_type if food_type in PALETTE else "normal"))
 
 # Class representing Obstacle
 class Obstacle(QGraphicsRectItem):
-    def __init__(self, x, y, width=30, height=30, obstacle_type="moving", speed=1):
-        super().__init__(x, y, width, height)
+    def __init__(self, width=30, height=30, obstacle_type="moving"):
+        super().__init__(0, 0, width, height)  # x, y are set later
         self.obstacle_type = obstacle_type
-        self.speed = speed
-        self.vx = 0
-        self.vy = 0
-
-
-        if obstacle_type == "wall":
-            self.setBrush(QBrush(QColor("gray")))
-        else:
-            self.setBrush(QBrush(QColor("red")))  # moving obstacles
-
-
+        self.source = None  # Engine item this graphic follows
+        self.setBrush(brush("wall" if obstacle_type == "wall" else "moving"))
         self.setPen(QtCore.Qt.NoPen)
 
-
-    def move_obstacle(self, scene, snake_cubes, food, obstacles):
-        move_items_while_respecting_border(self, scene, snake_cubes, food, obstacles)
-
-# Class representing the Snake and its behavior
-class Snake(QtWidgets.QGraphicsScene):
+# Graphics item drawing every moving obstacle in one paint() call, from the packed positions of the state's
+# Movers. A sync reads all of them in one pass and only invalidates the rects of the obstacles that moved,
+# where they were and where they are now. Walls stay put and keep their own Obstacle items; the item goes
+# into the scene with the first moving obstacle, so it stacks with the walls as that obstacle's item did.
+class MovingObstacles(QGraphicsItem):
     def __init__(self):
         super().__init__()
-        self.score = 0
-        self.direction = (1, 0)  # Start moving right
-        self.cube_list = [SnakeCube() for i in range(2)]  # Snake is initially 2 cubes large
-        self.color = "green"  # Default color
-        self.apply_color()    # Apply initial color
-        self.move()
-
+        left, top, width, height = SCENE_RECT
+        self.bounds = QRectF(left, top, width, height)  # Movers stay on the playfield
+        self.rects = []  # (x, y, width, height) of each obstacle where it was last drawn
+
+    def boundingRect(self):
+        return self.bounds
+
+    # Follow the movers, drawn `alpha` of the way from their last position to the current one
+    def sync(self, movers, alpha):
+        rects = []
+        xs, ys, prev_xs, prev_ys = movers.x, movers.y, movers.prev_x, movers.prev_y
+        widths, heights, blocks = movers.width, movers.height, movers.blocks
+        for slot in range(len(movers)):
+            if blocks[slot]:  # The food moves too, but has a Food item of its own
+                prev_x = prev_xs[slot]
+                prev_y = prev_ys[slot]
+                rects.append((prev_x + (xs[slot] - prev_x) * alpha, prev_y + (ys[slot] - prev_y) * alpha,
+                              widths[slot], heights[slot]))
+        drawn = self.rects
+        if rects == drawn:
+            return
+        for index, rect in enumerate(rects):
+            if index >= len(drawn):
+                self.update(QRectF(*rect))
+            elif drawn[index] != rect:
+                self.update(QRectF(*drawn[index]))
+                self.update(QRectF(*rect))
+        self.rects = rects
+
+    def paint(self, painter, option, widget=None):
+        if not self.rects:
+            return
+        painter.setPen(QtCore.Qt.NoPen)
+        painter.setBrush(brush("moving"))
+        painter.drawRects([QRectF(*rect) for rect in self.rects])
+
+# Graphics item drawing the whole snake body in one paint() call. It keeps its own copy of the body's cells
+# (with a count per cell, as cubes can overlap), so a sync only invalidates the cells that changed: the new
+# head, the cells the tail left and the cell the head was drawn at between two steps.
+class Snake(QGraphicsItem):
+    def __init__(self):
+        super().__init__()
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)  # paint() gets the exposed rect to redraw
+        # Qt keeps the drawn snake in a pixmap and only repaints the parts of it that were invalidated;
+        # other items moving over the snake are redrawn from the pixmap without calling paint()
+        self.setCacheMode(QGraphicsItem.DeviceCoordinateCache)
+        self.drawn = deque()  # Head first, like the state's body
+        self.cells = {}  # (x, y) -> number of cubes on that cell
+        self.rects = {}  # (x, y) -> QRect of the cube on that cell, drawn in batches
+        self.columns = {}  # x -> number of cubes in that column, for the bounding rect
+        self.rows = {}  # y -> number of cubes in that row
+        self.heads_pushed = 0  # The state's head counter at the last sync
+        self.head_pos = None  # Where the head is drawn, between its last two cells while interpolating
+        self.bounds = QRectF()
+        self.role = "snake"  # Palette role, "snake_shielded" while shielded
+        self.pen = QPen(QColor("black"))
+
+    def boundingRect(self):
+        return self.bounds
+
+    def cube_rect(self, x, y):
+        # A cube plus the half of its outline that falls outside
+        return QRectF(x - 1, y - 1, 17, 17)
+
+    def add_cell(self, x, y):
+        count = self.cells.get((x, y), 0)
+        if not count:
+            self.rects[(x, y)] = QRect(x, y, CELL_SIZE, CELL_SIZE)
+        self.cells[(x, y)] = count + 1
+        self.columns[x] = self.columns.get(x, 0) + 1
+        self.rows[y] = self.rows.get(y, 0) + 1
+
+    def remove_cell(self, x, y):
+        if self.cells[(x, y)] == 1:
+            del self.rects[(x, y)]
+        for counts, key in ((self.cells, (x, y)), (self.columns, x), (self.rows, y)):
+            if counts[key] == 1:
+                del counts[key]
+            else:
+                counts[key] -= 1
 
-    def move(self):
-        head = self.cube_list[0]
-        tail = self.cube_list[-1]
-        tail.setX(head.x() + self.direction[0] * head.width)  # Set tail position based on direction snake is heading
-        tail.setY(head.y() + self.direction[1] * head.height)
-        self.cube_list.insert(0, self.cube_list.pop())  # Insert tail at the beginning and remove from end
+    def sync(self, body, heads_pushed):
+        # Only the cubes added at the head since the last sync and the ones that fell off the tail change
+        new_heads = min(heads_pushed - self.heads_pushed, len(body))
+        self.heads_pushed = heads_pushed
+        if not new_heads and len(self.drawn) == len(body):
+            return
+        dirty = []
+        if new_heads and self.drawn:
+            dirty.append(self.drawn[0])  # The old head's cell, only partly covered while the head moved into it
+        for _ in range(len(self.drawn) + new_heads - len(body)):
+            x, y = self.drawn.pop()
+            self.remove_cell(x, y)
+            dirty.append((x, y))
+        for i in range(new_heads - 1, -1, -1):
+            x, y = body[i]
+            self.drawn.appendleft((x, y))
+            self.add_cell(x, y)
+            dirty.append((x, y))
+        if self.head_pos is not None:
+            dirty.append(self.head_pos)  # Where the old head was drawn mid-move
+        self.head_pos = body[0] if body else None
+
+        # The bounding rect only changes when a column or row of the board gains or loses its first cube
+        if self.cells:
+            left, top = min(self.columns), min(self.rows)
+            bounds = QRectF(left - 1, top - 1, max(self.columns) - left + 17, max(self.rows) - top + 17)
+        else:
+            bounds = QRectF()
+        if bounds != self.bounds:
+            self.prepareGeometryChange()
+            self.bounds = bounds
+            self.update()  # The cached pixmap is laid out on the bounding rect: redraw it whole
+            return
+        for x, y in dirty:
+            self.update(self.cube_rect(x, y))
 
+    # Draw the head at (x, y), e.g. part of the way to its next cell
+    def set_head_pos(self, x, y):
+        if self.head_pos is None or (x, y) == self.head_pos:
+            return
+        self.update(self.cube_rect(*self.head_pos))
+        self.head_pos = (x, y)
+        self.update(self.cube_rect(x, y))
 
-    def grow(self):
-        new_cube = SnakeCube()
-        self.cube_list.append(new_cube)
-        self.apply_color()  # Ensure new cube matches snake color (so that if they have shield(purple), the colors match)
-        self.move()
+    def paint(self, painter, option, widget=None):
+        if not self.drawn:
+            return
+        painter.setPen(self.pen)
+        painter.setBrush(brush(self.role))
+        head = self.drawn[0]
+
+        # Repaints of the item cache are clipped to the invalidated cells: look up the cells under them
+        # instead of walking the whole body, unless that would cover about as many cells anyway
+        exposed = [QRectF(rect) for rect in painter.clipRegion()] if painter.hasClipping() else [option.exposedRect]
+        cells = set()
+        for rect in exposed:
+            left = math.floor((rect.left() - 1) / CELL_SIZE) * CELL_SIZE
+            top = math.floor((rect.top() - 1) / CELL_SIZE) * CELL_SIZE
+            columns = range(left, math.ceil(rect.right() + 1), CELL_SIZE)
+            rows = range(top, math.ceil(rect.bottom() + 1), CELL_SIZE)
+            if len(cells) + len(columns) * len(rows) >= len(self.cells):
+                cells = self.cells
+                break
+            cells.update((x, y) for y in rows for x in columns if (x, y) in self.cells)
+        # The head's own cube is drawn last, where set_head_pos put it
+        rects = self.rects
+        painter.drawRects([rects[cell] for cell in cells if cell != head or self.cells[head] > 1])
+        painter.drawRect(QRectF(self.head_pos[0], self.head_pos[1], CELL_SIZE, CELL_SIZE))
+
+    # Recoloring is one brush swap and a repaint, whatever the length of the snake
+    def set_role(self, role):
+        if role == self.role:
+            return
+        self.role = role
+        self.update()
 
 
-    def change_direction(self, direction):
-        dx, dy = direction
-        if (dx, dy) != (-self.direction[0], -self.direction[1]):  # Prevent snake from going in the opposite direction
-            self.direction = (dx, dy)
-    
-    def set_color(self, color):
-        self.color = color
-        self.apply_color()
 
-    def apply_color(self):
-        for cube in self.cube_list:
-            cube.setBrush(QBrush(QColor(self.color)))
 
+# Marks the first frame painted in a widget for --startup-profile, then prints the startup breakdown and quits
+class FirstFrame(QtCore.QObject):
+    def eventFilter(self, watched, event):
+        if event.type() == QtCore.QEvent.Paint:
+            watched.removeEventFilter(self)
+            QtCore.QTimer.singleShot(0, self.painted)  # Runs once the paint event is done
+        return False
 
+    def painted(self):
+        startup.mark("first frame")
+        startup.report()
+        QApplication.quit()
 
 
 # Main Window class for the Snake Game
 class MainWindow(QMainWindow):
-    def __init__(self):
+    run_recorded = QtCore.Signal(object)  # Emitted from the leaderboard's thread with the Standing of a finished run
+
+    def __init__(self, profile=False, sound=True, world=False, soak=False, arena=0, net=None, levels=None):
         super().__init__()
 
-        # Sound Effects
-
-        # Directory
-        sounds_dir = "SoundFX"
-
-        # Game Over
-        self.game_over_sound = QSoundEffect()
-        self.game_over_sound.setSource(QUrl.fromLocalFile(os.path.join(sounds_dir, "GameOver.wav")))
-        self.game_over_sound.setVolume(0.6)
-
-        # Eat
-        self.eat_sound = QSoundEffect()
-        self.eat_sound.setSource(QUrl.fromLocalFile(os.path.join(sounds_dir, "Eat.wav")))
-        self.eat_sound.setVolume(0.5)
-
-        # Gain Shield
-        self.shield_sound = QSoundEffect()
-        self.shield_sound.setSource(QUrl.fromLocalFile(os.path.join(sounds_dir, "Shield.wav")))
-        self.shield_sound.setVolume(0.5)
-        
-        # Lose Shield
-        self.lose_shield_sound = QSoundEffect()
-        self.lose_shield_sound.setSource(QUrl.fromLocalFile(os.path.join(sounds_dir, "LoseShield.wav")))
-        self.lose_shield_sound.setVolume(0.5)
-
-        # Gold Bonus
-        self.gold_bonus_sound = QSoundEffect()
-        self.gold_bonus_sound.setSource(QUrl.fromLocalFile(os.path.join(sounds_dir, "GoldBonus.wav")))
-        self.gold_bonus_sound.setVolume(0.5)
-
-        # Speed Up
-        self.speed_up_sound = QSoundEffect()
-        self.speed_up_sound.setSource(QUrl.fromLocalFile(os.path.join(sounds_dir, "SpeedUp.wav")))
-        self.speed_up_sound.setVolume(0.5)
-
-        # Slow Down
-        self.slow_down_sound = QSoundEffect()
-        self.slow_down_sound.setSource(QUrl.fromLocalFile(os.path.join(sounds_dir, "SlowDown.wav")))
-        self.slow_down_sound.setVolume(0.5)
-        
-
-        ui_file_path = "main.ui"
-        ui_file_abs_path = get_resource_path(ui_file_path)
-        ui_file = QtCore.QFile(ui_file_abs_path)
-        if not ui_file.open(QtCore.QIODevice.ReadOnly):
-            print(f"Cannot open {ui_file_abs_path}: {ui_file.errorString()}")
-            sys.exit(-1)
-
-
-        loader = QUiLoader()
-        self.window = loader.load(ui_file)
-        ui_file.close()
-        if not self.window:
-            print(loader.errorString())
-            sys.exit(-1)
-
-
-        self.graphicsView = self.window.findChild(QGraphicsView, "graphicsView")
+        # Sound effects, loaded in the background once the window is up
+        self.sounds = SoundManager("SoundFX", enabled=sound)
+        self.sounds.register("game_over", "GameOver.wav", volume=0.6, voices=1)
+        self.sounds.register("eat", "Eat.wav", voices=3)
+        self.sounds.register("shield", "Shield.wav")
+        self.sounds.register("lose_shield", "LoseShield.wav")
+        self.sounds.register("gold_bonus", "GoldBonus.wav")
+        self.sounds.register("speed_up", "SpeedUp.wav")
+        self.sounds.register("slow_down", "SlowDown.wav")
+
+
+        # Widgets come from the precompiled main.ui (see uicache.py), or from QUiLoader if it cannot be compiled
+        self.window, self.ui = load_window(get_resource_path("main.ui"))
+        startup.mark("ui (QUiLoader)" if isinstance(self.ui, FoundWidgets) else "ui (precompiled)")
+
+
+        self.graphicsView = self.ui.graphicsView
         self.scene = QGraphicsScene(self.graphicsView)
-        self.scene.setBackgroundBrush(QBrush(QColor("black")))
+        self.scene.setBackgroundBrush(brush("background"))
         self.graphicsView.setScene(self.scene)
+        # Most items move every tick, which would keep a BSP index busy, and the changes of a frame are a few
+        # small rects (head, tail, food, obstacles) that the smart update mode repaints without merging them
+        self.scene.setItemIndexMethod(QGraphicsScene.NoIndex)
+        self.graphicsView.setViewportUpdateMode(QGraphicsView.SmartViewportUpdate)
 
 
         self.graphicsView.setHorizontalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
         self.graphicsView.setVerticalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
         self.graphicsView.setAlignment(QtCore.Qt.AlignCenter)
         self.scene.setSceneRect(-400, -200, 800, 400)
+        self.streamer = None  # Streams the chunks of a large world in and out of the scene
+        if world:
+            from world import WorldState, explorer_policy, world_bounds  # Only loaded to play a world
+            from worldview import ChunkStreamer
+            # The view follows the head; the scene reaches half a view past the world's edges so it can be centered there
+            x, y, width, height = world_bounds()
+            view = self.graphicsView.viewport().size()
+            self.scene.setSceneRect(x - view.width(), y - view.height(), width + 2 * view.width(), height + 2 * view.height())
+            self.streamer = ChunkStreamer(self.scene, brush)
+        self.arena = None  # Item drawing the whole board in arena mode, where the window only watches the AI snakes
+        self.arena_mode = bool(arena) or net is not None  # Watching an arena, or playing in one on a server
 
 
         #take the labels define in main.ui
-        self.scoreLabel = self.window.findChild(QtWidgets.QLabel, "scoreLabel")
-        self.levelLabel = self.window.findChild(QtWidgets.QLabel, "levelLabel")
-        self.escLabel = self.window.findChild(QtWidgets.QLabel, "escLabel")
-        self.powerUpLabel = self.window.findChild(QtWidgets.QLabel, "powerUpLabel")
+        self.scoreLabel = self.ui.scoreLabel
+        self.levelLabel = self.ui.levelLabel
+        self.escLabel = self.ui.escLabel
+        self.powerUpLabel = self.ui.powerUpLabel
         self.powerUpLabel.hide()
 
 
+        # Profiler overlay in the corner of the view, toggled with F3
+        self.profileLabel = QtWidgets.QLabel(self.graphicsView)
+        self.profileLabel.setStyleSheet("color: lime; background-color: rgba(0, 0, 0, 160); font-family: monospace; font-size: 11px; padding: 4px;")
+        self.profileLabel.setAttribute(QtCore.Qt.WA_TransparentForMouseEvents)
+        self.profileLabel.move(8, 8)
+        self.profileLabel.hide()
+
+
+        # Fixed-timestep loop: the timer fires once per display frame, and the game steps
+        # once for every state.interval ms of real time that has built up
+        refresh_rate = QApplication.primaryScreen().refreshRate() if QApplication.primaryScreen() else 0
+        self.frame_interval = round(1000 / refresh_rate) if refresh_rate > 0 else 16
         self.timer = QtCore.QTimer()
-        self.timer.timeout.connect(self.tick)
-        self.base_speed = 150  # Base game speed
-        self.timer.start(self.base_speed)  # Set a slower timer for better game speed
+        self.timer.setTimerType(QtCore.Qt.PreciseTimer)
+        self.timer.timeout.connect(self.frame)
+        self.clock = QtCore.QElapsedTimer()
+        self.accumulator = 0  # Real time not yet simulated, in ms
+        self.effects = Scheduler()  # Window-side timed effects, counted in game ticks so they pause with the game
 
 
         self.scene.keyPressEvent = self.scene_key_press
 
 
         # Initialize game elements
-        self.obstacles = []  # List to hold obstacles
-        self.food_count = 0  # Counter for food consumed
-        self.level = 1  # Current game level
-        self.points_to_next_level = 5  # Points needed to advance to next level
-        self.high_score = self.load_high_score()  # Track high score
-        self.speed_boost_active = False  # Track if speed boost is active
-        self.snake = Snake()  # Initialize snake before food
-        self.shields = 0  # Number of shields/lives
-        self.shield_food = None  # Reference to the shield item in the scene
-        self.invincible = False       # Is snake currently invincible
-        self.invincible_timer = None  # Timer for i-frames
-
-        self.create_food()
+        self.leaderboard = Leaderboard("snake_leaderboard.db")  # Every finished run, written in the background
+        self.run_recorded.connect(self.show_game_over)  # Queued to this thread, like any cross-thread signal
+        self.recording = False  # A finished game waits for the leaderboard's answer, keys are ignored meanwhile
+        self.replay = None  # Replay of the last finished game, kept until the leaderboard says if it is a high score
+        # Game rules live in the engine, the window only renders them
+        self.net = net  # Connection to a game server, whose arena this window shows and plays a snake in
+        if net is not None:
+            self.state = net.mirror
+            self.scene.setSceneRect(*self.state.rect)
+        elif arena:
+            from arena import ArenaState  # Only loaded to watch an arena
+            self.state = ArenaState(snakes=arena)
+            self.scene.setSceneRect(*self.state.rect)  # Scaled down to fit the view
+        else:
+            self.state = WorldState() if world else GameState(levels=levels)
+        self.profiler = Profiler(self.state.profiled + (EVENTS, RENDER))  # Per-phase tick timings, only recorded while profiling
+        self.profiling = False
+        self.overlay_frames = 0
+        self.snake = Snake()  # Added to the scene when a game starts
+        self.food = None  # Graphics item of the food in the scene
+        self.shield_food = None  # Graphics item of the shield in the scene
+        self.obstacles = 0  # Obstacles of the state that are drawn: walls as Obstacle items, the others by moving_obstacles
+        self.moving_obstacles = MovingObstacles()  # Added to the scene with the first moving obstacle
 
 
         self.in_menu = True
         self.menu_selection = 0
 
 
+        # Autopilot: plays attract-mode demos after ATTRACT_DELAY in the menu, and every game in soak runs
+        self.pilot = explorer_policy if world else Autopilot()
+        self.pilot_rng = random.Random()
+        self.soak = soak and not arena and net is None  # Games follow each other unattended and are reported on stdout
+        self.demo = False  # Playing a demo game, any key goes back to the menu
+        self.attract_timer = QtCore.QTimer()
+        self.attract_timer.setSingleShot(True)
+        self.attract_timer.timeout.connect(self.start_demo)
+
+
         #take the labels define in main.ui
-        self.high_score_menu = self.window.findChild(QtWidgets.QLabel, "high_score_menu")
-        self.start_button = self.window.findChild(QtWidgets.QPushButton, "start_button")
-        self.quit_button = self.window.findChild(QtWidgets.QPushButton, "quit_button")
-        self.dummy_text = self.window.findChild(QtWidgets.QLabel, "dummy_text")
+        self.high_score_menu = self.ui.high_score_menu
+        self.start_button = self.ui.start_button
+        self.quit_button = self.ui.quit_button
+        self.dummy_text = self.ui.dummy_text
 
 
         self.start_button.clicked.connect(self.start_button_clicked)
@@ -335,41 +397,48 @@ class MainWindow(QMainWindow):
 
 
         self.show_start_menu()
+        if soak:
+            QtCore.QTimer.singleShot(0, self.start_game)
+        self.set_profiling(profile)
+        startup.mark("scene and menu")
 
 
         self.window.show()
+        startup.mark("window shown")
+        self.sounds.preload()  # Queued behind the first frame
 
 
     def update_score(self):
-        self.scoreLabel.setText(f"Score: {self.snake.score}")
-       
+        self.scoreLabel.setText(f"Score: {self.state.score}")
+
     def update_level(self):
-        self.levelLabel.setText(f"Level: {self.level}")
-   
-    def load_high_score(self):
-        # Load high score from file
-        high_score_file = "snake_highscore.json"
-        try:
-            if os.path.exists(high_score_file):
-                with open(high_score_file, 'r') as f:
-                    data = json.load(f)
-                    return data.get('high_score', 0)
-        except Exception as e:
-            print(f"Error loading high score: {e}")
-        return 0
-   
-    def save_high_score(self):
-        # Save high score to file
-        high_score_file = "snake_highscore.json"
+        if self.net is not None:
+            rtts = self.net.rtts
+            self.levelLabel.setText(f"Ping: {rtts[-1]:.0f} ms" if rtts else "Ping: -")
+            return
+        if self.arena is not None:
+            self.levelLabel.setText(f"Alive: {self.state.alive}/{self.state.count}")
+            return
+        self.levelLabel.setText(f"Level: {self.state.level}")
+
+    def save_replay(self, replay, name):
+        # Save a finished game as a replay, which can be checked with: python replay.py verify <file>
         try:
-            with open(high_score_file, 'w') as f:
-                json.dump({'high_score': self.high_score}, f)
+            os.makedirs("replays", exist_ok=True)
+            replay.save(os.path.join("replays", name))
         except Exception as e:
-            print(f"Error saving high score: {e}")
+            print(f"Error saving replay: {e}")
 
 
     def scene_key_press(self, event):
+        if self.recording:
+            return
+        if self.demo:
+            self.timer.stop()
+            self.back_to_menu()
+            return
         if self.in_menu:
+            self.attract_timer.start(ATTRACT_DELAY)  # Restart the countdown to the next demo
             # Handle menu navigation and game start
             if event.key() == QtCore.Qt.Key_Up or event.key() == QtCore.Qt.Key_W:
                 self.menu_selection = 0
@@ -382,50 +451,81 @@ class MainWindow(QMainWindow):
                     self.start_game()
                 elif self.menu_selection == 1:
                     QApplication.quit()
+        elif self.arena is not None and self.net is None:
+            # The arena is only watched: pause and the profiler overlay
+            if event.key() == QtCore.Qt.Key_Escape:
+                self.game_pause()
+            elif event.key() == QtCore.Qt.Key_F3:
+                self.set_profiling(not self.profiling)
         else:
-            # Handle snake movement with arrow keys or WASD
+            # Handle snake movement with arrow keys or WASD; turns are queued and applied one per tick
             if event.key() == QtCore.Qt.Key_Left or event.key() == QtCore.Qt.Key_A:
-                self.snake.change_direction((-1, 0))
+                self.state.queue_direction((-1, 0))
             elif event.key() == QtCore.Qt.Key_Right or event.key() == QtCore.Qt.Key_D:
-                self.snake.change_direction((1, 0))
+                self.state.queue_direction((1, 0))
             elif event.key() == QtCore.Qt.Key_Up or event.key() == QtCore.Qt.Key_W:
-                self.snake.change_direction((0, -1))
+                self.state.queue_direction((0, -1))
             elif event.key() == QtCore.Qt.Key_Down or event.key() == QtCore.Qt.Key_S:
-                self.snake.change_direction((0, 1))
+                self.state.queue_direction((0, 1))
             elif event.key() == QtCore.Qt.Key_Escape:
                 self.game_pause()
-            self.tick()  # Move snake with every key press
-
-
-
-
-    def tick(self):
-        if not self.in_menu:
-            # Move food
-            if self.level >= 3 and self.food:
-                self.food.move_food(self.scene, self.snake.cube_list, self.obstacles)
+            elif event.key() == QtCore.Qt.Key_F3:
+                self.set_profiling(not self.profiling)
+            elif event.key() == QtCore.Qt.Key_M:
+                self.sounds.set_muted(not self.sounds.muted)
 
 
-            # Move obstacles
-            for obs in self.obstacles:
-                move_items_while_respecting_border(obs, self.scene, self.snake.cube_list, self.obstacles,
-                                    move_obstacles=(self.level >= 4))
 
 
+    def frame(self):
+        if self.in_menu:
+            return
+        if self.net is not None:
+            self.net.poll()  # Apply what the server sent, before the local ticks predict from it
+        self.accumulator += self.clock.restart()
+        steps = 0
+        while self.accumulator >= self.state.interval:
+            self.accumulator -= self.state.interval
+            self.tick()
+            if self.in_menu:
+                return  # The game ended during this step
+            steps += 1
+            if steps == MAX_STEPS_PER_FRAME:
+                self.accumulator = 0  # Too far behind (e.g. the window was blocked): drop the backlog instead of fast-forwarding
+                break
+
+
+        # --- Re-render elements, part of the way into the next step ---
+        if self.profiling:
+            self.profiler.mark()
+        self.render_elements()
+        self.interpolate(self.accumulator / self.state.interval)
+        if self.profiling:
+            if steps:
+                self.profiler.lap(RENDER)  # Charged to the last tick of the frame
+            self.overlay_frames += 1
+            if self.overlay_frames >= PROFILE_OVERLAY_FRAMES:
+                self.overlay_frames = 0
+                self.update_profile_overlay()
 
 
+    def tick(self):
+        if not self.in_menu:
+            # --- Step the game rules ---
+            if (self.soak or self.demo) and self.arena is None:
+                direction = self.pilot(self.state, self.pilot_rng)
+                if direction is not None:
+                    self.state.change_direction(direction)
+            if self.profiling:
+                self.profiler.begin(self.state.tick_count + 1, self.state.interval)
+            events = self.state.step()
+            self.effects.run_due(self.state.tick_count)
 
 
-            # --- Move snake ---
-            self.snake.move()
-
-
-            # --- Re-render elements ---
-            self.render_elements()
-
-
-            # --- Check collisions ---
-            self.check_collision()
+            # --- React to what happened this tick ---
+            self.handle_events(events)
+            if self.profiling and not self.in_menu:
+                self.profiler.lap(EVENTS)
 
 
 
@@ -433,376 +533,241 @@ class MainWindow(QMainWindow):
 
 
     def render_elements(self):
-        # Re-add food item if it exists
-        if self.food and self.food.scene() != self.scene:
-            self.scene.addItem(self.food)
-
-
-        # Re-add all snake cubes to the scene
-        for sc in self.snake.cube_list:
-            if sc.scene() != self.scene:
-                self.scene.addItem(sc)
-
-
-        # Re-add all obstacles to the scene
-        for obstacle in self.obstacles:
-            if obstacle.scene() != self.scene:
-                self.scene.addItem(obstacle)
-
-
-    def create_food(self):
-        # Create a new food object and place it in the scene
-        # Try multiple times to find a valid position that doesn't collide with obstacles
-        max_attempts = 20
-        for attempt in range(max_attempts):
-            x = self.scene.width() * (0.1 + 0.8 * (random.random()) - 0.5)
-            y = self.scene.height() * (0.1 + 0.8 * (random.random()) - 0.5)
-           
-            # Randomly determine food type (10% golden, 10% speed boost, 10% slow down, 70% normal)
-            rand_val = random.random()
-            if rand_val < 0.10:
-                food_type = "golden"
-            elif rand_val < 0.20:
-                food_type = "speed_boost"
-            elif rand_val < 0.30:
-                food_type = "slow_down"
-            else:
-                food_type = "normal"
-           
-            temp_food = Food(food_type)
-            temp_food.setX(x)
-            temp_food.setY(y)
-           
-            # Check if food collides with any obstacles
-            collision_with_obstacles = False
-            for obstacle in self.obstacles:
-                if temp_food.collidesWithItem(obstacle):
-                    collision_with_obstacles = True
-                    break
-           
-            # Check if food collides with snake
-            collision_with_snake = False
-            for cube in self.snake.cube_list:
-                if temp_food.collidesWithItem(cube):
-                    collision_with_snake = True
-                    break
-           
-            # If no collision, place the food
-            if not collision_with_obstacles and not collision_with_snake:
-                self.food = temp_food
-                self.scene.addItem(self.food)  # Add the food item to the scene
-                return
-       
-        # If we couldn't find a valid position, just place it anyway (fallback)
-        self.food = Food("normal")
-        x = self.scene.width() * (0.1 + 0.8 * (random.random()) - 0.5)
-        y = self.scene.height() * (0.1 + 0.8 * (random.random()) - 0.5)
-        self.food.setX(x)
-        self.food.setY(y)
-        self.scene.addItem(self.food)
-
-
-    def spawn_shield_food(self):
-        # Only spawn if player has no shield and there is no existing shield food
-        if self.shields > 0 or self.shield_food is not None:
-            return
-
-        max_attempts = 20
-        for attempt in range(max_attempts):
-            x = self.scene.width() * (0.1 + 0.8 * random.random() - 0.5)
-            y = self.scene.height() * (0.1 + 0.8 * random.random() - 0.5)
-
-            temp_food = Food("shield")  
-            temp_food.setX(x)
-            temp_food.setY(y)
-
-            collision = False
-            for cube in self.snake.cube_list:
-                if temp_food.collidesWithItem(cube):
-                    collision = True
-                    break
-
-            for obs in self.obstacles:
-                if temp_food.collidesWithItem(obs):
-                    collision = True
-                    break
-
-            if not collision:
-                self.shield_food = temp_food
-                self.scene.addItem(self.shield_food)
-                return
-
-    def create_obstacle(self):
-        # Create a new obstacle and place it randomly in the scene
-        # Try multiple times to find a valid position
-        max_attempts = 10
-        for attempt in range(max_attempts):
-            x = self.scene.width() * (0.1 + 0.8 * (random.random()) - 0.5)
-            y = self.scene.height() * (0.1 + 0.8 * (random.random()) - 0.5)
-           
-            # Create temporary obstacle to check collisions
-            temp_obstacle = Obstacle(x, y)
-           
-            # Check if obstacle collides with snake
-            collision_with_snake = False
-            for cube in self.snake.cube_list:
-                if temp_obstacle.collidesWithItem(cube):
-                    collision_with_snake = True
-                    break
-           
-            # Check if obstacle collides with food
-            collision_with_food = temp_obstacle.collidesWithItem(self.food)
-           
-            # Check if obstacle collides with existing obstacles
-            collision_with_obstacles = False
-            for existing_obstacle in self.obstacles:
-                if temp_obstacle.collidesWithItem(existing_obstacle):
-                    collision_with_obstacles = True
-                    break
-           
-            # If no collision, place the obstacle
-            if not collision_with_snake and not collision_with_food and not collision_with_obstacles:
-                obstacle = Obstacle(x, y)
-                self.obstacles.append(obstacle)
-                self.scene.addItem(obstacle)
-                return
-
-       
-        # If we couldn't find a valid position after max_attempts, don't create obstacle
-        print(f"Warning: Could not find valid position for obstacle after {max_attempts} attempts")
-
-    # When the player loses the shield, there needs to be some i-frame to avoid auto game over
-    def start_invincibility(self, duration=2000):
-        self.invincible = True
-        self.snake.set_color("purple")  # Keep snake purple during invincibility
-        if self.invincible_timer:
-            self.invincible_timer.stop()
-        self.invincible_timer = QtCore.QTimer.singleShot(duration, self.end_invincibility)
-
-    def end_invincibility(self):
-        self.invincible = False
-        # If no shields left, turn snake green
-        if self.shields == 0:
-            self.snake.set_color("green")
-
-    def check_collision(self):
-        head = self.snake.cube_list[0]
-
-        # Check collision with boundaries using scene's bounding rectangle
-        if not self.scene.sceneRect().contains(head.sceneBoundingRect()):
-            if self.shields > 0 and not self.invincible:
-                self.lose_shield_sound.play()
-                self.shields -= 1
-                self.show_powerup_message(f"🛡️ Shield used! Remaining: {self.shields}", "purple")
-                self.start_invincibility(2000)  # 2 seconds i-frame
-            elif not self.invincible:
-                self.game_over()
+        state = self.state
+        if self.arena is not None:
+            self.arena.sync()
+            self.update_score()
+            self.update_level()
             return
 
-        # Check self-collision by comparing positions
-        head_pos = (head.x(), head.y())
-        for cube in self.snake.cube_list[1:]:
-            if head_pos == (cube.x(), cube.y()):
+        # Replace the food item when the state spawned a new food, and follow it while it moves
+        self.food = self.sync_item(self.food, state.food)
+        self.shield_food = self.sync_item(self.shield_food, state.shield_food)
+
+
+        # Add graphics for new walls; moving obstacles are all drawn by one item, synced in interpolate()
+        for obstacle in state.obstacles[self.obstacles:]:
+            if obstacle.kind == "moving":
+                if self.moving_obstacles.scene() is None:
+                    self.scene.addItem(self.moving_obstacles)  # Over the walls so far and under the ones to come
+                continue
+            item = Obstacle(obstacle.width, obstacle.height, obstacle.kind)
+            item.source = obstacle
+            item.setPos(obstacle.x, obstacle.y)
+            self.scene.addItem(item)
+        self.obstacles = len(state.obstacles)
+
+
+        self.snake.sync(state.body, state.heads_pushed)
+        self.snake.set_role("snake_shielded" if state.shielded else "snake")
+        if self.streamer is not None:
+            self.streamer.refresh(state.world)
+
+
+    def interpolate(self, alpha):
+        # Draw the head and moving items between their last two simulated positions, so motion is smooth at any frame rate
+        state = self.state
+        if self.arena is not None:
+            return  # Arena snakes are drawn on their cells
+        if len(state.body) > 1:
+            (x, y), (prev_x, prev_y) = state.body[0], state.body[1]
+            x, y = prev_x + (x - prev_x) * alpha, prev_y + (y - prev_y) * alpha
+            self.snake.set_head_pos(x, y)
+            if self.streamer is not None:
+                self.follow(x, y)
+        if state.level >= 3 and self.food:
+            self.interpolate_item(self.food, alpha)
+        self.moving_obstacles.sync(state.movers, alpha)
+
+
+    # Keep the head in the middle of the view, with the chunks around what it shows in the scene
+    def follow(self, x, y):
+        self.graphicsView.centerOn(x + CELL_SIZE / 2, y + CELL_SIZE / 2)
+        visible = self.graphicsView.mapToScene(self.graphicsView.viewport().rect()).boundingRect()
+        self.streamer.update(self.state.world, visible)
+
+
+    def interpolate_item(self, item, alpha):
+        source = item.source
+        item.setPos(source.prev_x + (source.x - source.prev_x) * alpha, source.prev_y + (source.y - source.prev_y) * alpha)
+
+
+    def sync_item(self, item, source):
+        if source is None:
+            if item is not None:
+                self.scene.removeItem(item)
+            return None
+        if item is None or item.source is not source:
+            if item is not None:
+                self.scene.removeItem(item)
+            item = Food(source.kind)
+            item.source = source
+            self.scene.addItem(item)
+        item.setPos(source.x, source.y)
+        return item
+
+
+    def handle_events(self, events):
+        for event in events:
+            name = event[0]
+            if name == "eat":
+                food_type = event[1]
+                # Play sound only for normal food
+                if food_type == "normal":
+                    self.sounds.play("eat")
+                elif food_type == "golden":
+                    # Show golden food message briefly
+                    self.show_powerup_message("⭐ Golden Food! +3 Points! ⭐", "gold")
+                    self.sounds.play("gold_bonus")
+                elif food_type == "speed_boost":
+                    self.show_powerup_message("⚡ Speed Boost! Going Fast! ⚡", "cyan")
+                    self.sounds.play("speed_up")
+                elif food_type == "slow_down":
+                    self.show_powerup_message("🐌 Slow Motion! Take it Easy! 🐌", "purple")
+                    self.sounds.play("slow_down")
+                self.update_score()
+            elif name == "speed_reset":
+                self.show_powerup_message("⏱️ Normal Speed Restored", "white")
+            elif name == "shield_lost":
+                self.sounds.play("lose_shield")
+                self.show_powerup_message(f"🛡️ Shield used! Remaining: {event[1]}", "purple")
+            elif name == "shield_gained":
+                self.sounds.play("shield")
+                self.show_powerup_message(f"You collected a shield! Total: {event[1]}", "purple")
+            elif name == "level_up":
+                self.update_level()
+                # Show level up message in the game (no pop-up)
+                self.show_powerup_message(f"🎉 LEVEL {event[1]}! 🎉", "yellow")
+            elif name == "game_over":
+                self.render_elements()  # Show the final position behind the dialog
                 self.game_over()
                 return
 
-        # Check collision with the food
-        if head.collidesWithItem(self.food):
-
-            # Apply food effects based on type
-            food_type = self.food.food_type
-            self.snake.score += self.food.points  # Score updated based on food type
-            self.food_count += 1  # Increment food count
-           
-            # Play sound only for normal food
-            if food_type == "normal":
-                self.eat_sound.play()
-           
-            # Handle special food effects
-            if food_type == "golden":
-                # Show golden food message briefly
-                self.show_powerup_message("⭐ Golden Food! +3 Points! ⭐", "gold")
-                self.gold_bonus_sound.play()
-            elif food_type == "speed_boost":
-                # Temporarily increase speed
-                current_speed = self.timer.interval()
-                new_speed = max(30, current_speed - 50)
-                self.timer.setInterval(new_speed)
-                self.speed_boost_active = True
-                self.show_powerup_message("⚡ Speed Boost! Going Fast! ⚡", "cyan")
-                self.speed_up_sound.play()
-                # Reset speed after 5 seconds
-                QtCore.QTimer.singleShot(5000, self.reset_speed)
-            elif food_type == "slow_down":
-                # Temporarily decrease speed
-                current_speed = self.timer.interval()
-                new_speed = min(200, current_speed + 50)
-                self.timer.setInterval(new_speed)
-                self.speed_boost_active = True
-                self.show_powerup_message("🐌 Slow Motion! Take it Easy! 🐌", "purple")
-                self.slow_down_sound.play()
-                # Reset speed after 5 seconds
-                QtCore.QTimer.singleShot(5000, self.reset_speed)
-           
-            self.update_score()
-            self.scene.removeItem(self.food)
-            self.create_food()
-            self.snake.grow()
-
-
-            # Check if level up is needed (consistent: every N apples)
-            if self.food_count >= self.level * self.points_to_next_level:
-                self.level_up()
-
-
-            # Add obstacle every 5 food items consumed
-            if self.food_count % 5 == 0:
-                self.create_obstacle()
-
-
-        # Check collision with obstacles
-        for obstacle in self.obstacles:
-            if head.collidesWithItem(obstacle):
-                if self.shields > 0 and not self.invincible:
-                    self.lose_shield_sound.play()
-                    self.shields -= 1
-                    self.show_powerup_message(f"Shield used! Remaining: {self.shields}", "purple")
-                    self.snake.set_color("green" if self.shields == 0 else "purple")
-                    self.start_invincibility(3000) 
-                elif not self.invincible:
-                    self.game_over()
-                return
-
-        
-        # Check collision with shield food (guard against C++ object already deleted)
-        if self.shield_food:
-            try:
-                if head.collidesWithItem(self.shield_food):
-                    self.shield_sound.play()
-                    self.shields += 1
-                    self.snake.set_color("purple")  # Turn snake purple
-                    self.show_powerup_message(f"You collected a shield! Total: {self.shields}", "purple")
-                    try:
-                        self.scene.removeItem(self.shield_food)
-                    except RuntimeError:
-                        pass
-                    self.shield_food = None
-            except RuntimeError:
-                # The underlying C++ QGraphicsItem was deleted elsewhere (e.g., scene.clear()).
-                # Drop the Python-side reference to avoid subsequent RuntimeErrors.
-                self.shield_food = None
 
 
 
+    def set_profiling(self, enabled):
+        # The engine only times its phases while it has a profiler
+        self.profiling = enabled
+        self.state.profiler = self.profiler if enabled else None
+        self.overlay_frames = 0
+        if enabled:
+            self.update_profile_overlay()
+            self.profileLabel.show()
+        else:
+            self.profileLabel.hide()
+
+    def update_profile_overlay(self):
+        summary = self.profiler.summary()
+        lines = [f"{'phase':<10}{'p50 us':>9}{'p99 us':>9}"]
+        for name in self.profiler.names + ("total",):
+            p50, p99 = summary[name]
+            lines.append(f"{name:<10}{p50:>9.1f}{p99:>9.1f}")
+        p50, p99 = summary["budget"]
+        lines.append(f"{'budget %':<10}{p50:>9.2f}{p99:>9.2f}")
+        lines.append(f"{self.profiler.count} ticks")
+        if (self.soak or self.demo) and isinstance(self.pilot, Autopilot):
+            lines.append(f"autopilot {self.pilot.last_cost * 1e6:.0f} us, max {self.pilot.max_cost * 1e6:.0f} us")
+        if self.net is not None:
+            lines.extend(self.net.summary())
+        if self.streamer is not None:
+            lines.append(f"chunks: {len(self.streamer.shown)} shown, {len(self.streamer.cache)} cached, "
+                         f"{len(self.state.world.chunks)} generated")
+        self.profileLabel.setText("\n".join(lines))
+        self.profileLabel.adjustSize()
+
+    def export_profile(self):
+        # Save the tick timings of the game that just ended, for offline analysis
+        if not self.profiler.count:
+            return
+        try:
+            os.makedirs("profiles", exist_ok=True)
+            self.profiler.write_csv(os.path.join("profiles", "last_game.csv"))
+        except Exception as e:
+            print(f"Error saving profile: {e}")
+        self.profiler.clear()
 
     def show_powerup_message(self, message, color):
         # Show power-up message temporarily
         self.powerUpLabel.setText(message)
         self.powerUpLabel.setStyleSheet(f"color: {color}; font-size: 16px; font-weight: bold;")
         self.powerUpLabel.show()
-        # Hide after 3 seconds
-        QtCore.QTimer.singleShot(3000, self.powerUpLabel.hide)
-   
-    def reset_speed(self):
-        # Reset speed to level-appropriate speed
-        if not self.speed_boost_active:
-            return
-        new_speed = max(70, self.base_speed - (self.level - 1) * 10)
-        self.timer.setInterval(new_speed)
-        self.speed_boost_active = False
-        self.show_powerup_message("⏱️ Normal Speed Restored", "white")
-   
-    def create_level_obstacles(self):
-        # Create level-specific obstacle patterns - more gradual introduction
-        if self.level == 5:
-            # Add first horizontal wall at level 5
-            self.create_wall_obstacle(-300, -100, 150, 20)
-       
-        if self.level == 7:
-            # Add second horizontal wall at level 7
-            self.create_wall_obstacle(150, 80, 150, 20)
-       
-        if self.level == 10:
-            # Add first vertical wall at level 10
-            self.create_wall_obstacle(-200, -150, 20, 100)
-       
-        if self.level == 12:
-            # Add second vertical wall at level 12
-            self.create_wall_obstacle(200, 0, 20, 100)
-       
-        if self.level == 15:
-            # Add corner obstacles at level 15
-            self.create_wall_obstacle(-350, -180, 80, 20)
-            self.create_wall_obstacle(-350, -180, 20, 80)
-   
-    def create_wall_obstacle(self, x, y, width, height):
-        # Create a wall-type obstacle
-        wall = Obstacle(x, y, width, height, "wall")
-        self.obstacles.append(wall)
-        self.scene.addItem(wall)
-   
-    def level_up(self):
-        self.level += 1
-        self.update_level()
-       
-        # Increase game speed more gradually (slower progression)
-        new_speed = max(70, self.base_speed - (self.level - 1) * 10)
-        self.timer.setInterval(new_speed)
-       
-        # Add obstacles more gradually - only every other level
-        if self.level % 2 == 0:
-            self.create_obstacle()
-       
-        # Add level-specific obstacle patterns only at key levels
-        self.create_level_obstacles()
-       
-        # Show level up message in the game (no pop-up)
-        self.show_powerup_message(f"🎉 LEVEL {self.level}! 🎉", "yellow")
-   
+        # Hide after 3 seconds, counted from the latest message
+        self.effects.schedule("hide_powerup", self.state.ticks_for(3000), self.powerUpLabel.hide)
+
     def game_pause(self):
         self.timer.stop()
         msg1 = QMessageBox()
         msg1.setWindowTitle("Game Paused")
-        msg1.setText(f"Level: {self.level}\nYour score: {self.snake.score}\n Do you want to continue?")
+        msg1.setText(f"{self.levelLabel.text()}\nYour score: {self.state.score}\n Do you want to continue?")
         # Avoid system default notification sound by not setting a standard icon
         msg1.setIcon(QMessageBox.NoIcon)
         continue_button = msg1.addButton("Continue", QMessageBox.ActionRole)
         abort_button = msg1.addButton("Quit", QMessageBox.RejectRole)
         msg1.exec()
         if msg1.clickedButton() == continue_button:  # Reinitialize timer to resume game
-            current_speed = max(70, self.base_speed - (self.level - 1) * 10)
-            self.timer.start(current_speed)
+            self.clock.restart()  # Time spent paused is not simulated
+            self.timer.start(self.frame_interval)
         elif msg1.clickedButton() == abort_button:
             self.game_over()
 
 
     def game_over(self):
-        self.game_over_sound.play()
         self.timer.stop()
-       
-        # Update high score
-        if self.snake.score > self.high_score:
-            self.high_score = self.snake.score
-            self.save_high_score()  # Save new high score to file
+        if self.arena is not None:
+            self.back_to_menu()  # Nothing to record, the arena has no single player
+            return
+        if self.soak or self.demo:
+            # Autopilot games are not recorded; a soak run goes on with the next game, a demo back to the menu
+            if self.soak:
+                print(f"Game over: score {self.state.score}, level {self.state.level}, ticks {self.state.tick_count}", flush=True)
+                self.start_game()
+            else:
+                self.back_to_menu()
+            return
+
+        self.sounds.play("game_over")  # Only for games someone played, like the recording below
+
+        # Record the run; the leaderboard ranks it on its own thread and answers through run_recorded
+        self.replay = None
+        if self.streamer is None:
+            self.replay = Replay.from_state(self.state)  # Replays only cover the standard board
+            self.save_replay(self.replay, "last_game.qsr")
+        if self.profiling:
+            self.export_profile()
+        self.recording = True
+        self.leaderboard.record(self.state.score, self.state.level, self.state.food_count,
+                                self.state.play_time, self.state.tick_count, self.state.seed, done=self.run_recorded.emit)
+
+
+    # Game over dialog, once the leaderboard has ranked the run
+    def show_game_over(self, standing):
+        self.recording = False
+        run = standing.run
+        if standing.new_high_score:
+            if self.replay is not None:
+                self.save_replay(self.replay, "high_score.qsr")
             high_score_text = "\n🎉 NEW HIGH SCORE! 🎉"
         else:
-            high_score_text = f"\nHigh Score: {self.high_score}"
-       
+            high_score_text = f"\nHigh Score: {standing.high_score}"
+        if standing.level_best is not run:
+            high_score_text += f"\nBest ending on level {run.level}: {standing.level_best.score}"
+
         msg = QMessageBox()
         msg.setWindowTitle("Game Over")
-        msg.setText(f"Level Reached: {self.level}\nYour Score: {self.snake.score}{high_score_text}")
+        msg.setText(f"Level Reached: {run.level}\nYour Score: {run.score}{high_score_text}")
         # Use NoIcon to prevent the system's default sound from playing when the dialog appears
         msg.setIcon(QMessageBox.NoIcon)
         msg.exec()
+        self.back_to_menu()
 
 
+    def back_to_menu(self):
         # Reset the game state
-        self.snake = Snake()
-        self.obstacles.clear()  # Clear obstacles
-        self.scene.clear()  # Clear the entire scene to remove all items
-        self.food = None  # Reset food
-        self.level = 1  # Reset level
-        if hasattr(self, 'shield_timer'): self.shield_timer.stop()
+        self.demo = False
+        self.state.reset()
+        self.effects.clear()
+        self.powerUpLabel.hide()
 
 
         self.in_menu = True
@@ -813,10 +778,10 @@ class MainWindow(QMainWindow):
 
     def show_start_menu(self):
         self.in_menu = True
-        self.scene.clear()
+        self.clear_scene()
 
 
-        self.high_score_menu.setText(f"High Score: {self.high_score}")
+        self.show_high_scores()
         self.high_score_menu.show()
         self.start_button.show()
         self.quit_button.show()
@@ -826,6 +791,44 @@ class MainWindow(QMainWindow):
         self.menu_selection = 0
         self.update_menu_selection()
         self.window.update()
+        if not self.soak:
+            self.attract_timer.start(ATTRACT_DELAY)
+
+
+    # The leaderboard loads on its own thread, so check back until the board is there
+    def show_high_scores(self):
+        if not self.leaderboard.loaded.is_set():
+            self.high_score_menu.setText("High Score: ...")
+            QtCore.QTimer.singleShot(LEADERBOARD_POLL, self.show_high_scores)
+            return
+        self.high_score_menu.setText(f"High Score: {self.leaderboard.high_score}")
+        self.high_score_menu.setToolTip("\n".join(
+            f"{rank}. {run.score}" + (f" (level {run.level})" if run.level is not None else "")
+            for rank, run in enumerate(self.leaderboard.top(), 1)))
+
+
+    def clear_scene(self):
+        # Clear the entire scene and drop the graphics items that went with it
+        if self.streamer is not None:
+            self.streamer.clear()
+            self.graphicsView.centerOn(0, 0)
+        self.scene.clear()
+        self.snake = Snake()
+        self.scene.addItem(self.snake)
+        self.moving_obstacles = MovingObstacles()  # Added with the first moving obstacle
+        if self.arena_mode:
+            from arenaview import ArenaItem
+            self.arena = ArenaItem(self.state, PALETTE, player=self.state.number if self.net is not None else -1)
+            self.scene.addItem(self.arena)
+            self.graphicsView.fitInView(self.scene.sceneRect(), QtCore.Qt.KeepAspectRatio)
+        if self.streamer is not None:
+            from world import world_bounds
+            edge = QGraphicsRectItem(*world_bounds())  # The world's edge, where the snake dies like at the screen's edge
+            edge.setPen(QPen(brush("wall"), 4))
+            self.scene.addItem(edge)
+        self.food = None
+        self.shield_food = None
+        self.obstacles = 0
 
 
     def update_menu_selection(self):
@@ -845,34 +848,75 @@ class MainWindow(QMainWindow):
         QtWidgets.QApplication.quit()
 
 
+    # Attract mode: the autopilot plays a game until a key is pressed or the game ends
+    def start_demo(self):
+        if self.in_menu:
+            self.demo = True
+            self.start_game()
+
+
     def start_game(self):
+        self.attract_timer.stop()
         self.start_button.hide()
         self.quit_button.hide()
         self.dummy_text.hide()
         self.high_score_menu.hide()
         self.in_menu = False
-        self.snake = Snake()
-        self.level = 1  # Reset level
-        self.create_food()
-        self.obstacles.clear()  # Clear any existing obstacles
-        self.food_count = 0  # Reset food count
-        self.timer.start(self.base_speed)  # Reset game timer to base speed
+        self.state.reset()
+        self.effects.clear()
+        self.powerUpLabel.hide()
+        self.clear_scene()
+        self.render_elements()
+        self.accumulator = 0
+        self.clock.start()
+        self.timer.start(self.frame_interval)
         self.update_score()
         self.update_level()
-        # Spawn a shield every 10 seconds
-        self.shield_timer = QtCore.QTimer()
-        self.shield_timer.timeout.connect(self.spawn_shield_food)
-        self.shield_timer.start(10000)
 
 
 
 
 
 if __name__ == "__main__":
-    QtCore.QCoreApplication.setAttribute(QtCore.Qt.AA_ShareOpenGLContexts)
-    app = QApplication(sys.argv)
-    window = MainWindow()
-    sys.exit(app.exec())
-
+    parser = argparse.ArgumentParser(description="QtSnake")
+    parser.add_argument("--headless", action="store_true", help="run the game engine without a window, as fast as possible")
+    parser.add_argument("--ticks", type=int, default=1_000_000, help="number of ticks to simulate in headless mode")
+    parser.add_argument("--seed", type=int, default=None, help="random seed for headless mode")
+    parser.add_argument("--policy", choices=sorted(POLICIES), default="random", help="who steers the snake in headless mode")
+    parser.add_argument("--levels", default=LEVEL_FILE, help="level file to play (JSON or TOML, see levels.py)")
+    parser.add_argument("--profile", action="store_true", help="start with the tick profiler overlay on (toggle with F3)")
+    parser.add_argument("--mute", action="store_true", help="run without sound, QtMultimedia is never loaded")
+    parser.add_argument("--world", action="store_true", help="play on a large scrolling world instead of a single screen")
+    parser.add_argument("--arena", type=int, default=0, metavar="SNAKES", help="watch this many AI snakes share one board")
+    parser.add_argument("--connect", metavar="HOST[:PORT]", help="join the arena of a game server (see server.py) as a player")
+    parser.add_argument("--autopilot", action="store_true", help="soak test: the autopilot plays game after game, reported on stdout")
+    parser.add_argument("--startup-profile", action="store_true", help="print how long each step of startup took, up to the first painted frame, and quit")
+    args, qt_args = parser.parse_known_args()
 
+    try:
+        levels = load_levels(args.levels)
+    except LevelError as e:
+        print(e)
+        sys.exit(1)
+    if args.headless:
+        sys.exit(run_headless(args.ticks, args.seed, POLICIES[args.policy], levels))
 
+    QtCore.QCoreApplication.setAttribute(QtCore.Qt.AA_ShareOpenGLContexts)
+    app = QApplication(sys.argv[:1] + qt_args)
+    startup.mark("QApplication")
+    net = None
+    if args.connect:
+        from netcode import PORT, ArenaMirror, NetClient  # asyncio, sockets and ssl are only loaded to play online
+        host, _, port = args.connect.partition(":")
+        net = NetClient(ArenaMirror())
+        try:
+            net.start_thread(host, int(port or PORT))
+        except OSError as e:
+            print(f"Cannot join {args.connect}: {e}")
+            sys.exit(1)
+    window = MainWindow(profile=args.profile, sound=not args.mute, world=args.world, soak=args.autopilot,
+                        arena=args.arena, net=net, levels=levels)
+    if args.startup_profile:
+        first_frame = FirstFrame()
+        window.graphicsView.viewport().installEventFilter(first_frame)
+    sys.exit(app.exec())
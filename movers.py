@@ -0,0 +1,230 @@
+from array import array
+
+# Movement system for the items that move: the food from level 3 and the
+# moving obstacles from level 4. Their state lives in packed arrays indexed by
+# slot (position and the position before the last move, velocity, speed,
+# size, the level they start moving at and the tick of their next turn), and
+# one pass a tick moves them all: no method call, scheduler entry or spatial
+# hash refiling per item and tick. Each mover also keeps the board cells it
+# covers, recomputed only when it crosses into other cells; they are what it
+# looks up for the snake to bounce off, and what a moving obstacle blocks on
+# the occupancy grid. New positions and velocities are written to the
+# movers' Items as they are computed, for the collision checks and renderers;
+# the window draws all moving obstacles straight from the arrays.
+#
+# Movers move in slot order. Their turns run with the scheduler's timers,
+# in the order all of them were set, as when each item had its own turn timer:
+# a turn set before a speed reset comes due on the same tick still counts its
+# next turn at the old speed, so recorded games replay the same.
+
+TURN_MS = 2000  # Movers change direction this often
+
+
+class Movers:
+    def __init__(self, grid, items, rect):
+        self.rect = rect  # Playfield the movers bounce around in
+        self.grid = grid  # Occupancy grid: snake cubes to bounce off, cells moving obstacles block
+        self.items = items  # Spatial hash the Items are filed in
+        self.slots = []  # Item of every mover, in the order they move
+        self.x = array("i")
+        self.y = array("i")
+        self.prev_x = array("i")  # Position before the last move, for render interpolation
+        self.prev_y = array("i")
+        self.vx = array("i")
+        self.vy = array("i")
+        self.speed = array("i")
+        self.width = array("i")
+        self.height = array("i")
+        self.start_level = array("i")  # Level from which the mover moves
+        self.blocks = array("b")  # 1 for obstacles, which block their cells on the grid
+        self.next_turn = array("q")  # Tick of the next turn, 0 until the mover first moves
+        self.turn_order = array("q")  # Scheduler sequence number of the turn, to run it in order with the timers
+        self.edge = array("b")  # 1 when the mover reaches past the board's cells, where the grid keeps no index
+        self.fields = (self.x, self.y, self.prev_x, self.prev_y, self.vx, self.vy, self.speed, self.width,
+                       self.height, self.start_level, self.blocks, self.next_turn, self.turn_order, self.edge)
+        self.spans = []  # Cell span of each mover, as OccupancyGrid.cell_span gives it
+        self.cells = []  # Board cells each mover covers
+        self.soonest = 0  # No turn is due before this tick
+
+    def __len__(self):
+        return len(self.slots)
+
+    # Start moving an Item at `start_level`; first puts it ahead of the others, like the food that moved before them
+    def add(self, item, start_level, blocks, first=False):
+        slot = 0 if first else len(self.slots)
+        values = (item.x, item.y, item.prev_x, item.prev_y, item.vx, item.vy, item.speed, item.width,
+                  item.height, start_level, blocks, 0, 0, 0)
+        for field, value in zip(self.fields, values):
+            field.insert(slot, value)
+        self.slots.insert(slot, item)
+        self.spans.insert(slot, None)
+        self.cells.insert(slot, None)
+        self.refile(slot, item.x, item.y)
+
+    # Put a new Item in the place of one that is removed, as a mover of the same kind
+    def replace(self, old, item):
+        slot = self.slots.index(old)
+        self.slots[slot] = item
+        self.x[slot] = item.x
+        self.y[slot] = item.y
+        self.prev_x[slot] = item.prev_x
+        self.prev_y[slot] = item.prev_y
+        self.vx[slot] = item.vx
+        self.vy[slot] = item.vy
+        self.speed[slot] = item.speed
+        self.width[slot] = item.width
+        self.height[slot] = item.height
+        self.next_turn[slot] = 0
+        self.refile(slot, item.x, item.y)
+
+    def remove(self, item):
+        slot = self.slots.index(item)
+        for field in self.fields:
+            del field[slot]
+        del self.slots[slot]
+        del self.spans[slot]
+        del self.cells[slot]
+
+    # Record the cells a mover covers at (x, y); returns the cells it covered before
+    def refile(self, slot, x, y):
+        grid = self.grid
+        size = grid.cell_size
+        width = self.width[slot]
+        height = self.height[slot]
+        col0, col1, row0, row1 = span = (x // size, -(-(x + width) // size) - 1, y // size, -(-(y + height) // size) - 1)
+        self.spans[slot] = span
+        self.edge[slot] = (col0 < grid.col_min or col1 >= grid.col_min + grid.cols
+                           or row0 < grid.row_min or row1 >= grid.row_min + grid.rows)
+        old = self.cells[slot]
+        self.cells[slot] = grid.span_cells(col0, col1, row0, row1)
+        return old
+
+    # New random direction, and the tick of the next turn
+    def turn(self, slot, state):
+        rng = state.motion_rng
+        speed = self.speed[slot]
+        if rng.random() < 0.5:
+            self.vx[slot] = rng.choice([-1, 1]) * speed
+            self.vy[slot] = 0
+        else:
+            self.vx[slot] = 0
+            self.vy[slot] = rng.choice([-1, 1]) * speed
+        next_turn = self.next_turn[slot] = state.tick_count + state.ticks_for(TURN_MS)
+        self.turn_order[slot] = state.scheduler.next_seq()
+        self.soonest = min(self.soonest, next_turn)
+
+    # Slot of the first turn set of those due by `tick`, or -1
+    def next_due(self, tick):
+        if tick < self.soonest:
+            return -1
+        turn_order = self.turn_order
+        best = -1
+        soonest = 1 << 62
+        for slot, when in enumerate(self.next_turn):
+            if not when:
+                continue
+            if when <= tick:
+                if best < 0 or turn_order[slot] < turn_order[best]:
+                    best = slot
+            elif when < soonest:
+                soonest = when
+        self.soonest = tick if best >= 0 else soonest
+        return best
+
+    # Run the timers due this tick, and the turns that are due in between
+    def run_due(self, state):
+        tick = state.tick_count
+        scheduler = state.scheduler
+        while True:
+            slot = self.next_due(tick)
+            if slot < 0:
+                break
+            order = self.turn_order[slot]
+            scheduler.run_due(tick, order)
+            slot = self.next_due(tick)  # The timers can add and remove movers
+            if slot >= 0 and self.turn_order[slot] == order:
+                self.turn(slot, state)
+        scheduler.run_due(tick)
+
+    # Move every mover of the state's level one tick, bouncing off the playfield's edges and the snake
+    def move(self, state):
+        count = len(self.slots)
+        if not count:
+            return
+
+        left, top, width, height = self.rect
+        right = left + width
+        bottom = top + height
+        level = state.level
+        grid = self.grid
+        snake = grid.snake
+        size = grid.cell_size
+        items = self.items
+        slots, start_level, edge, blocks = self.slots, self.start_level, self.edge, self.blocks
+        xs, ys, prev_xs, prev_ys, vxs, vys = self.x, self.y, self.prev_x, self.prev_y, self.vx, self.vy
+        widths, heights, spans, cells = self.width, self.height, self.spans, self.cells
+        for slot in range(count):
+            if start_level[slot] > level:
+                continue
+            if not vxs[slot] and not vys[slot]:
+                self.turn(slot, state)  # First move
+            vx = vxs[slot]
+            vy = vys[slot]
+            x = xs[slot]
+            y = ys[slot]
+            w = widths[slot]
+            h = heights[slot]
+            new_x = x + vx
+            new_y = y + vy
+
+            # Respect screen bounds
+            if new_x < left:
+                new_x = left
+                vx = -vx
+            elif new_x + w > right:
+                new_x = right - w
+                vx = -vx
+            if new_y < top:
+                new_y = top
+                vy = -vy
+            elif new_y + h > bottom:
+                new_y = bottom - h
+                vy = -vy
+
+            # Bounce off the snake, where the mover is before this step
+            if edge[slot]:
+                hit = grid.rect_hits_snake(x, y, w, h)
+            else:
+                hit = False
+                for index in cells[slot]:
+                    if snake[index]:
+                        hit = True
+                        break
+            if hit:
+                vx = -vx
+                vy = -vy
+
+            xs[slot] = new_x
+            ys[slot] = new_y
+            vxs[slot] = vx
+            vys[slot] = vy
+            prev_xs[slot] = x
+            prev_ys[slot] = y
+            item = slots[slot]
+            item.prev_x = x
+            item.prev_y = y
+            item.x = new_x
+            item.y = new_y
+            item.vx = vx
+            item.vy = vy
+
+            # Cells only change when an edge crosses a cell boundary. Spatial hash buckets are whole
+            # cells, so the item's buckets cannot change otherwise either
+            col0, col1, row0, row1 = spans[slot]
+            if (new_x // size != col0 or new_y // size != row0
+                    or -(-(new_x + w) // size) - 1 != col1 or -(-(new_y + h) // size) - 1 != row1):
+                old = self.refile(slot, new_x, new_y)
+                if blocks[slot]:
+                    grid.add_cells(old, -1)
+                    grid.add_cells(cells[slot])
+                items.update(item)
@@ -0,0 +1,644 @@
+import asyncio
+import queue
+import socket
+import struct
+import threading
+import time
+from collections import deque
+
+from arena import OPPOSITE, ArenaSnake, board_rect
+from engine import CELL_SIZE, DIRECTIONS, FOOD_POINTS, INPUT_QUEUE_SIZE
+from grid import OccupancyGrid
+from varint import VarintError, read_varint, write_varint
+
+# Network play on the arena: the server (server.py) runs the game and clients
+# send turns and draw what it sends back. The wire format, the client-side copy
+# of the board and the client live here.
+#
+# Every message is a 4-byte little-endian length, a type byte and a payload of
+# LEB128 varints (varint.py, as in replays). The server sends:
+#
+#   WELCOME   snake number, cols, rows, tick interval (ms), keyframe period
+#   KEYFRAME  tick, input ack, then the whole board: walls, food, and every
+#             snake's score, length, direction, growth and body
+#   DELTA     tick, input ack, then only what that tick changed: one varint per
+#             move ((number gap << 3) | tail kept << 2 | direction), deaths,
+#             food eaten, food spawned, snakes spawned
+#   PONG      the payload of a PING, sent straight back
+#
+# Bodies are sent as the head's cell and 2 bits per following cube (the
+# direction to it), four to a byte. Deltas are encoded once per tick and the
+# same bytes go to every client, behind a header with that client's ack. A
+# keyframe follows the delta every `keyframe period` ticks, and is sent
+# instead of deltas to a client that fell behind or asked for one.
+#
+# Clients send INPUT (sequence number, direction), PING (8 bytes of their own
+# clock) and RESYNC (a request for a keyframe). The server applies at most
+# one turn per tick per snake, like the engine's input queue, and acks the
+# last one it used. The client draws its own snake ahead of the server
+# (prediction): the last confirmed body, moved on by the turns not acked yet,
+# so a turn shows on the next local tick instead of after a round trip.
+
+PORT = 7777
+KEYFRAME_TICKS = 50  # Ticks between two keyframes
+MAX_LEAD = 2  # Ticks the predicted snake may run ahead of the last tick received
+PING_INTERVAL = 1.0  # Seconds between two pings
+MAX_MESSAGE = 1 << 24  # Longest message accepted, in bytes
+FOOD_KINDS = tuple(FOOD_POINTS)
+
+# Message types, server to client then client to server
+WELCOME, KEYFRAME, DELTA, PONG = b"WKDQ"
+INPUT, PING, RESYNC = b"IPR"
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def frame(payload):
+    return struct.pack("<I", len(payload)) + payload
+
+
+async def read_message(reader):
+    (length,) = struct.unpack("<I", await reader.readexactly(4))
+    if not 0 < length <= MAX_MESSAGE:
+        raise ProtocolError(f"Bad message length {length}")
+    return await reader.readexactly(length)
+
+
+# Cell offset of one step in each direction, on a board `cols` cells wide
+def direction_steps(cols):
+    return [-cols if dy < 0 else cols if dy > 0 else dx for dx, dy in DIRECTIONS]
+
+
+def write_body(out, cells, cols):
+    write_varint(out, len(cells))
+    if not cells:
+        return
+    write_varint(out, cells[0])
+    steps = direction_steps(cols)
+    packed = 0
+    for i in range(1, len(cells)):
+        packed |= steps.index(cells[i] - cells[i - 1]) << 2 * ((i - 1) % 4)
+        if i % 4 == 0 or i == len(cells) - 1:
+            out.append(packed)
+            packed = 0
+
+
+def read_body(data, pos, cols):
+    length, pos = read_varint(data, pos)
+    if not length:
+        return [], pos
+    cell, pos = read_varint(data, pos)
+    cells = [cell]
+    steps = direction_steps(cols)
+    for i in range(1, length):
+        if (i - 1) % 4 == 0:
+            packed = data[pos]
+            pos += 1
+        cell += steps[packed >> 2 * ((i - 1) % 4) & 3]
+        cells.append(cell)
+    return cells, pos
+
+
+# Sequence number and direction of an INPUT message
+def decode_input(payload):
+    try:
+        seq, pos = read_varint(payload, 1)
+        return seq, payload[pos]
+    except (VarintError, IndexError):
+        raise ProtocolError("Truncated input message")
+
+
+def encode_welcome(number, state, keyframe_ticks):
+    out = bytearray([WELCOME])
+    for value in (number, state.cols, state.rows, state.interval, keyframe_ticks):
+        write_varint(out, value)
+    return bytes(out)
+
+
+# Tick and input ack that start keyframes and deltas, the only per-client part of them
+def encode_header(kind, tick, ack):
+    out = bytearray([kind])
+    write_varint(out, tick)
+    write_varint(out, ack)
+    return bytes(out)
+
+
+def encode_keyframe(state):
+    grid = state.grid
+    out = bytearray()
+    write_varint(out, len(state.walls))
+    for x, y, width, height in state.walls:
+        write_varint(out, grid.index_of(x, y))
+        write_varint(out, width // CELL_SIZE)
+        write_varint(out, height // CELL_SIZE)
+    write_varint(out, len(state.food))
+    for cell, kind in state.food.items():
+        write_varint(out, cell)
+        out.append(FOOD_KINDS.index(kind))
+    write_varint(out, len(state.snakes))
+    for snake in state.snakes:
+        write_varint(out, snake.score)
+        write_body(out, list(snake.body) if snake.alive else [], state.cols)
+        if snake.alive:
+            out.append(snake.direction)
+            write_varint(out, snake.growing)
+    return bytes(out)
+
+
+# What a step changed, from the state's events, which come in this order
+def encode_delta(events, cols):
+    moves = []
+    deaths = []
+    eats = []
+    foods = []
+    spawns = []
+    last = -1
+    for event in events:
+        name = event[0]
+        if name == "move":
+            _, number, direction, kept_tail = event
+            moves.append((number - last - 1) << 3 | kept_tail << 2 | direction)
+            last = number
+        elif name == "die":
+            deaths.append(event[1])
+        elif name == "eat":
+            eats.append(event[1:])
+        elif name == "food":
+            foods.append(event[1:])
+        elif name == "spawn":
+            spawns.append(event[1:])
+    out = bytearray()
+    write_varint(out, len(moves))
+    for move in moves:
+        write_varint(out, move)
+    write_varint(out, len(deaths))
+    for number in deaths:
+        write_varint(out, number)
+    write_varint(out, len(eats))
+    for number, cell in eats:
+        write_varint(out, number)
+        write_varint(out, cell)
+    write_varint(out, len(foods))
+    for cell, kind in foods:
+        write_varint(out, cell)
+        out.append(FOOD_KINDS.index(kind))
+    write_varint(out, len(spawns))
+    for number, direction, cells in spawns:
+        write_varint(out, number)
+        out.append(direction)
+        write_body(out, cells, cols)
+    return bytes(out)
+
+
+# Client-side copy of the server's arena, built from keyframes and deltas. It has what
+# arenaview.ArenaItem draws (grid, owner, food, changed), with the player's own snake
+# shown where prediction puts it rather than where the server last saw it.
+class ArenaMirror:
+    def __init__(self):
+        self.ready = False  # Set by the first keyframe
+        self.number = -1  # The player's snake
+        self.snakes = []
+        self.food = {}
+        self.walls = []
+        self.changed = None
+        self.profiler = None  # Not used, set by MainWindow like on the other states
+        self.profiled = ()  # Phases step() laps: none, the server runs the game
+        self.events = []
+        self.tick = 0  # Last server tick applied
+        self.tick_count = 0  # Local tick, up to MAX_LEAD ahead of `tick`
+        self.stale = False  # Missed a delta: waiting for a keyframe
+        self.pending = deque()  # (seq, direction) of the turns sent and not acked yet
+        self.seq = 0
+        self.shown = []  # Cells the player's snake is drawn on
+        self.send_input = None  # Set by the client: sends (seq, direction) to the server
+        self.predicted = {}  # Tick -> predicted head of the player's snake, to check against the server
+        self.predictions = 0
+        self.mispredictions = 0
+        self.checked = 0  # Keyframes compared with the board built from the deltas
+        self.desyncs = 0  # Keyframes that disagreed with it
+
+    def setup(self, number, cols, rows, interval):
+        self.number = number
+        self.cols = cols
+        self.rows = rows
+        self.interval = interval
+        self.rect = board_rect(cols, rows)
+        self.steps = direction_steps(cols)
+        self.snakes = []
+        self.food = {}
+        self.walls = []
+        self.grid = OccupancyGrid(self.rect, CELL_SIZE)
+        self.owner = [-1] * (cols * rows)
+
+    @property
+    def score(self):
+        return self.snakes[self.number].score if self.ready else 0
+
+    @property
+    def count(self):
+        return len(self.snakes)
+
+    @property
+    def alive(self):
+        return sum(snake.alive for snake in self.snakes)
+
+    # The game runs on the server: nothing to reset
+    def reset(self, seed=None):
+        pass
+
+    def add_cube(self, index, number):
+        self.grid.snake[index] += 1
+        if self.grid.snake[index] == 1:
+            self.owner[index] = number  # Like ArenaState, the cube that was there first keeps the cell
+        if self.changed is not None:
+            self.changed.append(index)
+
+    def remove_cube(self, index):
+        self.grid.snake[index] -= 1
+        if self.changed is not None:
+            self.changed.append(index)
+
+    def mark(self, index):
+        if self.changed is not None:
+            self.changed.append(index)
+
+    def apply_keyframe(self, tick, data, pos):
+        walls = []
+        count, pos = read_varint(data, pos)
+        for _ in range(count):
+            cell, pos = read_varint(data, pos)
+            width, pos = read_varint(data, pos)
+            height, pos = read_varint(data, pos)
+            walls.append((cell, width, height))
+        food = {}
+        count, pos = read_varint(data, pos)
+        for _ in range(count):
+            cell, pos = read_varint(data, pos)
+            food[cell] = FOOD_KINDS[data[pos]]
+            pos += 1
+        snakes = []
+        count, pos = read_varint(data, pos)
+        for number in range(count):
+            snake = ArenaSnake(number)
+            snake.score, pos = read_varint(data, pos)
+            cells, pos = read_body(data, pos, self.cols)
+            if cells:
+                snake.body = deque(cells)
+                snake.alive = True
+                snake.direction = data[pos]
+                snake.growing, pos = read_varint(data, pos + 1)
+            snakes.append(snake)
+
+        if self.ready and not self.stale and tick == self.tick:
+            self.checked += 1
+            if food != self.food or any(list(a.body) != list(b.body) or a.score != b.score
+                                        for a, b in zip(snakes, self.snakes)):
+                self.desyncs += 1
+
+        # Take the old snakes off the board, then put the new ones on
+        for snake in self.snakes:
+            if snake.number != self.number:
+                for cell in snake.body:
+                    self.remove_cube(cell)
+        for cell in self.shown:
+            self.remove_cube(cell)
+        self.shown = []
+        if walls != self.walls:
+            self.walls = walls
+            self.grid.blocked = bytearray(self.cols * self.rows)
+            for cell, width, height in walls:
+                x, y = self.grid.position_of(cell)
+                self.grid.add_rect(x, y, width * CELL_SIZE, height * CELL_SIZE)
+            self.changed = None if self.changed is None else list(range(self.cols * self.rows))
+        for cell in set(self.food) | set(food):
+            self.mark(cell)
+        self.food = food
+        self.snakes = snakes
+        for snake in snakes:
+            if snake.number != self.number:
+                for cell in snake.body:
+                    self.add_cube(cell, snake.number)
+        self.tick = tick
+        self.tick_count = max(self.tick_count, tick)
+        self.stale = False
+        self.ready = True
+        self.predicted.clear()
+        self.predict()
+
+    # Returns False when the delta does not follow the last tick applied
+    def apply_delta(self, tick, data, pos):
+        if self.stale or tick != self.tick + 1:
+            self.stale = True
+            return False
+        own = self.number
+        snakes = self.snakes
+        steps = self.steps
+        count, pos = read_varint(data, pos)
+        number = -1
+        for _ in range(count):
+            move, pos = read_varint(data, pos)
+            number += (move >> 3) + 1
+            snake = snakes[number]
+            direction = move & 3
+            if move & 4:
+                snake.growing -= 1
+            else:
+                cell = snake.body.pop()
+                if number != own:
+                    self.remove_cube(cell)
+            cell = snake.body[0] + steps[direction]
+            snake.body.appendleft(cell)
+            snake.direction = direction
+            if number != own:
+                self.add_cube(cell, number)
+        count, pos = read_varint(data, pos)
+        for _ in range(count):
+            number, pos = read_varint(data, pos)
+            snake = snakes[number]
+            if number != own:
+                for cell in snake.body:
+                    self.remove_cube(cell)
+            snake.body.clear()
+            snake.alive = False
+        count, pos = read_varint(data, pos)
+        for _ in range(count):
+            number, pos = read_varint(data, pos)
+            cell, pos = read_varint(data, pos)
+            snake = snakes[number]
+            snake.score += FOOD_POINTS[self.food.pop(cell)]
+            snake.growing += 1
+            self.mark(cell)
+        count, pos = read_varint(data, pos)
+        for _ in range(count):
+            cell, pos = read_varint(data, pos)
+            self.food[cell] = FOOD_KINDS[data[pos]]
+            pos += 1
+            self.mark(cell)
+        count, pos = read_varint(data, pos)
+        for _ in range(count):
+            number, pos = read_varint(data, pos)
+            snake = snakes[number]
+            snake.direction = data[pos]
+            cells, pos = read_body(data, pos + 1, self.cols)
+            snake.body = deque(cells)
+            snake.growing = 0
+            snake.alive = True
+            if number != own:
+                for cell in cells:
+                    self.add_cube(cell, number)
+
+        self.tick = tick
+        self.tick_count = max(self.tick_count, tick)
+        head = self.predicted.pop(tick, None)
+        if head is not None:
+            self.predictions += 1
+            snake = snakes[own]
+            self.mispredictions += head != (snake.body[0] if snake.alive else -1)
+        self.predict()
+        return True
+
+    # Drop the turns the server has used, up to `ack`
+    def acked(self, ack):
+        pending = self.pending
+        while pending and pending[0][0] <= ack:
+            pending.popleft()
+
+    # Buffer a turn like GameState.queue_direction, send it and show it right away
+    def queue_direction(self, direction):
+        if not self.ready:
+            return
+        direction = DIRECTIONS.index(direction)
+        last = self.pending[-1][1] if self.pending else self.snakes[self.number].direction
+        if direction == last or direction == OPPOSITE[last] or len(self.pending) >= INPUT_QUEUE_SIZE:
+            return
+        self.seq += 1
+        self.pending.append((self.seq, direction))
+        if self.send_input is not None:
+            self.send_input(self.seq, direction)
+
+    # One local tick: the predicted snake moves on, at most MAX_LEAD ticks ahead of the server
+    def step(self):
+        self.events = []
+        if self.ready and self.tick_count < self.tick + MAX_LEAD:
+            self.tick_count += 1
+            self.predict()
+        return self.events
+
+    # Show the player's snake at the local tick: its last confirmed body, moved on with the turns
+    # the server has not acked yet, one per tick as the server will apply them
+    def predict(self):
+        snake = self.snakes[self.number]
+        body = deque(snake.body)
+        self.predicted = {}
+        if snake.alive:
+            direction = snake.direction
+            growing = snake.growing
+            turns = iter(self.pending)
+            for tick in range(self.tick + 1, self.tick_count + 1):
+                turn = next(turns, None)
+                if turn is not None and turn[1] != OPPOSITE[direction]:
+                    direction = turn[1]
+                col = body[0] % self.cols
+                if (direction == 2 and col == 0) or (direction == 3 and col == self.cols - 1):
+                    break
+                cell = body[0] + self.steps[direction]
+                if not 0 <= cell < len(self.owner):
+                    break
+                if growing:
+                    growing -= 1
+                else:
+                    body.pop()
+                body.appendleft(cell)
+                self.predicted[tick] = cell
+        for cell in self.shown:
+            self.remove_cube(cell)
+        self.shown = list(body)
+        for cell in self.shown:
+            self.add_cube(cell, self.number)
+
+
+class NetClient:
+    def __init__(self, mirror=None):
+        self.mirror = mirror  # None: only read the headers, for the simulated clients of the load test
+        if mirror is not None:
+            mirror.send_input = self.send_input
+        self.reader = None
+        self.writer = None
+        self.loop = None
+        self.inbox = None  # Messages for the GUI thread to apply, when the network runs in a thread of its own
+        self.connected = False
+        self.ack = 0
+        self.seq = 0
+        self.sent_inputs = {}  # seq -> time it was sent, until acked
+        self.last_ping = 0
+        self.rtts = deque(maxlen=1000)  # Round trip times, in ms
+        self.input_latencies = deque(maxlen=1000)  # Time from sending a turn to seeing it acked, in ms
+        self.received = {WELCOME: 0, KEYFRAME: 0, DELTA: 0, PONG: 0}  # Bytes received by message type
+        self.started = time.perf_counter()
+
+    async def connect(self, host, port):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        self.writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.loop = asyncio.get_running_loop()
+        self.connected = True
+        self.started = time.perf_counter()
+
+    async def receive(self):
+        try:
+            while True:
+                payload = await read_message(self.reader)
+                if self.inbox is not None:
+                    self.inbox.put(payload)
+                else:
+                    self.handle(payload)
+        except (asyncio.IncompleteReadError, ConnectionError, ProtocolError):
+            pass
+        finally:
+            self.connected = False
+            if self.inbox is not None:
+                self.inbox.put(None)
+
+    # Apply one message from the server, raising ProtocolError when it does not decode
+    def handle(self, payload):
+        try:
+            self.apply_message(payload)
+        except (ValueError, IndexError, KeyError, struct.error) as e:
+            raise ProtocolError(f"Malformed message from the server: {e}")
+
+    def apply_message(self, payload):
+        kind = payload[0]
+        self.received[kind] = self.received.get(kind, 0) + len(payload) + 4
+        if kind == PONG:
+            (sent,) = struct.unpack_from("<d", payload, 1)
+            self.rtts.append((time.perf_counter() - sent) * 1000)
+            return
+        if kind == WELCOME:
+            values = []
+            pos = 1
+            for _ in range(5):
+                value, pos = read_varint(payload, pos)
+                values.append(value)
+            if self.mirror is not None:
+                self.mirror.setup(*values[:4])
+            return
+        tick, pos = read_varint(payload, 1)
+        ack, pos = read_varint(payload, pos)
+        self.acked(ack)
+        mirror = self.mirror
+        if mirror is None:
+            return
+        mirror.acked(ack)
+        if kind == KEYFRAME:
+            mirror.apply_keyframe(tick, payload, pos)
+        elif kind == DELTA and not mirror.apply_delta(tick, payload, pos):
+            self.send(bytes([RESYNC]))
+
+    def acked(self, ack):
+        now = time.perf_counter()
+        for seq in range(self.ack + 1, ack + 1):
+            sent = self.sent_inputs.pop(seq, None)
+            if sent is not None:
+                self.input_latencies.append((now - sent) * 1000)
+        self.ack = max(self.ack, ack)
+
+    def send(self, payload):
+        if not self.connected:
+            return
+        if self.inbox is not None:
+            self.loop.call_soon_threadsafe(self.writer.write, frame(payload))
+        else:
+            self.writer.write(frame(payload))
+
+    def send_input(self, seq, direction):
+        self.sent_inputs[seq] = time.perf_counter()
+        out = bytearray([INPUT])
+        write_varint(out, seq)
+        out.append(direction)
+        self.send(bytes(out))
+
+    # Turn without a mirror to check it against: the server ignores turns that reverse the snake
+    def turn(self, direction):
+        if self.mirror is not None:
+            self.mirror.queue_direction(DIRECTIONS[direction])
+        else:
+            self.seq += 1
+            self.send_input(self.seq, direction)
+
+    def ping(self):
+        now = time.perf_counter()
+        if now - self.last_ping >= PING_INTERVAL:
+            self.last_ping = now
+            self.send(bytes([PING]) + struct.pack("<d", now))
+
+    def close(self):
+        if self.writer is not None and self.connected:
+            if self.inbox is not None:
+                self.loop.call_soon_threadsafe(self.writer.close)
+            else:
+                self.writer.close()
+        self.connected = False
+
+    # Run the connection in a daemon thread, for the GUI: returns once the first keyframe is applied
+    def start_thread(self, host, port, timeout=5):
+        self.inbox = queue.Queue()
+        failed = []
+        connected = threading.Event()
+
+        async def run():
+            try:
+                await self.connect(host, port)
+            except OSError as e:
+                failed.append(e)
+                return
+            finally:
+                connected.set()
+            await self.receive()
+
+        threading.Thread(target=asyncio.run, args=(run(),), name="net-client", daemon=True).start()
+        connected.wait(timeout)
+        if failed:
+            raise failed[0]
+        if not self.connected:
+            raise OSError(f"Cannot connect to {host}:{port}")
+        deadline = time.perf_counter() + timeout
+        while not self.mirror.ready:
+            try:
+                payload = self.inbox.get(timeout=max(0, deadline - time.perf_counter()))
+            except queue.Empty:
+                payload = None
+            if payload is None:
+                raise OSError(f"No game state from {host}:{port}")
+            self.handle(payload)
+
+    # Apply what arrived since the last call (GUI thread), and ping now and then
+    def poll(self):
+        while True:
+            try:
+                payload = self.inbox.get_nowait()
+            except queue.Empty:
+                break
+            if payload is None:
+                break
+            try:
+                self.handle(payload)
+            except ProtocolError as e:
+                print(e)
+                self.send(bytes([RESYNC]))
+        self.ping()
+
+    # Bandwidth and latency figures, for the overlay and the load test
+    def summary(self):
+        elapsed = max(1e-9, time.perf_counter() - self.started)
+        rtts = sorted(self.rtts)
+        latencies = sorted(self.input_latencies)
+        lines = [f"net in {sum(self.received.values()) / elapsed / 1000:.1f} kB/s "
+                 f"(delta {self.received[DELTA] / elapsed / 1000:.1f}, keyframe {self.received[KEYFRAME] / elapsed / 1000:.1f})"]
+        if rtts:
+            lines.append(f"rtt {rtts[len(rtts) // 2]:.1f} ms, max {rtts[-1]:.1f} ms")
+        if latencies:
+            lines.append(f"input ack {latencies[len(latencies) // 2]:.0f} ms, max {latencies[-1]:.0f} ms")
+        if self.mirror is not None and self.mirror.predictions:
+            lines.append(f"mispredicted {self.mirror.mispredictions}/{self.mirror.predictions}, desyncs {self.mirror.desyncs}/{self.mirror.checked}")
+        return lines
@@ -0,0 +1,28 @@
+from PySide6.QtGui import QBrush, QColor
+
+# Colors of the game, shared by the window and the offscreen renderer. Only
+# QtGui is needed, so render workers can draw with the game's colors without
+# importing the window and everything it sets up.
+
+# Color of every kind of item in the scene, by role
+PALETTE = {
+    "background": "black",
+    "snake": "green",
+    "snake_shielded": "purple",
+    "normal": "orange",
+    "golden": "gold",
+    "speed_boost": "cyan",
+    "slow_down": "blue",
+    "shield": "purple",
+    "wall": "gray",
+    "moving": "red",
+    "player": "white",
+}
+brushes = {}  # role -> QBrush, built once and shared by all items
+
+
+def brush(role):
+    cached = brushes.get(role)
+    if cached is None:
+        cached = brushes[role] = QBrush(QColor(PALETTE[role]))
+    return cached
@@ -0,0 +1,91 @@
+import csv
+from array import array
+from time import perf_counter_ns
+
+from stats import percentile
+
+# Per-phase tick profiler. Each tick gets one row of nanosecond timings in a
+# fixed-size ring buffer (one flat array, no allocation per tick), filled by
+# lap() calls at the end of every phase: GameState.step times its own phases
+# when it has a profiler, MainWindow adds event handling and rendering. With
+# no profiler attached the game only pays an `is not None` check per phase.
+# A profiler reports only the phases it is given, those the game it times
+# laps: a single-player game has no AI or eat phase, an arena no timers or
+# movers.
+
+PHASES = ("timers", "ai", "movers", "snake", "collision", "eat", "events", "render")
+TIMERS, AI, MOVERS, SNAKE, COLLISION, EAT, EVENTS, RENDER = range(len(PHASES))
+CAPACITY = 600  # Ticks kept, about a minute and a half at the base speed
+
+
+class Profiler:
+    def __init__(self, phases=tuple(range(len(PHASES))), capacity=CAPACITY):
+        self.capacity = capacity
+        self.phases = phases  # Phases reported by summary() and write_csv(), by index
+        self.names = tuple(PHASES[phase] for phase in phases)
+        self.samples = array("q", bytes(8 * capacity * len(PHASES)))  # capacity rows of len(PHASES) timings
+        self.zeros = array("q", bytes(8 * len(PHASES)))
+        self.ticks = array("q", bytes(8 * capacity))
+        self.budgets = array("q", bytes(8 * capacity))  # Tick interval of each row, in ns
+        self.row = -1  # Row being filled, -1 before the first tick
+        self.count = 0
+        self.last = 0
+
+    def clear(self):
+        self.row = -1
+        self.count = 0
+
+    # Start a new row for a tick that has `interval` ms to run in
+    def begin(self, tick, interval):
+        self.row = (self.row + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        base = self.row * len(PHASES)
+        self.samples[base:base + len(PHASES)] = self.zeros
+        self.ticks[self.row] = tick
+        self.budgets[self.row] = interval * 1_000_000
+        self.last = perf_counter_ns()
+
+    # Restart the clock without charging the time since the last lap to any phase
+    def mark(self):
+        self.last = perf_counter_ns()
+
+    # Charge the time since the last lap (or mark) to a phase of the current row
+    def lap(self, phase):
+        now = perf_counter_ns()
+        if self.row >= 0:
+            self.samples[self.row * len(PHASES) + phase] += now - self.last
+        self.last = now
+
+    # Rows in tick order, oldest first
+    def rows(self):
+        start = (self.row - self.count + 1) % self.capacity
+        for i in range(self.count):
+            row = (start + i) % self.capacity
+            base = row * len(PHASES)
+            yield self.ticks[row], self.budgets[row], self.samples[base:base + len(PHASES)]
+
+    # {phase: (p50, p99)} in microseconds, plus "total" and "budget" (share of the tick interval used, in %)
+    def summary(self):
+        columns = [[] for _ in self.phases]
+        totals = []
+        budgets = []
+        for tick, budget, samples in self.rows():
+            for column, phase in zip(columns, self.phases):
+                column.append(samples[phase] / 1000)
+            total = sum(samples)
+            totals.append(total / 1000)
+            budgets.append(100 * total / budget)
+        summary = {}
+        for name, values in zip(self.names + ("total", "budget"), columns + [totals, budgets]):
+            values.sort()
+            summary[name] = (percentile(values, 50), percentile(values, 99))
+        return summary
+
+    def write_csv(self, path):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["tick", "interval_ms"] + [f"{name}_us" for name in self.names] + ["total_us", "budget_pct"])
+            for tick, budget, samples in self.rows():
+                total = sum(samples)
+                writer.writerow([tick, budget // 1_000_000] + [f"{samples[phase] / 1000:.2f}" for phase in self.phases]
+                                + [f"{total / 1000:.2f}", f"{100 * total / budget:.2f}"])
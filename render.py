@@ -0,0 +1,200 @@
+import argparse
+import os
+import struct
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")  # No window is ever shown, so no display is needed
+
+from PySide6.QtCore import QRect, Qt
+from PySide6.QtGui import QColor, QGuiApplication, QImage, QPainter, QPen
+
+from engine import CELL_SIZE, SCENE_RECT
+from palette import PALETTE, brush
+from replay import Replay, ReplayError
+
+# Offscreen renderer: draws game states into a QImage with the colors and
+# sizes of the window's items (Food, Obstacle and the Snake cubes), for
+# thumbnails, bug reports and datasets. Each renderer owns one image and
+# draws every frame into it, so a frame costs no allocation; callers that
+# keep a frame must copy it. Many replays are rendered at once on a process
+# pool, each worker with its own renderer, into PNG sequences or packed raw
+# frame files. PNGs are encoded here rather than by QImage.save, which takes
+# about three times as long on these flat-colored frames: the pixels are
+# copied into a reused row buffer and deflated at a low level.
+#
+# Raw frame files hold:
+#
+#   magic b"QSFR", version (u8), width, height (u16), bytes per line (u32),
+#   then per frame the tick (u32) and height x bytes per line of pixels
+#   (32-bit, 0xffRRGGBB little-endian, as in QImage.Format_RGB32)
+#
+# where all numbers are little-endian. The number of frames follows from the
+# file size.
+#
+#   python render.py replays/*.qsr --out frames            PNG sequences
+#   python render.py replays/*.qsr --out frames --raw      one .qsf file per replay
+
+RAW_MAGIC = b"QSFR"
+RAW_VERSION = 1
+PNG_LEVEL = 1  # zlib level: the frames are mostly flat color, so the fastest level still packs them to ~10 kB
+
+
+class FrameRenderer:
+    def __init__(self, scale=1.0):
+        left, top, width, height = SCENE_RECT
+        self.scale = scale
+        self.image = QImage(round(width * scale), round(height * scale), QImage.Format_RGB32)
+        self.origin = (left, top)
+        self.brushes = {role: brush(role) for role in PALETTE}
+        self.outline = QPen(QColor("black"))  # Snake cubes and food have a black outline, obstacles none
+        self.rows = None  # PNG scanlines (a filter byte, then RGB), built on first use
+        self.frames = 0
+
+    # Draw a GameState into the renderer's image and return it; the image is reused by the next call.
+    # Food is drawn over obstacles: in the window their stacking follows the order the items were added,
+    # which only shows when a moving obstacle passes over food
+    def draw(self, state):
+        painter = QPainter(self.image)
+        painter.fillRect(self.image.rect(), self.brushes["background"])
+        painter.scale(self.scale, self.scale)
+        painter.translate(-self.origin[0], -self.origin[1])
+
+        painter.setPen(self.outline)
+        painter.setBrush(self.brushes["snake_shielded" if state.shielded else "snake"])
+        painter.drawRects([QRect(x, y, CELL_SIZE, CELL_SIZE) for x, y in reversed(state.body)])  # Head on top
+
+        painter.setPen(Qt.NoPen)
+        for obstacle in state.obstacles:
+            painter.setBrush(self.brushes["wall" if obstacle.kind == "wall" else "moving"])
+            painter.drawRect(QRect(obstacle.x, obstacle.y, obstacle.width, obstacle.height))
+        painter.setPen(self.outline)
+        for item in (state.food, state.shield_food):
+            if item is not None:
+                painter.setBrush(self.brushes.get(item.kind, self.brushes["normal"]))
+                painter.drawRect(QRect(item.x, item.y, item.width, item.height))
+        painter.end()
+        self.frames += 1
+        return self.image
+
+    # The last image drawn, encoded as a PNG file
+    def png(self, level=PNG_LEVEL):
+        image = self.image
+        width, height = image.width(), image.height()
+        if self.rows is None:
+            self.rows = np.zeros((height, 1 + 3 * width), np.uint8)  # Filter byte 0 (none) on every row
+        pixels = np.frombuffer(image.constBits(), np.uint8).reshape(height, image.bytesPerLine())
+        self.rows[:, 1:].reshape(height, width, 3)[:] = pixels[:, :4 * width].reshape(height, width, 4)[:, :, 2::-1]
+        return b"".join((b"\x89PNG\r\n\x1a\n",
+                         png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)),
+                         png_chunk(b"IDAT", zlib.compress(self.rows, level)),
+                         png_chunk(b"IEND", b"")))
+
+
+def png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+# Set up by init_worker in every process of the pool
+renderer = None
+
+
+def init_worker(scale):
+    global renderer
+    QGuiApplication.instance() or QGuiApplication([])
+    renderer = FrameRenderer(scale)
+
+
+# Worker entry point: render one replay, every `every` ticks and its last tick. Returns
+# (path, frames, seconds drawing, seconds in total) or raises ReplayError/OSError.
+def render_replay(path, out_dir, every, raw):
+    started = time.perf_counter()
+    replay = Replay.load(path)
+    name = os.path.splitext(os.path.basename(path))[0]
+    image = renderer.image
+    drawing = 0
+    frames = 0
+    if raw:
+        out = open(os.path.join(out_dir, name + ".qsf"), "wb")
+        out.write(RAW_MAGIC + struct.pack("<BHHI", RAW_VERSION, image.width(), image.height(), image.bytesPerLine()))
+    else:
+        frame_dir = os.path.join(out_dir, name)
+        os.makedirs(frame_dir, exist_ok=True)
+    try:
+        for state in replay.play():
+            last = state.over or state.tick_count >= replay.final_tick
+            if state.tick_count % every and not last:
+                continue
+            start = time.perf_counter()
+            renderer.draw(state)
+            drawing += time.perf_counter() - start
+            if raw:
+                out.write(struct.pack("<I", state.tick_count))
+                out.write(image.constBits())
+            else:
+                with open(os.path.join(frame_dir, f"{state.tick_count:06d}.png"), "wb") as f:
+                    f.write(renderer.png())
+            frames += 1
+    finally:
+        if raw:
+            out.close()
+    return path, frames, drawing, time.perf_counter() - started
+
+
+# Frames of a raw file written by render_replay, as (tick, QImage) pairs
+def read_raw(path):
+    with open(path, "rb") as f:
+        header = f.read(13)
+        if header[:4] != RAW_MAGIC:
+            raise ReplayError("Not a QtSnake frame file")
+        version, width, height, bytes_per_line = struct.unpack("<BHHI", header[4:])
+        if version != RAW_VERSION:
+            raise ReplayError(f"Unsupported frame file version {version}")
+        while True:
+            tick = f.read(4)
+            pixels = f.read(height * bytes_per_line)
+            if len(pixels) < height * bytes_per_line:
+                return
+            yield struct.unpack("<I", tick)[0], QImage(pixels, width, height, bytes_per_line, QImage.Format_RGB32).copy()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render replays offscreen into PNG sequences or raw frame files")
+    parser.add_argument("replays", nargs="+")
+    parser.add_argument("--out", default="frames", help="output directory")
+    parser.add_argument("--raw", action="store_true", help="write one packed raw frame file per replay instead of PNGs")
+    parser.add_argument("--every", type=int, default=1, help="render every Nth tick (the last tick is always rendered)")
+    parser.add_argument("--scale", type=float, default=1.0, help="image size relative to the 800x400 playfield")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    frames = 0
+    drawing = 0
+    failed = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker, initargs=(args.scale,)) as executor:
+        futures = [executor.submit(render_replay, path, args.out, max(1, args.every), args.raw) for path in args.replays]
+        for future in as_completed(futures):
+            try:
+                path, count, draw_time, total_time = future.result()
+            except (OSError, ReplayError) as e:
+                print(f"Cannot render: {e}")
+                failed += 1
+                continue
+            frames += count
+            drawing += draw_time
+            print(f"{path}: {count} frames, {count / total_time:,.0f} fps")
+    elapsed = time.perf_counter() - start
+    if frames:
+        print(f"{frames:,} frames from {len(args.replays) - failed} replays in {elapsed:.2f} s with {args.workers} workers: "
+              f"{frames / elapsed:,.0f} fps overall, {frames / drawing:,.0f} fps per worker drawing only")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
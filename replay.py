@@ -0,0 +1,241 @@
+import argparse
+import hashlib
+import os
+import random
+import struct
+import sys
+import time
+
+from engine import DIRECTIONS, LEVEL_FILE, LEVELS_DIR, POLICIES, GameState, load_levels
+from levels import LevelError
+from varint import VarintError, read_varint, write_varint
+
+# Deterministic record/replay. A game is fully determined by its seed (which
+# seeds every random stream of GameState) and the ticks at which the snake
+# changed direction, so a replay stores only those, plus the level file the
+# game followed, the final tick, score and a hash of the final state to verify
+# against:
+#
+#   magic b"QSRP", version (u8), seed (u64), level file name length and
+#   UTF-8 name (empty for the built-in levels), level file hash (8 bytes),
+#   final tick, final score, state hash (8 bytes), event count, then one
+#   varint per input event holding (tick delta << 2) | direction index
+#
+# where every unsized number is an unsigned LEB128 varint. Version 1 replays
+# have no level fields and were played on the built-in levels. The level file
+# is named relative to the levels directory, with "/" separators, so replays
+# can be shared between machines; a file from elsewhere is stored by its name
+# alone and has to be copied into the levels directory to replay the game.
+
+MAGIC = b"QSRP"
+VERSION = 2
+
+
+class ReplayError(Exception):
+    pass
+
+
+# Hash of everything that decides how the game goes on from here
+def state_hash(state):
+    h = hashlib.blake2b(digest_size=8)
+    h.update(struct.pack("<qqqqqq?", state.tick_count, state.score, state.level,
+                         state.food_count, state.shields, state.interval, state.over))
+    h.update(repr(list(state.body)).encode())
+    for item in [state.food, state.shield_food] + state.obstacles:
+        if item is not None:
+            h.update(repr((item.kind, item.x, item.y, item.width, item.height, item.vx, item.vy)).encode())
+    return h.digest()
+
+
+class Replay:
+    def __init__(self, seed, inputs, final_tick, final_score, final_hash, level_file="", level_hash=None):
+        self.seed = seed
+        self.inputs = inputs  # (tick, direction) pairs in tick order
+        self.final_tick = final_tick
+        self.final_score = final_score
+        self.final_hash = final_hash
+        self.level_file = level_file  # Relative to LEVELS_DIR, "" for the built-in levels
+        self.level_hash = level_hash  # First 8 bytes of the level file's sha256, None when not recorded
+
+    @classmethod
+    def from_state(cls, state):
+        levels = state.levels
+        level_file = os.path.relpath(levels.path, LEVELS_DIR)
+        if level_file.startswith(os.pardir) or os.path.isabs(level_file):  # Not in the levels directory (or on another drive)
+            level_file = os.path.basename(levels.path)
+        level_file = "" if levels.path == LEVEL_FILE else level_file.replace(os.sep, "/")
+        return cls(state.seed, list(state.input_log), state.tick_count, state.score, state_hash(state),
+                   level_file, bytes.fromhex(levels.digest)[:8])
+
+    def to_bytes(self):
+        out = bytearray(MAGIC)
+        out += struct.pack("<BQ", VERSION, self.seed)
+        level_file = self.level_file.encode()
+        write_varint(out, len(level_file))
+        out += level_file
+        out += self.level_hash or bytes(8)
+        write_varint(out, self.final_tick)
+        write_varint(out, self.final_score)
+        out += self.final_hash
+        write_varint(out, len(self.inputs))
+        last_tick = 0
+        for tick, direction in self.inputs:
+            write_varint(out, (tick - last_tick) << 2 | DIRECTIONS.index(direction))
+            last_tick = tick
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data):
+        if data[:4] != MAGIC:
+            raise ReplayError("Not a QtSnake replay")
+        if len(data) < 13:
+            raise ReplayError("Truncated replay")
+        version, seed = struct.unpack_from("<BQ", data, 4)
+        if version not in (1, VERSION):
+            raise ReplayError(f"Unsupported replay version {version}")
+        try:
+            pos = 13
+            level_file = ""
+            level_hash = None
+            if version >= 2:
+                length, pos = read_varint(data, pos)
+                try:
+                    level_file = bytes(data[pos:pos + length]).decode()
+                except UnicodeDecodeError:
+                    raise ReplayError("Damaged replay")
+                level_hash = bytes(data[pos + length:pos + length + 8])
+                pos += length + 8
+            final_tick, pos = read_varint(data, pos)
+            final_score, pos = read_varint(data, pos)
+            final_hash = bytes(data[pos:pos + 8])
+            pos += 8
+            count, pos = read_varint(data, pos)
+            inputs = []
+            tick = 0
+            for _ in range(count):
+                value, pos = read_varint(data, pos)
+                tick += value >> 2
+                inputs.append((tick, DIRECTIONS[value & 3]))
+        except VarintError:
+            raise ReplayError("Truncated replay")
+        return cls(seed, inputs, final_tick, final_score, final_hash, level_file, level_hash)
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+    # Path of the level file in the levels directory
+    def level_path(self):
+        if not self.level_file:
+            return LEVEL_FILE
+        parts = self.level_file.split("/")
+        if os.path.isabs(self.level_file) or ".." in parts:  # Recorded with a full path, or leading out of the directory
+            parts = parts[-1:]
+        return os.path.join(LEVELS_DIR, *parts)
+
+    # Level set the game was played with; raises ReplayError when it cannot be loaded or has changed since
+    def levels(self):
+        path = self.level_path()
+        if not os.path.exists(path):
+            raise ReplayError(f"The replay was played on {self.level_file}; copy that level file into {LEVELS_DIR} to replay it")
+        try:
+            levels = load_levels(path)
+        except LevelError as e:
+            raise ReplayError(f"Cannot load the levels of the replay: {e}")
+        if self.level_hash is not None and bytes.fromhex(levels.digest)[:8] != self.level_hash:
+            raise ReplayError(f"Level file {path} is not the one the replay was recorded on")
+        return levels
+
+    # Re-simulate the game headless, yielding the state before the first tick and after every tick
+    def play(self):
+        state = GameState(self.seed, self.levels())
+        yield state
+        inputs = iter(self.inputs)
+        next_input = next(inputs, None)
+        while state.tick_count < self.final_tick and not state.over:
+            if next_input is not None and next_input[0] == state.tick_count + 1:
+                state.direction = next_input[1]  # Already validated when it was recorded
+                next_input = next(inputs, None)
+            state.step()
+            yield state
+
+    # Re-simulate the game headless and return the final state
+    def simulate(self):
+        for state in self.play():
+            pass
+        return state
+
+    def verify(self):
+        state = self.simulate()
+        return state.score == self.final_score and state_hash(state) == self.final_hash, state
+
+
+def record(policy_name, seed, max_ticks, levels=None):
+    policy = POLICIES[policy_name]
+    state = GameState(seed, levels)
+    rng = random.Random(seed)
+    while not state.over and state.tick_count < max_ticks:
+        direction = policy(state, rng)
+        if direction is not None:
+            state.change_direction(direction)
+        state.step()
+    return Replay.from_state(state)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record and verify QtSnake replays")
+    commands = parser.add_subparsers(dest="command", required=True)
+    verify_parser = commands.add_parser("verify", help="re-simulate replays and check their final score and state")
+    verify_parser.add_argument("files", nargs="+")
+    record_parser = commands.add_parser("record", help="play a headless game with a policy and save its replay")
+    record_parser.add_argument("file")
+    record_parser.add_argument("--policy", choices=sorted(POLICIES), default="greedy")
+    record_parser.add_argument("--seed", type=int, default=None)
+    record_parser.add_argument("--max-ticks", type=int, default=100000)
+    record_parser.add_argument("--levels", default=LEVEL_FILE, help="level file to play (JSON or TOML)")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        seed = args.seed if args.seed is not None else random.getrandbits(63)
+        try:
+            levels = load_levels(args.levels)
+        except LevelError as e:
+            print(e)
+            return 1
+        replay = record(args.policy, seed, args.max_ticks, levels)
+        replay.save(args.file)
+        print(f"Recorded seed {replay.seed}: {replay.final_tick} ticks, score {replay.final_score}, "
+              f"{len(replay.inputs)} inputs, {len(replay.to_bytes())} bytes")
+        return 0
+
+    failures = 0
+    for path in args.files:
+        try:
+            replay = Replay.load(path)
+        except (OSError, ReplayError) as e:
+            print(f"{path}: cannot read replay: {e}")
+            failures += 1
+            continue
+        start = time.perf_counter()
+        try:
+            ok, state = replay.verify()
+        except ReplayError as e:
+            print(f"{path}: cannot verify replay: {e}")
+            failures += 1
+            continue
+        elapsed = time.perf_counter() - start
+        status = "OK" if ok else "MISMATCH"
+        rate = state.tick_count / elapsed if elapsed else 0
+        print(f"{path}: {status} - seed {replay.seed}, {state.tick_count} ticks in {elapsed:.2f} s ({rate:,.0f} ticks/s), "
+              f"score {state.score} (recorded {replay.final_score})")
+        failures += not ok
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
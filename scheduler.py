@@ -0,0 +1,79 @@
+import heapq
+import itertools
+
+# Tick-driven effect scheduler. Timed effects (speed resets, invincibility,
+# shield spawns, message hiding) are keyed entries in one heap, due a number
+# of game ticks from now, so they pause with the game, replay identically
+# headless and are all dropped by clear() on reset. Scheduling a key that is
+# already pending follows a policy:
+#   REFRESH - restart the delay from now (the default)
+#   KEEP    - leave the pending entry alone
+#   STACK   - add the delay on top of what is left of the pending entry
+# Replaced and cancelled entries are skipped lazily when they reach the top of
+# the heap; the heap is rebuilt when they outnumber the live ones. Work kept
+# outside the heap, like the movers' turns, takes sequence numbers from
+# next_seq() and runs in order with the entries through run_due(before=...).
+
+REFRESH = "refresh"
+KEEP = "keep"
+STACK = "stack"
+
+
+class Scheduler:
+    def __init__(self):
+        self.now = 0
+        self.heap = []  # [due, seq, key, callback, live] entries
+        self.entries = {}  # key -> live entry
+        self.counter = itertools.count()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.now = 0
+        self.heap = []
+        self.entries = {}
+
+    def pending(self, key):
+        return key in self.entries
+
+    # Tick a pending key is due at, or None
+    def due(self, key):
+        entry = self.entries.get(key)
+        return entry[0] if entry else None
+
+    def schedule(self, key, delay, callback, policy=REFRESH):
+        entry = self.entries.get(key)
+        due = self.now + delay
+        if entry is not None:
+            if policy == KEEP:
+                return
+            if policy == STACK:
+                due = entry[0] + delay
+            entry[4] = False
+        entry = [due, next(self.counter), key, callback, True]
+        self.entries[key] = entry
+        heapq.heappush(self.heap, entry)
+        if len(self.heap) > 2 * len(self.entries) + 16:
+            self.heap = [e for e in self.heap if e[4]]
+            heapq.heapify(self.heap)
+
+    def cancel(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            entry[4] = False
+
+    # Sequence number for work kept outside the heap that has to run in order with it (see run_due)
+    def next_seq(self):
+        return next(self.counter)
+
+    # Advance to tick `now` and run everything that is due, in due order; with `before`, only
+    # what was scheduled before that sequence number
+    def run_due(self, now, before=None):
+        self.now = now
+        heap = self.heap
+        while heap and heap[0][0] <= now and (before is None or heap[0][1] < before):
+            due, seq, key, callback, live = heapq.heappop(heap)
+            if live:
+                del self.entries[key]
+                callback()
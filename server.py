@@ -0,0 +1,277 @@
+import argparse
+import asyncio
+import multiprocessing
+import random
+import socket
+import sys
+import time
+from collections import deque
+
+from arena import OPPOSITE, ArenaState
+from engine import INPUT_QUEUE_SIZE
+from netcode import (DELTA, INPUT, KEYFRAME, KEYFRAME_TICKS, PING, PONG, PORT, RESYNC, ArenaMirror, NetClient,
+                     ProtocolError, decode_input, encode_delta, encode_header, encode_keyframe, encode_welcome, frame,
+                     read_message)
+from stats import percentile
+
+# Authoritative game server for network play. It runs an arena (see arena.py)
+# on asyncio and owns every decision: clients only send turns. The first
+# `players` snakes are seats for clients; a free seat is played by the arena's
+# AI, so the board stays busy with any number of players. Every tick the
+# server applies one queued turn per player, steps the arena and sends each
+# client the delta of that tick, plus a keyframe now and then (see netcode.py
+# for the wire format). A client whose socket buffer is backed up beyond
+# MAX_BUFFERED gets no deltas until it drains, then a keyframe, so one slow
+# client costs the others nothing.
+#
+#   python server.py                       serve on port 7777
+#   python main.py --connect localhost     join as a player
+#   python server.py --load-test 200       simulated clients, with bandwidth and latency figures
+
+MAX_BUFFERED = 256 * 1024  # Bytes queued for a client before it is treated as behind
+REPORT_INTERVAL = 5.0  # Seconds between two status lines when serving
+
+
+class Connection:
+    def __init__(self, number, writer):
+        self.number = number  # Snake of this client
+        self.writer = writer
+        self.inputs = deque()  # (seq, direction) received, one is used per tick
+        self.ack = 0  # Last input used
+        self.behind = True  # Needs a keyframe before deltas make sense to it; true until the first one
+
+
+class ArenaServer:
+    def __init__(self, seed=None, players=16, bots=32, keyframe_ticks=KEYFRAME_TICKS):
+        self.state = ArenaState(seed, players + bots)
+        self.keyframe_ticks = keyframe_ticks
+        self.seats = deque(range(players))  # Snakes free for a client
+        self.connections = []
+        self.server = None
+        self.tick_times = deque(maxlen=10000)  # Time spent per tick (step, encoding, sending), in ms
+        self.sent = {DELTA: 0, KEYFRAME: 0, PONG: 0}  # Bytes sent by message type
+        self.deltas = 0  # Delta bodies encoded, one per tick
+        self.delta_bytes = 0
+        self.keyframes = 0
+        self.keyframe_bytes = 0
+        self.skipped = 0  # Deltas held back from clients that were behind
+        self.received = 0  # Bytes received from clients
+
+    async def start(self, host, port):
+        self.server = await asyncio.start_server(self.serve_client, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    # Fixed-rate game loop; `duration` in s, None to run until cancelled
+    async def run(self, duration=None, report=False):
+        loop = asyncio.get_running_loop()
+        start = next_tick = loop.time()
+        next_report = start + REPORT_INTERVAL
+        while duration is None or loop.time() - start < duration:
+            next_tick += self.state.interval / 1000
+            await asyncio.sleep(max(0, next_tick - loop.time()))
+            self.tick()
+            if report and loop.time() >= next_report:
+                next_report += REPORT_INTERVAL
+                print(self.status(loop.time() - start), flush=True)
+
+    def tick(self):
+        started = time.perf_counter()
+        state = self.state
+        for connection in self.connections:
+            if connection.inputs:
+                seq, direction = connection.inputs.popleft()
+                snake = state.snakes[connection.number]
+                if snake.alive and direction not in (snake.direction, OPPOSITE[snake.direction]):
+                    snake.script.append((state.tick_count + 1, direction))
+                connection.ack = seq
+        state.step()
+
+        body = encode_delta(state.events, state.cols)
+        self.deltas += 1
+        self.delta_bytes += len(body)
+        keyframe = None
+        if state.tick_count % self.keyframe_ticks == 0 or any(c.behind for c in self.connections):
+            keyframe = encode_keyframe(state)
+            self.keyframes += 1
+            self.keyframe_bytes += len(keyframe)
+        for connection in self.connections:
+            if connection.writer.transport.get_write_buffer_size() > MAX_BUFFERED:
+                connection.behind = True
+                self.skipped += 1
+                continue
+            if not connection.behind:
+                self.send(connection, DELTA, encode_header(DELTA, state.tick_count, connection.ack), body)
+            if keyframe is not None and (connection.behind or state.tick_count % self.keyframe_ticks == 0):
+                self.send(connection, KEYFRAME, encode_header(KEYFRAME, state.tick_count, connection.ack), keyframe)
+                connection.behind = False
+        self.tick_times.append((time.perf_counter() - started) * 1000)
+
+    def send(self, connection, kind, header, body):
+        connection.writer.write(frame(header + body))
+        self.sent[kind] += len(header) + len(body) + 4
+
+    async def serve_client(self, reader, writer):
+        if not self.seats:
+            writer.close()  # Every seat is taken
+            return
+        writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        connection = Connection(self.seats.popleft(), writer)
+        snake = self.state.snakes[connection.number]
+        snake.script = deque()  # The client steers this snake from now on, see ArenaState.scripted_direction
+        writer.write(frame(encode_welcome(connection.number, self.state, self.keyframe_ticks)))
+        self.connections.append(connection)  # The next tick sends the first keyframe
+        try:
+            while True:
+                payload = await read_message(reader)
+                self.received += len(payload) + 4
+                kind = payload[0]
+                if kind == INPUT:
+                    seq, direction = decode_input(payload)
+                    if direction < 4 and len(connection.inputs) < INPUT_QUEUE_SIZE:
+                        connection.inputs.append((seq, direction))
+                elif kind == PING:
+                    writer.write(frame(bytes([PONG]) + payload[1:]))
+                    self.sent[PONG] += len(payload) + 4
+                elif kind == RESYNC:
+                    connection.behind = True
+        except (asyncio.IncompleteReadError, ConnectionError, ProtocolError):
+            pass
+        finally:
+            self.connections.remove(connection)
+            snake.script = None  # Back to the AI
+            self.seats.append(connection.number)
+            writer.close()
+
+    def status(self, elapsed):
+        times = sorted(self.tick_times)
+        sent = sum(self.sent.values())
+        clients = len(self.connections)
+        line = (f"{clients} clients, tick {self.state.tick_count}: tick p50 {percentile(times, 50):.2f} ms, "
+                f"p99 {percentile(times, 99):.2f} ms; out {sent / elapsed / 1000:.1f} kB/s")
+        if self.deltas and self.keyframes:
+            line += (f"; delta {self.delta_bytes / self.deltas:.0f} B, keyframe {self.keyframe_bytes / self.keyframes:.0f} B "
+                     f"({self.keyframe_bytes / self.keyframes / max(1, self.delta_bytes / self.deltas):.0f}x)")
+        if self.skipped:
+            line += f"; {self.skipped} deltas held back"
+        return line
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+        for connection in self.connections:
+            connection.writer.close()
+
+
+# Simulated clients for the load test, all in one process and one event loop. The first
+# `mirrors` of them keep a full copy of the board; the others only read the message headers.
+async def simulate_clients(port, count, seconds, mirrors, seed):
+    rng = random.Random(seed)
+    clients = [NetClient(ArenaMirror() if i < mirrors else None) for i in range(count)]
+    for client in clients:
+        await client.connect("127.0.0.1", port)
+    tasks = [asyncio.create_task(client.receive()) for client in clients]
+    start = time.perf_counter()
+    local_ticks = 0
+    while time.perf_counter() - start < seconds:
+        await asyncio.sleep(0.05)
+        for client in clients:
+            if rng.random() < 0.1:  # About two turns per second per client
+                client.turn(rng.randrange(4))
+            client.ping()
+        # Local ticks of the mirrors, which move the predicted snakes
+        while clients[0].mirror is not None and local_ticks * clients[0].mirror.interval < (time.perf_counter() - start) * 1000:
+            local_ticks += 1
+            for client in clients[:mirrors]:
+                client.mirror.step()
+    for client in clients:
+        client.close()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    elapsed = time.perf_counter() - start
+
+    received = [sum(client.received.values()) / elapsed for client in clients]
+    rtts = sorted(rtt for client in clients for rtt in client.rtts)
+    latencies = sorted(latency for client in clients for latency in client.input_latencies)
+    watched = [client.mirror for client in clients[:mirrors]]
+    return {
+        "connected": sum(1 for client in clients if client.received[DELTA]),
+        "in": sum(received) / len(received),
+        "delta": sum(client.received[DELTA] for client in clients) / len(clients) / elapsed,
+        "keyframe": sum(client.received[KEYFRAME] for client in clients) / len(clients) / elapsed,
+        "rtt": (percentile(rtts, 50), percentile(rtts, 99)),
+        "input": (percentile(latencies, 50), percentile(latencies, 99)),
+        "predictions": sum(mirror.predictions for mirror in watched),
+        "mispredictions": sum(mirror.mispredictions for mirror in watched),
+        "desyncs": sum(mirror.desyncs for mirror in watched),
+        "checked": sum(mirror.checked for mirror in watched),
+    }
+
+
+def client_process(port, count, seconds, mirrors, seed, results):
+    results.put(asyncio.run(simulate_clients(port, count, seconds, mirrors, seed)))
+
+
+async def load_test(args):
+    server = ArenaServer(args.seed, players=args.load_test, bots=args.bots, keyframe_ticks=args.keyframe_ticks)
+    port = await server.start("127.0.0.1", 0)
+    # The clients run in another process, so decoding on their side does not slow the server down
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=client_process, args=(port, args.load_test, args.seconds,
+                                                                   args.mirrors, args.seed, results), daemon=True)
+    process.start()
+    loop = asyncio.get_running_loop()
+    game = asyncio.create_task(server.run())
+    result = await loop.run_in_executor(None, results.get)
+    game.cancel()
+    server.close()
+    process.join()
+
+    state = server.state
+    full = server.keyframe_bytes / max(1, server.keyframes)
+    delta = server.delta_bytes / max(1, server.deltas)
+    times = sorted(server.tick_times)
+    print(f"{args.load_test} clients ({result['connected']} received deltas), {state.count} snakes on {state.cols}x{state.rows}, "
+          f"{state.tick_count} ticks of {state.interval} ms")
+    print(f"Server tick: p50 {percentile(times, 50):.2f} ms, p99 {percentile(times, 99):.2f} ms, "
+          f"max {times[-1]:.2f} ms ({100 * percentile(times, 99) / state.interval:.1f}% of the tick at p99)")
+    print(f"Per tick: delta {delta:.0f} B, keyframe {full:.0f} B: full boards would be {full / delta:.0f}x the deltas")
+    print(f"Per client: {result['in'] / 1000:.2f} kB/s in (deltas {result['delta'] / 1000:.2f}, "
+          f"keyframes {result['keyframe'] / 1000:.2f}); {server.skipped} deltas held back from slow clients")
+    print(f"Round trip: p50 {result['rtt'][0]:.2f} ms, p99 {result['rtt'][1]:.2f} ms; "
+          f"turn to ack: p50 {result['input'][0]:.0f} ms, p99 {result['input'][1]:.0f} ms")
+    print(f"Mirrors: {result['mispredictions']} of {result['predictions']} predicted heads wrong, "
+          f"{result['desyncs']} of {result['checked']} keyframes disagreed with the deltas")
+    return 1 if result["desyncs"] else 0
+
+
+async def serve(args):
+    server = ArenaServer(args.seed, players=args.players, bots=args.bots, keyframe_ticks=args.keyframe_ticks)
+    port = await server.start(args.host, args.port)
+    print(f"Serving {args.players} seats and {args.bots} bots on {args.host}:{port}", flush=True)
+    try:
+        await server.run(report=True)
+    finally:
+        server.close()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Authoritative arena server for network play")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--players", type=int, default=16, help="seats for clients, played by the AI while free")
+    parser.add_argument("--bots", type=int, default=32, help="AI snakes besides the seats")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--keyframe-ticks", type=int, default=KEYFRAME_TICKS)
+    parser.add_argument("--load-test", type=int, default=0, metavar="CLIENTS",
+                        help="run a server and this many simulated clients on localhost, then report")
+    parser.add_argument("--seconds", type=float, default=20, help="length of the load test")
+    parser.add_argument("--mirrors", type=int, default=10, help="simulated clients that keep a full copy of the board")
+    args = parser.parse_args()
+    try:
+        return asyncio.run(load_test(args) if args.load_test else serve(args))
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
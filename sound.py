@@ -0,0 +1,88 @@
+import os
+
+from PySide6.QtCore import QTimer, QUrl
+
+# Sound effects, off the startup path and out of the game loop. Effects are
+# registered by name up front but nothing is loaded until preload() is called
+# (after the window's first frame), which loads one effect per turn of the
+# event loop; an effect played before that is loaded on the spot. Each effect
+# gets a small pool of voices, so a sound can overlap itself instead of
+# cutting off the last one. QtMultimedia itself is only imported when the
+# first effect loads, and a disabled manager never touches it at all.
+
+VOICES = 2  # Voices per effect unless registered otherwise
+
+
+class SoundManager:
+    def __init__(self, directory, enabled=True):
+        self.directory = directory
+        self.enabled = enabled  # False for headless or muted runs: nothing is ever loaded or played
+        self.muted = False  # Runtime mute, effects stay loaded
+        self.effects = {}  # name -> (file name, volume, voices)
+        self.pools = {}  # name -> list of QSoundEffect voices
+        self.next_voice = {}  # name -> voice to steal when all of them are busy
+        self.pending = []  # Names still to load in the background
+
+    def register(self, name, filename, volume=0.5, voices=VOICES):
+        self.effects[name] = (filename, volume, voices)
+
+    # Load every registered effect in the background, one per turn of the event loop
+    def preload(self):
+        if not self.enabled:
+            return
+        self.pending = [name for name in self.effects if name not in self.pools]
+        QTimer.singleShot(0, self.load_next)
+
+    def load_next(self):
+        while self.pending:
+            name = self.pending.pop(0)
+            if name not in self.pools:
+                self.load(name)
+                break
+        if self.pending and self.enabled:
+            QTimer.singleShot(0, self.load_next)
+
+    def load(self, name):
+        try:
+            from PySide6.QtMultimedia import QSoundEffect
+        except ImportError as e:
+            print(f"Sound disabled, QtMultimedia is not available: {e}")
+            self.enabled = False
+            return []
+        filename, volume, voices = self.effects[name]
+        url = QUrl.fromLocalFile(os.path.join(self.directory, filename))
+        pool = []
+        for _ in range(voices):
+            effect = QSoundEffect()
+            effect.setSource(url)  # Voices share the decoded sample through Qt's sample cache
+            effect.setVolume(volume)
+            pool.append(effect)
+        self.pools[name] = pool
+        self.next_voice[name] = 0
+        return pool
+
+    def play(self, name):
+        if not self.enabled or self.muted:
+            return
+        pool = self.pools.get(name)
+        if pool is None:
+            pool = self.load(name)
+            if not pool:
+                return
+        # First idle voice, or else the busy ones are cut off in turn
+        for voice in pool:
+            if not voice.isPlaying():
+                break
+        else:
+            index = self.next_voice[name]
+            voice = pool[index]
+            self.next_voice[name] = (index + 1) % len(pool)
+            voice.stop()
+        voice.play()
+
+    def set_muted(self, muted):
+        self.muted = muted
+        if muted:
+            for pool in self.pools.values():
+                for voice in pool:
+                    voice.stop()
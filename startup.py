@@ -0,0 +1,46 @@
+import os
+from time import perf_counter
+
+# Startup timing. main.py imports this module before anything else and marks
+# each step of startup as it finishes (imports, QApplication, UI, scene,
+# window shown, first painted frame); report() prints how long each one took.
+# Time spent before this module was imported (starting the interpreter) is
+# taken from the process start time where the OS reports it (Linux /proc,
+# 10 ms resolution) and shown as its own "interpreter" step.
+
+START = perf_counter()
+marks = []  # (label, perf_counter) in order
+
+
+# Seconds between the start of the process and now, or None if unknown
+def process_age():
+    try:
+        with open("/proc/self/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK")  # Field 22 of stat, counted from the state field
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+PROCESS_START = START - max(process_age() or 0, 0)
+
+
+def mark(label):
+    marks.append((label, perf_counter()))
+
+
+# Time from process start to the last mark, in ms
+def total():
+    return (marks[-1][1] - PROCESS_START) * 1000 if marks else 0
+
+
+def report():
+    print(f"{'step':<24}{'ms':>9}{'since start':>14}")
+    last = PROCESS_START
+    rows = [("interpreter", START)] if START > PROCESS_START else []
+    for label, at in rows + marks:
+        print(f"{label:<24}{(at - last) * 1000:>9.1f}{(at - PROCESS_START) * 1000:>14.1f}")
+        last = at
+    print(f"{'total':<24}{total():>9.1f}")
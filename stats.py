@@ -0,0 +1,13 @@
+# Small statistics helpers shared by the evaluation harness, the benchmarks,
+# the profiler and the load tests. No imports from the game, so anything can
+# use them without pulling in the engine.
+
+
+def percentile(sorted_values, p):
+    # Linear interpolation between closest ranks
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100
+    low = int(k)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (k - low)
@@ -0,0 +1,148 @@
+import hashlib
+import importlib.util
+import os
+import sys
+
+import PySide6
+from PySide6.QtCore import QObject
+from PySide6.QtWidgets import QMainWindow
+
+# Precompiled UI. Parsing main.ui with QUiLoader on every start costs time
+# (and pulls in QtUiTools), so the .ui file is compiled once with uic into a
+# Python module in CACHE_DIR, stamped with the hash of the .ui file it came
+# from, and imported from there on later starts. The module is regenerated
+# when the .ui file changes. The generated imports are cut down to the names
+# the form uses: PySide6 builds the enums of every class imported, and uic
+# imports dozens of classes a form never touches. Without uic or a writable
+# cache, the window is loaded with QUiLoader as before.
+#
+#   python uicache.py main.ui    compile ahead of time, e.g. before packaging
+
+CACHE_DIR = "ui_cache"
+STAMP = "# Source hash: "
+
+
+def ui_hash(ui_path):
+    with open(ui_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def cache_path(ui_path):
+    name = os.path.splitext(os.path.basename(ui_path))[0]
+    return os.path.join(os.path.dirname(os.path.abspath(ui_path)), CACHE_DIR, f"ui_{name}.py")
+
+
+def cached_hash(path):
+    try:
+        with open(path) as f:
+            line = f.readline()
+    except OSError:
+        return None
+    return line[len(STAMP):].strip() if line.startswith(STAMP) else None
+
+
+# Command line of uic generating Python, or None if it is not installed
+def uic_command():
+    import shutil
+
+    script = shutil.which("pyside6-uic")
+    if script:
+        return [script]
+    qt_dir = os.path.join(os.path.dirname(PySide6.__file__), "Qt", "libexec")
+    for path in (os.path.join(qt_dir, "uic"), os.path.join(os.path.dirname(PySide6.__file__), "uic.exe")):
+        if os.path.exists(path):
+            return [path, "-g", "python"]
+    return None
+
+
+# Drop the names a generated module imports but never uses
+def prune_imports(source):
+    import ast
+
+    tree = ast.parse(source)
+    used = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
+    lines = source.splitlines()
+    for node in reversed(tree.body):
+        if isinstance(node, ast.ImportFrom):
+            names = [alias.name for alias in node.names if alias.name in used]
+            lines[node.lineno - 1:node.end_lineno] = [f"from {node.module} import {', '.join(names)}"] if names else []
+    return "\n".join(lines) + "\n"
+
+
+# Compiling is rare (first start, or after main.ui changed), so its modules are only imported here
+def compile_ui(ui_path, path, source_hash):
+    import subprocess
+
+    command = uic_command()
+    if command is None:
+        print("uic not found, loading the UI with QUiLoader")
+        return False
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        result = subprocess.run(command + [ui_path], capture_output=True, text=True, check=True)
+        with open(path, "w") as f:
+            f.write(f"{STAMP}{source_hash}\n{prune_imports(result.stdout)}")
+    except (OSError, subprocess.CalledProcessError, SyntaxError) as e:
+        print(f"Could not compile {ui_path}: {e}")
+        return False
+    return True
+
+
+# The generated module for ui_path, compiled first if the cache is missing or stale; None if that fails
+def load_module(ui_path):
+    path = cache_path(ui_path)
+    source_hash = ui_hash(ui_path)
+    if cached_hash(path) != source_hash and not compile_ui(ui_path, path, source_hash):
+        return None
+    spec = importlib.util.spec_from_file_location(f"ui_cache_{os.path.basename(path)[:-3]}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# Looks widgets up by object name on a window loaded with QUiLoader, like the attributes of a generated form
+class FoundWidgets:
+    def __init__(self, window):
+        self.window = window
+
+    def __getattr__(self, name):
+        widget = self.window.findChild(QObject, name)
+        if widget is None:
+            raise AttributeError(name)
+        setattr(self, name, widget)
+        return widget
+
+
+# Create the window described by ui_path; returns it with an object holding its widgets as attributes
+def load_window(ui_path):
+    module = load_module(ui_path)
+    if module is not None:
+        window = QMainWindow()
+        form = module.Ui_MainWindow()
+        form.setupUi(window)
+        return window, form
+
+    from PySide6.QtCore import QFile, QIODevice
+    from PySide6.QtUiTools import QUiLoader
+    ui_file = QFile(ui_path)
+    if not ui_file.open(QIODevice.ReadOnly):
+        print(f"Cannot open {ui_path}: {ui_file.errorString()}")
+        sys.exit(-1)
+    loader = QUiLoader()
+    window = loader.load(ui_file)
+    ui_file.close()
+    if not window:
+        print(loader.errorString())
+        sys.exit(-1)
+    return window, FoundWidgets(window)
+
+
+if __name__ == "__main__":
+    for ui_path in sys.argv[1:] or ["main.ui"]:
+        path = cache_path(ui_path)
+        if cached_hash(path) == ui_hash(ui_path):
+            print(f"{path} is up to date")
+        elif compile_ui(ui_path, path, ui_hash(ui_path)):
+            print(f"Compiled {ui_path} to {path}")
+        else:
+            sys.exit(1)
@@ -0,0 +1,32 @@
+# Unsigned LEB128 varints, the integer encoding of both the replay files and
+# the network protocol. Each format catches VarintError and reports it as its
+# own error.
+
+
+class VarintError(ValueError):
+    pass
+
+
+def write_varint(out, value):
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+
+def read_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        if pos >= len(data):
+            raise VarintError("Truncated varint")
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
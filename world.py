@@ -0,0 +1,277 @@
+import argparse
+import random
+import sys
+import time
+from collections import OrderedDict
+
+from engine import BUCKET_SIZE, CELL_SIZE, DIRECTIONS, POLICIES, SCENE_RECT, GameState, Item, random_food_type
+from grid import SpatialHash
+from movers import Movers
+
+# Large scrolling world. Instead of one screen-sized board, the game is played
+# on a world of WORLD_CHUNKS x WORLD_CHUNKS chunks (of CHUNK_CELLS x CHUNK_CELLS
+# cells each) centered on the origin. The walls and food of a chunk are
+# generated from the game seed and the chunk's coordinates the first time the
+# chunk is needed, so nothing is stored for chunks that were never visited.
+# Generated chunks are kept in an LRU cache of at most `budget` chunks; an
+# evicted chunk is generated again, identically, when it is needed again,
+# minus the items already eaten (the only per-chunk state the world keeps
+# for good). Memory and per-tick cost depend on how many chunks are in use,
+# not on the size of the world.
+#
+#   python world.py --ticks 200000    headless run, for the streaming figures
+
+CHUNK_CELLS = 16
+CHUNK_SIZE = CHUNK_CELLS * CELL_SIZE  # Side of a chunk, in px
+WORLD_CHUNKS = 512  # Chunks per side of the world (8192 cells)
+CHUNK_BUDGET = 64  # Chunks kept generated at once
+WALLS_PER_CHUNK = 3  # Up to this many wall segments per chunk
+WALL_LENGTH = (3, 8)  # Shortest and longest wall segment, in cells
+FOOD_PER_CHUNK = 2
+SHIELD_CHANCE = 0.05  # Chance for a chunk to hold a shield
+CLEAR_CHUNKS = {(0, 0), (-1, 0), (0, -1), (-1, -1)}  # No walls around the starting point
+
+
+# x, y, width, height of a world of size x size chunks, in px
+def world_bounds(size=WORLD_CHUNKS):
+    half = size // 2 * CHUNK_SIZE
+    return -half, -half, size * CHUNK_SIZE, size * CHUNK_SIZE
+
+
+# Walls and items of one chunk, positioned in world pixels
+class Chunk:
+    def __init__(self, key):
+        self.key = key
+        self.blocked = bytearray(CHUNK_CELLS * CHUNK_CELLS)  # 1 for every cell covered by a wall
+        self.walls = []  # (x, y, width, height) of each wall segment
+        self.items = {}  # Cell index in the chunk -> (slot, Item) for the food and shields not eaten yet
+
+
+class World:
+    def __init__(self, seed, size=WORLD_CHUNKS, budget=CHUNK_BUDGET):
+        self.seed = seed
+        self.size = size
+        self.budget = budget
+        self.chunks = OrderedDict()  # (cx, cy) -> Chunk, least recently used first
+        self.eaten = set()  # (cx, cy, slot) of every item taken so far
+        self.dirty = set()  # Chunks whose items changed since the renderer last looked
+        self.generated = 0  # Chunks generated so far, counting the ones generated again after eviction
+        self.bounds = world_bounds(size)
+
+    def chunk(self, cx, cy):
+        key = (cx, cy)
+        chunk = self.chunks.get(key)
+        if chunk is not None:
+            self.chunks.move_to_end(key)
+            return chunk
+        chunk = self.chunks[key] = self.generate(cx, cy)
+        self.generated += 1
+        while len(self.chunks) > self.budget:
+            self.chunks.popitem(last=False)
+        return chunk
+
+    def generate(self, cx, cy):
+        chunk = Chunk((cx, cy))
+        rng = random.Random(f"{self.seed}/chunk/{cx}/{cy}")
+        left = cx * CHUNK_SIZE
+        top = cy * CHUNK_SIZE
+
+        # Straight wall segments of one cell width, kept inside the chunk
+        for _ in range(rng.randrange(WALLS_PER_CHUNK + 1)):
+            length = rng.randint(*WALL_LENGTH)
+            horizontal = rng.random() < 0.5
+            columns, rows = (length, 1) if horizontal else (1, length)
+            col = rng.randrange(CHUNK_CELLS - columns + 1)
+            row = rng.randrange(CHUNK_CELLS - rows + 1)
+            if (cx, cy) in CLEAR_CHUNKS:
+                continue  # Drawn anyway, so the other chunks do not depend on this one
+            chunk.walls.append((left + col * CELL_SIZE, top + row * CELL_SIZE, columns * CELL_SIZE, rows * CELL_SIZE))
+            for r in range(row, row + rows):
+                for c in range(col, col + columns):
+                    chunk.blocked[r * CHUNK_CELLS + c] = 1
+
+        # Food and maybe a shield on free cells; eaten ones still draw their cell, so the rest stay in place
+        kinds = [random_food_type(rng) for _ in range(FOOD_PER_CHUNK)]
+        if rng.random() < SHIELD_CHANCE:
+            kinds.append("shield")
+        for slot, kind in enumerate(kinds):
+            index = rng.randrange(CHUNK_CELLS * CHUNK_CELLS)
+            if chunk.blocked[index] or index in chunk.items or (cx, cy, slot) in self.eaten:
+                continue
+            row, col = divmod(index, CHUNK_CELLS)
+            chunk.items[index] = (slot, Item(kind, left + col * CELL_SIZE, top + row * CELL_SIZE))
+        return chunk
+
+    def in_bounds(self, x, y):
+        left, top, width, height = self.bounds
+        return left <= x and top <= y and x + CELL_SIZE <= left + width and y + CELL_SIZE <= top + height
+
+    # Chunk holding the cell at (x, y) and the index of that cell in it
+    def locate(self, x, y):
+        col = x // CELL_SIZE
+        row = y // CELL_SIZE
+        chunk = self.chunk(col // CHUNK_CELLS, row // CHUNK_CELLS)
+        return chunk, (row % CHUNK_CELLS) * CHUNK_CELLS + col % CHUNK_CELLS
+
+    def blocked_at(self, x, y):
+        chunk, index = self.locate(x, y)
+        return chunk.blocked[index] == 1
+
+    # Remove and return the food or shield on the cell at (x, y), or None
+    def take_item(self, x, y):
+        chunk, index = self.locate(x, y)
+        entry = chunk.items.pop(index, None)
+        if entry is None:
+            return None
+        self.eaten.add(chunk.key + (entry[0],))
+        self.dirty.add(chunk.key)
+        return entry[1]
+
+    # Keys of the chunks overlapping a rect (in px), clipped to the world
+    def chunks_in(self, x, y, width, height):
+        first = -(self.size // 2)
+        last = first + self.size - 1
+        for cy in range(max(first, int(y // CHUNK_SIZE)), min(last, int((y + height) // CHUNK_SIZE)) + 1):
+            for cx in range(max(first, int(x // CHUNK_SIZE)), min(last, int((x + width) // CHUNK_SIZE)) + 1):
+                yield cx, cy
+
+
+# Snake occupancy for the world: cube counts by cell, only for the cells the snake is on
+class SnakeCells:
+    def __init__(self):
+        self.counts = {}
+
+    def add_snake(self, x, y):
+        self.counts[(x, y)] = self.counts.get((x, y), 0) + 1
+
+    def remove_snake(self, x, y):
+        count = self.counts[(x, y)]
+        if count == 1:
+            del self.counts[(x, y)]
+        else:
+            self.counts[(x, y)] = count - 1
+
+    def snake_at(self, x, y):
+        return self.counts.get((x, y), 0)
+
+
+# GameState on a World: walls, food and shields come from the chunks, levels only change the speed
+class WorldState(GameState):
+    def __init__(self, seed=None, size=WORLD_CHUNKS, budget=CHUNK_BUDGET):
+        self.world_size = size
+        self.chunk_budget = budget
+        super().__init__(seed)
+
+    # The world replaces the board: the grid only tracks the snake, and nothing is filed or moved
+    def create_board(self):
+        self.world = World(self.seed, self.world_size, self.chunk_budget)
+        self.grid = SnakeCells()
+        self.items = SpatialHash(BUCKET_SIZE)
+        self.movers = Movers(self.grid, self.items, SCENE_RECT)
+        for x, y in self.body:
+            self.grid.add_snake(x, y)
+
+    # Food, shields and obstacles are part of the world, nothing is spawned while playing
+    def create_food(self):
+        pass
+
+    def spawn_shield_timer(self):
+        pass
+
+    def create_obstacle(self):
+        pass
+
+    def create_level_walls(self, level):
+        pass
+
+    def in_bounds(self, x, y):
+        return self.world.in_bounds(x, y)
+
+    def cell_blocked(self, x, y):
+        if not self.world.in_bounds(x, y) or self.world.blocked_at(x, y):
+            return True
+        return self.grid.snake_at(x, y) > ((x, y) == self.body[-1])
+
+    def snake_overlaps(self, x, y, width, height):
+        return any(self.grid.snake_at(x + dx, y + dy)
+                   for dy in range(0, height, CELL_SIZE) for dx in range(0, width, CELL_SIZE))
+
+    def check_collision(self):
+        hx, hy = self.body[0]
+        hit_wall = not self.world.in_bounds(hx, hy)
+        if not hit_wall:
+            # Check self-collision: the head shares its cell with another cube
+            if self.grid.snake_at(hx, hy) > 1:
+                self.game_over()
+                return
+            hit_wall = self.world.blocked_at(hx, hy)
+        if hit_wall:
+            if self.shields > 0 and not self.invincible:
+                self.lose_shield(3000)
+            elif not self.invincible:
+                self.game_over()
+            return
+
+        item = self.world.take_item(hx, hy)
+        if item is None:
+            return
+        if item.kind == "shield":
+            self.shields += 1
+            self.events.append(("shield_gained", self.shields))
+        else:
+            self.eat(item)
+
+
+# Steer toward the nearest food in the chunks around the head, never onto a cell that ends the game
+def explorer_policy(state, rng):
+    hx, hy = state.head
+    safe = [d for d in DIRECTIONS
+            if d != (-state.direction[0], -state.direction[1])
+            and not state.cell_blocked(hx + d[0] * CELL_SIZE, hy + d[1] * CELL_SIZE)]
+    if not safe:
+        return None
+    foods = [item for key in state.world.chunks_in(hx - CHUNK_SIZE, hy - CHUNK_SIZE, 2 * CHUNK_SIZE, 2 * CHUNK_SIZE)
+             for _, item in state.world.chunk(*key).items.values()]
+    if not foods:
+        return state.direction if state.direction in safe else rng.choice(safe)
+    target = min(foods, key=lambda item: abs(item.x - hx) + abs(item.y - hy))
+    return min(safe, key=lambda d: abs(hx + d[0] * CELL_SIZE - target.x) + abs(hy + d[1] * CELL_SIZE - target.y))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless runs on the large world, with chunk streaming figures")
+    parser.add_argument("--ticks", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[16, 512, 65536], help="world sizes to compare, in chunks per side")
+    parser.add_argument("--budget", type=int, default=CHUNK_BUDGET, help="chunks kept generated at once")
+    parser.add_argument("--policy", choices=sorted(POLICIES) + ["explorer"], default="explorer")
+    args = parser.parse_args()
+
+    policy = explorer_policy if args.policy == "explorer" else POLICIES[args.policy]
+    print(f"{'world':>12}{'ticks/s':>11}{'games':>7}{'best':>6}{'generated':>11}{'resident':>10}{'eaten':>8}")
+    for size in args.sizes:
+        state = WorldState(args.seed, size, args.budget)
+        rng = random.Random(args.seed)
+        games = best = generated = eaten = 0
+        start = time.perf_counter()
+        for _ in range(args.ticks):
+            direction = policy(state, rng)
+            if direction is not None:
+                state.change_direction(direction)
+            state.step()
+            if state.over:
+                games += 1
+                best = max(best, state.score)
+                generated += state.world.generated
+                eaten += len(state.world.eaten)
+                state.reset()
+        elapsed = time.perf_counter() - start
+        generated += state.world.generated
+        eaten += len(state.world.eaten)
+        print(f"{size:>10}^2{args.ticks / elapsed:>11,.0f}{games:>7}{best:>6}{generated:>11}"
+              f"{len(state.world.chunks):>10}{eaten:>8}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
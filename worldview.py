@@ -0,0 +1,95 @@
+from collections import OrderedDict
+
+from PySide6.QtCore import QRect, QRectF, Qt
+from PySide6.QtGui import QColor, QPen
+from PySide6.QtWidgets import QGraphicsItem
+
+from engine import CELL_SIZE
+from world import CHUNK_SIZE
+
+# Rendering side of the large world. Only the chunks that overlap the
+# viewport (plus a margin of MARGIN px, so chunks are in place before they
+# scroll into view) are in the scene, each drawn by one ChunkItem. Chunks
+# that leave that area are taken out of the scene but kept, with their cached
+# pixmap, in an LRU cache of CACHE_BUDGET items, so turning back is cheap;
+# beyond the budget the least recently used ones are dropped. The scene
+# therefore holds a fixed handful of items however large the world is.
+
+MARGIN = CHUNK_SIZE // 2
+CACHE_BUDGET = 32  # Chunk items kept out of the scene
+
+
+# Walls and items of one chunk, drawn in one paint() call from a cached pixmap
+class ChunkItem(QGraphicsItem):
+    def __init__(self, chunk, brush):
+        super().__init__()
+        self.setCacheMode(QGraphicsItem.DeviceCoordinateCache)
+        self.brush = brush  # Function giving the brush of a palette role
+        cx, cy = chunk.key
+        self.bounds = QRectF(cx * CHUNK_SIZE - 1, cy * CHUNK_SIZE - 1, CHUNK_SIZE + 2, CHUNK_SIZE + 2)
+        self.pen = QPen(QColor("black"))
+        self.refresh(chunk)
+
+    def boundingRect(self):
+        return self.bounds
+
+    # Take the chunk's walls and items again, after the snake ate one of them
+    def refresh(self, chunk):
+        self.walls = [QRect(*wall) for wall in chunk.walls]
+        self.items = [(item.kind, QRect(item.x, item.y, CELL_SIZE, CELL_SIZE)) for _, item in chunk.items.values()]
+        self.update()
+
+    def paint(self, painter, option, widget=None):
+        if self.walls:
+            painter.setPen(Qt.NoPen)
+            painter.setBrush(self.brush("wall"))
+            painter.drawRects(self.walls)
+        painter.setPen(self.pen)
+        for kind, rect in self.items:
+            painter.setBrush(self.brush(kind))
+            painter.drawRect(rect)
+
+
+class ChunkStreamer:
+    def __init__(self, scene, brush):
+        self.scene = scene
+        self.brush = brush
+        self.shown = {}  # (cx, cy) -> ChunkItem in the scene
+        self.cache = OrderedDict()  # (cx, cy) -> ChunkItem out of the scene, least recently used first
+        self.built = 0  # Chunk items created so far
+
+    # Bring the chunks around `rect` (the visible part of the scene) into the scene and take the others out
+    def update(self, world, rect):
+        wanted = set(world.chunks_in(rect.x() - MARGIN, rect.y() - MARGIN,
+                                     rect.width() + 2 * MARGIN, rect.height() + 2 * MARGIN))
+        for key in [key for key in self.shown if key not in wanted]:
+            item = self.shown.pop(key)
+            self.scene.removeItem(item)
+            self.cache[key] = item
+        while len(self.cache) > CACHE_BUDGET:
+            self.cache.popitem(last=False)
+        for key in wanted:
+            if key in self.shown:
+                continue
+            item = self.cache.pop(key, None)
+            if item is None:
+                item = ChunkItem(world.chunk(*key), self.brush)
+                self.built += 1
+            self.scene.addItem(item)
+            self.shown[key] = item
+
+    # Redraw the chunks whose items changed; cached copies of them are dropped instead
+    def refresh(self, world):
+        for key in world.dirty:
+            if key in self.shown:
+                self.shown[key].refresh(world.chunk(*key))
+            else:
+                self.cache.pop(key, None)
+        world.dirty.clear()
+
+    # Take every chunk out of the scene and forget them, for a new world
+    def clear(self):
+        for item in self.shown.values():
+            self.scene.removeItem(item)
+        self.shown.clear()
+        self.cache.clear()